@@ -0,0 +1,279 @@
+"""
+Сквозной бенчмарк функций анализа на локальном стенде бирж.
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_e2e --iterations 20 --latency 0.05
+
+Отчет содержит p50/p95/p99 по каждому этапу конвейера, по времени до
+первого готового графика (first_chart) и по всему анализу целиком.
+Результаты сохраняются в Output/benchmarks/ и сравниваются с предыдущим
+прогоном того же сценария. --extra-venues N добавляет N тестовых бирж
+(Benchmarks/stand_in_venues.py), чтобы проверить, что время анализа
+не растет линейно с числом бирж. Кеш свечей по умолчанию отключен,
+--candle-cache-ttl включает его.
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from Benchmarks import bench_utils
+from Benchmarks.fixtures import fixture_time_span, load_fixtures
+from Benchmarks.mock_exchange import (
+    MockExchangeConfig,
+    MockExchangeServer,
+    patched_exchange_urls,
+    reset_instrument_catalogs,
+)
+from Benchmarks.stand_in_venues import stand_in_venues
+
+
+class StageRecorder:
+    """ Собирает длительности этапов конвейера """
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.durations[stage].append(seconds)
+
+    def summary(self):
+        return {stage: bench_utils.summarize(values)
+                for stage, values in self.durations.items()}
+
+
+@contextmanager
+def timed_attribute(recorder, module, name, stage):
+    """ Подменяет функцию модуля оберткой, замеряющей время ее работы """
+    original = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            recorder.add(stage, time.perf_counter() - started)
+
+    setattr(module, name, wrapper)
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+@contextmanager
+def candle_cache_ttl(seconds):
+    """ Задает время жизни кеша свечей на время прогона (0 - без кеша) """
+    import Scripts.candle_cache as candle_cache
+
+    saved = candle_cache.TTL_SECONDS, candle_cache.HISTORY_TTL_SECONDS
+    candle_cache.TTL_SECONDS = candle_cache.HISTORY_TTL_SECONDS = seconds
+    candle_cache.clear()
+    try:
+        yield
+    finally:
+        candle_cache.TTL_SECONDS, candle_cache.HISTORY_TTL_SECONDS = saved
+        candle_cache.clear()
+
+
+def instrument_pipeline(recorder, stack):
+    """ Оборачивает этапы конвейера анализа замерами времени """
+    import Scripts.user_func as user_func
+    import Scripts.utils_for_api_bybit as bybit
+    import Scripts.utils_for_api_okx as okx
+    import Scripts.utils_for_api_binance as binance
+    import Scripts.candle_analysis as analysis
+    import Scripts.create_graphs as graphs
+    from Scripts.exchanges import get_adapter, get_adapters
+
+    stages = [
+        (bybit, "get_available_trading_pairs", "bootstrap.bybit"),
+        (okx, "get_available_trading_pairs", "bootstrap.okx"),
+        (binance, "get_available_trading_pairs", "bootstrap.binance"),
+    ]
+    # Запрос свечей и нормализация замеряются для каждой биржи реестра
+    for adapter in get_adapters():
+        stages.append((adapter, "fetch_candles", f"fetch.{adapter.name}"))
+    stages += [
+        (user_func, "candles_to_df", "convert.candles_to_df"),
+        (type(get_adapter("okx")), "normalize", "convert.normalize.okx"),
+        (analysis, "calculate_indicator_set", "indicators.kernel"),
+        (analysis, "calculate_volume_profile", "indicators.volume_profile"),
+        (graphs, "create_volume_plot", "render.volume_plot"),
+        (graphs, "create_obv_plot", "render.obv_plot"),
+        (graphs, "create_plot_vwap", "render.vwap_plot"),
+        (graphs, "create_volume_pie_chart", "render.volume_pie"),
+        (graphs, "create_plot_volume_profiles", "render.volume_profile"),
+    ]
+    for module, name, stage in stages:
+        stack.enter_context(timed_attribute(recorder, module, name, stage))
+
+
+def build_scenario(args, fixtures, recorder):
+    """ Возвращает функцию, выполняющую один анализ выбранного сценария """
+    import Scripts.user_func as user_func
+
+    def analyse(fetch):
+        # Время до первого готового графика и до всех графиков, как в боте
+        started = time.perf_counter()
+        futures = list(user_func.render_analysis_charts(
+            fetch(), args.trade_type).values())
+        wait(futures, return_when=FIRST_COMPLETED)
+        recorder.add("first_chart", time.perf_counter() - started)
+        return [future.result()[0] for future in futures]
+
+    if args.mode == "candles":
+        def run():
+            return analyse(lambda: user_func.fetch_candles_numbers_candles(
+                args.pair, args.trade_type, args.timeframe, str(args.candles)))
+        return run
+
+    # Диапазон берется из времени фикстур, чтобы стенд вернул данные
+    first_ms, last_ms = fixture_time_span(fixtures)
+    step_ms = int(args.timeframe) * 60 * 1000
+    end_ms = last_ms - (last_ms % step_ms)
+    start_ms = max(first_ms, end_ms - (args.candles - 1) * step_ms)
+    start = datetime.fromtimestamp(start_ms / 1000).strftime("%d.%m.%Y %H:%M")
+    end = datetime.fromtimestamp(end_ms / 1000).strftime("%d.%m.%Y %H:%M")
+
+    def run():
+        return analyse(lambda: user_func.fetch_candles_start_end(
+            args.pair, args.trade_type, args.timeframe, start, end))
+    return run
+
+
+def run_benchmark(args):
+    fixtures = load_fixtures()
+    config = MockExchangeConfig(latency=args.latency, jitter=args.jitter,
+                                failure_rate=args.failure_rate, seed=args.seed)
+    server = MockExchangeServer(fixtures, config)
+    base_url = server.start()
+
+    recorder = StageRecorder()
+    failures = 0
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(patched_exchange_urls(base_url))
+            stack.enter_context(stand_in_venues(args.extra_venues, base_url))
+            stack.enter_context(bench_utils.scratch_workdir())
+            # По умолчанию каждая итерация запрашивает свечи у стенда
+            stack.enter_context(candle_cache_ttl(args.candle_cache_ttl))
+            reset_instrument_catalogs()
+            instrument_pipeline(recorder, stack)
+            run = build_scenario(args, fixtures, recorder)
+
+            # Прогревочные итерации не попадают в статистику
+            for _ in range(args.warmup):
+                try:
+                    run()
+                except Exception as e:
+                    print(f"[bench] Ошибка на прогреве: {e}")
+            recorder.durations.clear()
+
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                if args.cold:
+                    reset_instrument_catalogs()
+                iteration_started = time.perf_counter()
+                try:
+                    run()
+                except Exception as e:
+                    failures += 1
+                    recorder.add("failed", time.perf_counter() - iteration_started)
+                    print(f"[bench] Ошибка анализа: {e}")
+                    continue
+                recorder.add("end_to_end", time.perf_counter() - iteration_started)
+            wall = time.perf_counter() - started
+    finally:
+        server.stop()
+        reset_instrument_catalogs()
+
+    return {
+        "scenario": {
+            "mode": args.mode, "pair": args.pair, "trade_type": args.trade_type,
+            "timeframe": args.timeframe, "candles": args.candles,
+            "cold": args.cold, "extra_venues": args.extra_venues,
+            "candle_cache_ttl": args.candle_cache_ttl,
+        },
+        "stand": {
+            "latency": args.latency, "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "requests": server.request_counts,
+        },
+        "iterations": args.iterations,
+        "failures": failures,
+        "wall_seconds": wall,
+        "throughput_per_second": args.iterations / wall if wall else None,
+        "stages": recorder.summary(),
+    }
+
+
+def scenario_kind(args):
+    """ Имя сценария для хранения результатов и сравнения прогонов """
+    trade = args.trade_type.replace(" ", "_").lower()
+    kind = f"e2e-{args.mode}-{trade}-{args.timeframe}-{args.candles}"
+    if args.extra_venues:
+        kind += f"-venues{3 + args.extra_venues}"
+    if args.candle_cache_ttl:
+        kind += "-cached"
+    return kind
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сквозной бенчмарк анализа на локальном стенде бирж")
+    parser.add_argument("--mode", choices=("candles", "range"),
+                        default="candles",
+                        help="последние N свечей или диапазон времени")
+    parser.add_argument("--pair", default="BTC/USDT")
+    parser.add_argument("--trade-type", default="SPOT",
+                        choices=("SPOT", "FUTURES", "PERPETUAL FUTURES"))
+    parser.add_argument("--timeframe", default="15",
+                        choices=("1", "3", "5", "15", "30", "60"))
+    parser.add_argument("--candles", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--cold", action="store_true",
+                        help="сбрасывать каталоги инструментов перед каждым прогоном")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--extra-venues", type=int, default=0,
+                        help="количество дополнительных тестовых бирж "
+                             "(только SPOT)")
+    parser.add_argument("--candle-cache-ttl", type=float, default=0.0,
+                        help="время жизни кеша свечей, с (0 - без кеша)")
+    parser.add_argument("--no-save", action="store_true",
+                        help="не сохранять результаты прогона")
+    args = parser.parse_args()
+
+    if args.trade_type == "FUTURES" and "-" not in args.pair:
+        args.pair += "-26SEP25"
+
+    results = run_benchmark(args)
+    kind = scenario_kind(args)
+
+    baseline_path = bench_utils.find_latest_results(kind)
+    baseline = bench_utils.load_results(baseline_path) if baseline_path else None
+
+    print(f"Сценарий: {kind}; итераций: {results['iterations']}, "
+          f"ошибок: {results['failures']}, "
+          f"пропускная способность: {results['throughput_per_second']:.2f} анализ/с")
+    bench_utils.print_stage_table(
+        results["stages"], baseline["stages"] if baseline else None)
+    if baseline:
+        print(f"Сравнение с {baseline_path}")
+
+    if not args.no_save:
+        path = bench_utils.save_results(kind, results)
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Микробенчмарки индикаторов candle_analysis и графиков create_graphs.
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_indicators
+    python -m Benchmarks.bench_indicators --sizes 100,1000 --only indicators
+    python -m Benchmarks.bench_indicators --compare latest
+
+Для каждой функции и размера данных замеряются время работы и пиковое
+выделение памяти (tracemalloc). Режим --compare сравнивает прогон с
+сохраненным базовым результатом.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from Benchmarks import bench_utils
+from Benchmarks.synthetic import make_exchange_frames
+
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+# Длинные ряды прореживаются перед рендером (Scripts/downsample.py), поэтому
+# время графиков почти не растет с размером; --max-chart-size ограничивает
+# размеры для графиков, если замерять их не нужно
+DEFAULT_MAX_CHART_SIZE = 1_000_000
+
+
+def build_cases():
+    """ Описывает замеряемые функции: (имя, группа, подготовка, вызов) """
+    import Scripts.candle_analysis as analysis
+    import Scripts.create_graphs as graphs
+    import Scripts.lead_lag as lead_lag
+    from Scripts.user_func import aligned_frame
+
+    def raw(frames):
+        return {name: df.copy() for name, df in frames.items()}
+
+    def with_indicators(frames):
+        return {name: analysis.calculate_vwap(analysis.calculate_obv(df))
+                for name, df in raw(frames).items()}
+
+    def profiles(frames):
+        return {name: analysis.calculate_volume_profile(df)
+                for name, df in with_indicators(frames).items()}
+
+    return [
+        ("calculate_obv", "indicators", raw,
+         lambda f: [analysis.calculate_obv(df) for df in f.values()]),
+        ("calculate_vwap", "indicators", raw,
+         lambda f: [analysis.calculate_vwap(df) for df in f.values()]),
+        ("indicator_kernel", "indicators", raw,
+         lambda f: [analysis.calculate_indicator_set(df) for df in f.values()]),
+        ("indicator_kernel_all", "indicators", raw,
+         lambda f: [analysis.calculate_indicator_set(df, tuple(analysis.INDICATORS))
+                    for df in f.values()]),
+        ("calculate_volume_profile", "indicators", raw,
+         lambda f: [analysis.calculate_volume_profile(df) for df in f.values()]),
+        ("lead_lag", "indicators", raw,
+         lambda f: lead_lag.analyse(aligned_frame(f, ("close", "volume")))),
+        ("create_volume_plot", "charts", raw, graphs.create_volume_plot),
+        ("create_obv_plot", "charts", with_indicators, graphs.create_obv_plot),
+        ("create_plot_vwap", "charts", with_indicators, graphs.create_plot_vwap),
+        ("create_volume_pie_chart", "charts", raw,
+         graphs.create_volume_pie_chart),
+        ("create_plot_volume_profiles", "charts", profiles,
+         graphs.create_plot_volume_profiles),
+    ]
+
+
+def measure(prepare, call, frames, repeat, budget):
+    """ Замеряет время (по отдельным прогонам) и пиковую память вызова """
+    timings = []
+    spent = 0.0
+    for _ in range(repeat):
+        data = prepare(frames)
+        gc.collect()
+        started = time.perf_counter()
+        call(data)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+
+    # Память замеряется отдельным прогоном: tracemalloc замедляет код
+    data = prepare(frames)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stats = bench_utils.summarize(timings)
+    stats["best"] = min(timings)
+    stats["peak_bytes"] = peak
+    return stats
+
+
+def run_suite(sizes, groups, functions, repeat, budget, max_chart_size, seed):
+    cases = [case for case in build_cases()
+             if case[1] in groups and (not functions or case[0] in functions)]
+    results = {}
+    for size in sizes:
+        frames = make_exchange_frames(size, seed=seed)
+        for name, group, prepare, call in cases:
+            if group == "charts" and size > max_chart_size:
+                continue
+            stats = measure(prepare, call, frames, repeat, budget)
+            results[f"{name}@{size}"] = {"function": name, "size": size, **stats}
+            print(f"{name:<30}{size:>10}"
+                  f"{stats['p50'] * 1000:>12.2f} мс"
+                  f"{stats['peak_bytes'] / 2**20:>12.2f} МБ", flush=True)
+    return results
+
+
+def print_comparison(results, baseline):
+    """ Печатает сравнение времени и памяти с базовым прогоном """
+    header = (f"{'функция@размер':<42}{'p50, мс':>12}{'база, мс':>12}"
+              f"{'Δ время':>10}{'пик, МБ':>10}{'Δ память':>10}")
+    print(header)
+    print("-" * len(header))
+    for key, stats in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<42}{stats['p50'] * 1000:>12.2f}{'—':>12}")
+            continue
+        print(f"{key:<42}{stats['p50'] * 1000:>12.2f}{base['p50'] * 1000:>12.2f}"
+              f"{bench_utils.format_delta(stats['p50'], base['p50']):>10}"
+              f"{stats['peak_bytes'] / 2**20:>10.2f}"
+              f"{bench_utils.format_delta(stats['peak_bytes'], base['peak_bytes']):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Микробенчмарки индикаторов и графиков")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="размеры данных через запятую")
+    parser.add_argument("--only", choices=("indicators", "charts"),
+                        help="замерять только одну группу функций")
+    parser.add_argument("--functions", default="",
+                        help="имена функций через запятую")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=10.0,
+                        help="максимум секунд на повторы одного замера")
+    parser.add_argument("--max-chart-size", type=int,
+                        default=DEFAULT_MAX_CHART_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="PATH|latest",
+                        help="сравнить с сохраненным базовым прогоном")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    groups = (args.only,) if args.only else ("indicators", "charts")
+    functions = {f.strip() for f in args.functions.split(",") if f.strip()}
+
+    baseline = None
+    if args.compare:
+        path = bench_utils.find_latest_results("micro") \
+            if args.compare == "latest" else args.compare
+        if path is None:
+            print("Базовый прогон не найден, сравнение пропущено")
+        else:
+            baseline = bench_utils.load_results(path)
+            print(f"Базовый прогон: {path}")
+
+    with bench_utils.scratch_workdir():
+        results = run_suite(sizes, groups, functions, args.repeat,
+                            args.budget, args.max_chart_size, args.seed)
+
+    if baseline is not None:
+        print_comparison(results, baseline["results"])
+
+    if not args.no_save:
+        path = bench_utils.save_results("micro", {
+            "sizes": sizes, "repeat": args.repeat, "seed": args.seed,
+            "results": results,
+        })
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+"""
+Нагрузочный тест бота: N одновременных пользователей Telegram.
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_load --users 1,5,10,25
+    python -m Benchmarks.bench_load --users 10,50,100 --mode command \
+        --concurrent-updates 64 --latency 0.05
+
+Настоящее приложение бота (main.build_application) со всеми обработчиками
+опрашивает локальный фейковый сервер Bot API (FakeTelegramServer), биржи
+отвечают со стенда Benchmarks/mock_exchange.py. Каждый пользователь
+проходит диалог /start до конца (--mode dialog) или отправляет однострочную
+команду /vol (--mode command) и ждет сообщения "Анализ завершен".
+
+Сервер Bot API и пользователи работают в отдельном потоке со своим циклом
+событий, поэтому задержка цикла событий (event loop lag) замеряется
+только для цикла бота. Уровни нагрузки (--users) прогоняются по очереди;
+для каждого печатаются пропускная способность, задержки обработчиков,
+задержка цикла событий и память процесса (RSS, только Linux). Точка
+насыщения - уровень, после которого пропускная способность растет меньше
+чем на SATURATION_GAIN.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from aiohttp import web
+
+from Benchmarks import bench_utils
+from Benchmarks.bench_e2e import StageRecorder, candle_cache_ttl
+from Benchmarks.fixtures import load_fixtures
+from Benchmarks.mock_exchange import (
+    MockExchangeConfig,
+    MockExchangeServer,
+    patched_exchange_urls,
+    reset_instrument_catalogs,
+)
+from Benchmarks.stand_in_venues import stand_in_venues
+from Scripts.memory import cache_sizes, rss_bytes
+
+
+# Токен бота для фейкового сервера
+BOT_TOKEN = "123456:LOAD-TEST"
+# Пользователь-бот в ответах getMe и сообщениях
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load",
+            "username": "load_test_bot"}
+# Прирост пропускной способности между уровнями, ниже которого
+# нагрузка считается насыщающей
+SATURATION_GAIN = 0.1
+# Период замера задержки цикла событий, с
+LAG_INTERVAL = 0.01
+# Период замера памяти, с
+MEMORY_INTERVAL = 0.5
+
+
+class FakeTelegramServer:
+    """
+        Локальный сервер Bot API в фоновом потоке: отдает боту обновления
+        пользователей через getUpdates и складывает его ответы во входящие
+        пользователей
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host, self.port = host, port
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.runner = None
+        self.url = None
+        self.updates = []
+        self.update_id = 0
+        self.message_id = 0
+        self.file_id = 0
+        self.new_update = asyncio.Event()
+        # chat_id -> очередь ответов бота (метод, параметры, время)
+        self.inbox = defaultdict(asyncio.Queue)
+        self.method_counts = Counter()
+        self.uploads = 0
+        self.methods = {
+            "getMe": self.get_me,
+            "getUpdates": self.get_updates,
+            "sendMessage": self.send_message,
+            "editMessageText": self.edit_message_text,
+            "sendPhoto": self.send_photo,
+            "sendMediaGroup": self.send_media_group,
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name="fake-telegram", daemon=True)
+        self.thread.start()
+        self.submit(self.serve()).result()
+        return self.url
+
+    def stop(self):
+        self.submit(self.runner.cleanup()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def submit(self, coroutine):
+        """ Запускает корутину в цикле событий сервера """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def serve(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.method_counts[method] += 1
+        params = {}
+        if request.body_exists:
+            for name, value in (await request.post()).items():
+                if isinstance(value, web.FileField):
+                    # Загрузка файла (фото графика)
+                    self.uploads += 1
+                    continue
+                # Bot API принимает значения параметров в JSON, строки - как есть
+                try:
+                    params[name] = json.loads(value)
+                except ValueError:
+                    params[name] = value
+        handler = self.methods.get(method)
+        # Остальные методы (answerCallbackQuery, deleteWebhook, ...) - успех
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    def message(self, chat_id, message_id=None, **fields):
+        """ Объект Message Bot API """
+        if message_id is None:
+            self.message_id += 1
+            message_id = self.message_id
+        return {"message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER, **fields}
+
+    def photo(self):
+        """ Объект PhotoSize с новым file_id """
+        self.file_id += 1
+        return [{"file_id": f"photo-{self.file_id}",
+                 "file_unique_id": f"u{self.file_id}",
+                 "width": 1400, "height": 800}]
+
+    def deliver(self, method, params, message):
+        """ Кладет ответ бота во входящие чата; возвращает сообщение """
+        self.inbox[message["chat"]["id"]].put_nowait(
+            (method, params, message["message_id"], time.perf_counter()))
+        return message
+
+    async def get_me(self, params):
+        return BOT_USER
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset", 0))
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(),
+                                       float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+    async def send_message(self, params):
+        return self.deliver("sendMessage", params, self.message(
+            int(params["chat_id"]), text=params["text"]))
+
+    async def edit_message_text(self, params):
+        if "inline_message_id" in params:
+            return True
+        return self.deliver("editMessageText", params, self.message(
+            int(params["chat_id"]), int(params["message_id"]),
+            text=params["text"]))
+
+    async def send_photo(self, params):
+        return self.deliver("sendPhoto", params, self.message(
+            int(params["chat_id"]), photo=self.photo()))
+
+    async def send_media_group(self, params):
+        messages = [self.message(int(params["chat_id"]), photo=self.photo())
+                    for _ in params["media"]]
+        self.deliver("sendMediaGroup", params, messages[0])
+        return messages
+
+    def push(self, kind: str, payload: dict):
+        """ Добавляет обновление для бота; возвращает время отправки """
+        self.update_id += 1
+        self.updates.append({"update_id": self.update_id, kind: payload})
+        self.new_update.set()
+        return time.perf_counter()
+
+
+class SimulatedUser:
+    """ Пользователь, проходящий анализ через фейковый сервер Bot API """
+
+    def __init__(self, server: FakeTelegramServer, user_id: int, args,
+                 recorder: StageRecorder, rng: random.Random):
+        self.server = server
+        self.user = {"id": user_id, "is_bot": False,
+                     "first_name": f"User{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+        self.args = args
+        self.recorder = recorder
+        self.rng = rng
+        self.message_id = 0
+        # Время до первого графика текущего анализа
+        self.first_chart = None
+
+    async def think(self):
+        if self.args.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    def say(self, text: str):
+        self.message_id += 1
+        message = {"message_id": self.message_id, "date": int(time.time()),
+                   "chat": self.chat, "from": self.user, "text": text}
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0,
+                                    "length": len(command)}]
+        return self.server.push("message", message)
+
+    def press(self, data: str, message_id: int):
+        self.message_id += 1
+        return self.server.push("callback_query", {
+            "id": f"{self.user['id']}-{self.message_id}", "from": self.user,
+            "chat_instance": str(self.user["id"]), "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()),
+                        "chat": self.chat, "from": BOT_USER, "text": "..."}})
+
+    async def expect(self, prefix: str, sent: float, stage: str):
+        """
+            Ждет ответа бота, текст которого начинается с prefix, и
+            записывает время от отправки обновления. Возвращает message_id
+        """
+        inbox = self.server.inbox[self.user["id"]]
+        deadline = time.perf_counter() + self.args.step_timeout
+        while True:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                raise TimeoutError(f"нет ответа на шаге {stage}")
+            method, params, message_id, received = await asyncio.wait_for(
+                inbox.get(), timeout)
+            text = params.get("text", "")
+            if text.startswith("❌"):
+                raise RuntimeError(f"{stage}: {text}")
+            if method in ("sendPhoto", "sendMediaGroup"):
+                if stage == "analysis" and self.first_chart is None:
+                    self.first_chart = received - sent
+                continue
+            if text.startswith(prefix):
+                self.recorder.add(stage, received - sent)
+                return message_id
+
+    async def analysis(self):
+        """ Один анализ: диалог /start или команда /vol """
+        args = self.args
+        self.first_chart = None
+        if args.mode == "dialog":
+            sent = self.say("/start")
+            message_id = await self.expect("Выберите тип анализа", sent,
+                                           "handler.start")
+            await self.think()
+            for data, prefix, stage in (
+                    ("last_candles", "Выберите тип контракта", "handler.analysis_type"),
+                    ("SPOT", "Введите торговую пару", "handler.trade_type")):
+                sent = self.press(data, message_id)
+                await self.expect(prefix, sent, stage)
+                await self.think()
+            sent = self.say(args.pair)
+            message_id = await self.expect("Выберите таймфрейм", sent,
+                                           "handler.trade_pair")
+            await self.think()
+            sent = self.press(args.timeframe, message_id)
+            await self.expect("Введите количество свечей", sent, "handler.timeframe")
+            await self.think()
+            sent = self.say(str(args.candles))
+        else:
+            sent = self.say(f"/vol {args.pair} spot {args.timeframe} {args.candles}")
+        await self.expect("⏳", sent, "handler.analysis_started")
+        await self.expect("✅", sent, "analysis")
+        if self.first_chart is not None:
+            self.recorder.add("first_chart", self.first_chart)
+
+    async def run(self, rounds: int):
+        """ Выполняет rounds анализов; возвращает (успешных, ошибок) """
+        done = failed = 0
+        for _ in range(rounds):
+            try:
+                await self.analysis()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"[load] Пользователь {self.user['id']}: {e}")
+                # Незавершенный диалог сбрасывается перед следующим анализом
+                self.say("/cancel")
+            await self.think()
+        return done, failed
+
+
+async def monitor_loop(stop: asyncio.Event, lags: list, memory: list):
+    """ Замеряет задержку цикла событий бота и память процесса """
+    next_memory = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        now = time.perf_counter()
+        lags.append(max(0.0, now - started - LAG_INTERVAL))
+        if now >= next_memory:
+            rss = rss_bytes()
+            if rss is not None:
+                memory.append(rss)
+            next_memory = now + MEMORY_INTERVAL
+
+
+async def run_level(server, users: int, level: int, args):
+    """ Прогон одного уровня нагрузки: users пользователей одновременно """
+    recorder = StageRecorder()
+    rng = random.Random(args.seed + level)
+    # У каждого уровня свои пользователи, чтобы диалоги начинались заново
+    simulated = [SimulatedUser(server, (level + 1) * 1_000_000 + index, args,
+                               recorder, rng)
+                 for index in range(users)]
+    lags, memory = [], []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop(stop, lags, memory))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        asyncio.wrap_future(server.submit(user.run(args.rounds)))
+        for user in simulated))
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    done = sum(result[0] for result in results)
+    return {
+        "users": users,
+        "analyses": done,
+        "failures": sum(result[1] for result in results),
+        "wall_seconds": wall,
+        "throughput_per_second": done / wall if wall else None,
+        "stages": recorder.summary(),
+        "loop_lag": bench_utils.summarize(lags),
+        "rss_peak_bytes": max(memory) if memory else None,
+        "rss_end_bytes": memory[-1] if memory else None,
+    }
+
+
+def find_saturation(levels):
+    """
+        Уровень, после которого пропускная способность перестает расти
+        (прирост меньше SATURATION_GAIN), или None
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if not previous["throughput_per_second"]:
+            continue
+        gain = current["throughput_per_second"] / previous["throughput_per_second"] - 1
+        if gain < SATURATION_GAIN:
+            return previous
+    return None
+
+
+async def run_load(args, base_url: str):
+    """ Запускает бота на фейковом сервере Bot API и прогоняет уровни нагрузки """
+    import main
+    import Scripts.warmup as warmup
+
+    server = FakeTelegramServer()
+    telegram_url = server.start()
+    config = {"BOT_TOKEN": BOT_TOKEN, "WARMUP": False,
+              "DELIVERY_MODE": args.delivery,
+              "CONCURRENT_UPDATES": args.concurrent_updates or False}
+    app = main.build_application(config, base_url=telegram_url)
+    levels = []
+    try:
+        # Прогрев (импорт, matplotlib, каталоги бирж) не входит в замеры
+        await asyncio.to_thread(warmup.warm_up)
+        await app.initialize()
+        await app.start()
+        await app.updater.start_polling(poll_interval=0.0, timeout=1)
+
+        for level, users in enumerate(args.users):
+            result = await run_level(server, users, level, args)
+            # Размеры кешей и открытые фигуры после уровня (Scripts/memory.py)
+            result["caches"] = cache_sizes(app.user_data)
+            levels.append(result)
+            print_level(result)
+    finally:
+        if app.updater.running:
+            await app.updater.stop()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        server.stop()
+    return {"levels": levels, "telegram_requests": dict(server.method_counts),
+            "uploads": server.uploads}
+
+
+@contextmanager
+def scratch_file_ids(workdir):
+    """
+        Кеш file_id прогона во временной папке: фиктивные file_id
+        фейкового сервера Bot API не попадают в Output/ бота
+    """
+    import Scripts.file_id_cache as file_id_cache
+
+    saved = file_id_cache.CACHE_FILENAME
+    file_id_cache.save()
+    file_id_cache.clear()
+    file_id_cache.CACHE_FILENAME = str(Path(workdir, saved))
+    try:
+        yield
+    finally:
+        # Сохранение до выхода, иначе atexit записал бы их в Output/ бота
+        file_id_cache.save()
+        file_id_cache.clear()
+        file_id_cache.CACHE_FILENAME = saved
+
+
+def megabytes(value):
+    return f"{value / 2 ** 20:.0f}" if value else "н/д"
+
+
+def print_level(result):
+    """ Строка итогов уровня нагрузки """
+    analysis = result["stages"].get("analysis")
+    handlers = [stats["p95"] for stage, stats in result["stages"].items()
+                if stage.startswith("handler.")]
+    print(f"{result['users']:>6}{result['analyses']:>8}{result['failures']:>7}"
+          f"{result['wall_seconds']:>9.1f}{result['throughput_per_second']:>10.2f}"
+          f"{(analysis['p50'] if analysis else float('nan')):>10.2f}"
+          f"{(analysis['p95'] if analysis else float('nan')):>10.2f}"
+          f"{(max(handlers) * 1000 if handlers else float('nan')):>12.1f}"
+          f"{result['loop_lag']['p99'] * 1000:>10.1f}"
+          f"{result['loop_lag']['max'] * 1000:>10.1f}"
+          f"{megabytes(result['rss_peak_bytes']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест бота с фейковым сервером Bot API")
+    parser.add_argument("--users", default="1,5,10,25",
+                        help="уровни нагрузки: числа пользователей через запятую")
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="анализов на пользователя на уровне")
+    parser.add_argument("--mode", choices=("dialog", "command"),
+                        default="dialog",
+                        help="диалог /start или однострочная команда /vol")
+    parser.add_argument("--pair", default="BTC/USDT")
+    parser.add_argument("--timeframe", default="15",
+                        choices=("1", "3", "5", "15", "30", "60"))
+    parser.add_argument("--candles", type=int, default=200)
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="средняя пауза пользователя между шагами, с")
+    parser.add_argument("--step-timeout", type=float, default=300.0,
+                        help="максимальное ожидание ответа бота на шаге, с")
+    parser.add_argument("--concurrent-updates", type=int, default=0,
+                        help="CONCURRENT_UPDATES бота (0 - по одному обновлению)")
+    parser.add_argument("--delivery", choices=("stream", "album"),
+                        default="stream")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="задержка ответа стенда бирж, с")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--extra-venues", type=int, default=0,
+                        help="количество дополнительных тестовых бирж")
+    parser.add_argument("--candle-cache-ttl", type=float, default=0.0,
+                        help="время жизни кеша свечей, с (0 - без кеша)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-save", action="store_true",
+                        help="не сохранять результаты прогона")
+    args = parser.parse_args()
+    args.users = [int(users) for users in args.users.split(",")]
+
+    fixtures = load_fixtures()
+    stand = MockExchangeServer(fixtures, MockExchangeConfig(
+        latency=args.latency, jitter=args.jitter, seed=args.seed))
+    base_url = stand.start()
+
+    print(f"{'польз.':>6}{'анализ':>8}{'ошиб.':>7}{'время,с':>9}{'анализ/с':>10}"
+          f"{'p50, с':>10}{'p95, с':>10}{'обр.p95,мс':>12}"
+          f"{'lag p99':>10}{'lag max':>10}{'RSS,МБ':>8}")
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(patched_exchange_urls(base_url))
+            stack.enter_context(stand_in_venues(args.extra_venues, base_url))
+            workdir = stack.enter_context(bench_utils.scratch_workdir())
+            # Кеш file_id и журнал ошибок пишутся в Output/
+            Path(workdir, "Output").mkdir()
+            stack.enter_context(scratch_file_ids(workdir))
+            stack.enter_context(candle_cache_ttl(args.candle_cache_ttl))
+            reset_instrument_catalogs()
+            results = asyncio.run(run_load(args, base_url))
+    finally:
+        stand.stop()
+        reset_instrument_catalogs()
+
+    saturation = find_saturation(results["levels"])
+    if saturation:
+        print(f"Точка насыщения: пользователей - {saturation['users']}, "
+              f"{saturation['throughput_per_second']:.2f} анализ/с")
+    else:
+        print("Точка насыщения не достигнута: увеличьте --users")
+    last = results["levels"][-1]
+    print(f"\nЭтапы при {last['users']} пользователях:")
+    bench_utils.print_stage_table(last["stages"])
+    print("Кеши: " + ", ".join(f"{name} {size}"
+                               for name, size in last["caches"].items()))
+
+    results.update({
+        "scenario": {
+            "mode": args.mode, "pair": args.pair, "timeframe": args.timeframe,
+            "candles": args.candles, "rounds": args.rounds,
+            "think_time": args.think_time, "delivery": args.delivery,
+            "concurrent_updates": args.concurrent_updates,
+            "extra_venues": args.extra_venues,
+            "candle_cache_ttl": args.candle_cache_ttl,
+        },
+        "stand": {"latency": args.latency, "jitter": args.jitter,
+                  "requests": stand.request_counts},
+        "saturation_users": saturation["users"] if saturation else None,
+    })
+    if not args.no_save:
+        kind = f"load-{args.mode}-c{args.concurrent_updates}"
+        path = bench_utils.save_results(kind, results)
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Бенчмарк холодного старта бота.
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_startup --runs 5
+
+Каждый замер выполняется в отдельном процессе:
+    import_main   - время импорта main.py (без тяжелых модулей анализа);
+    import_eager  - время импорта Scripts.user_func (pandas, matplotlib);
+    first_cold    - время первого анализа без прогрева;
+    warmup        - длительность warm_up() на локальном стенде бирж;
+    first_warm    - время первого анализа после прогрева.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from Benchmarks import bench_utils
+
+
+def child_import(module):
+    started = time.perf_counter()
+    __import__(module)
+    return {"seconds": time.perf_counter() - started}
+
+
+def child_first_analysis(warm: bool, latency: float):
+    from Benchmarks.mock_exchange import (MockExchangeConfig, MockExchangeServer,
+                                          patched_exchange_urls)
+
+    server = MockExchangeServer(config=MockExchangeConfig(latency=latency))
+    base_url = server.start()
+    result = {}
+    try:
+        with patched_exchange_urls(base_url), bench_utils.scratch_workdir():
+            import Scripts.warmup as warmup
+            if warm:
+                started = time.perf_counter()
+                warmup.warm_up()
+                result["warmup"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            from Scripts.user_func import \
+                analys_based_on_trading_pair_timeframe_numbers_candles
+            analys_based_on_trading_pair_timeframe_numbers_candles(
+                "BTC/USDT", "SPOT", "15", "200")
+            result["first"] = time.perf_counter() - started
+    finally:
+        server.stop()
+    return result
+
+
+def run_child(*args):
+    output = subprocess.check_output(
+        [sys.executable, "-m", "Benchmarks.bench_startup", "--child", *args],
+        text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="задержка стенда бирж, с")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        kind = args.child[0]
+        if kind == "import":
+            print(json.dumps(child_import(args.child[1])))
+        else:
+            print(json.dumps(child_first_analysis(kind == "warm", args.latency)))
+        return
+
+    samples = {"import_main": [], "import_eager": [], "first_cold": [],
+               "warmup": [], "first_warm": []}
+    latency = ["--latency", str(args.latency)]
+    for _ in range(args.runs):
+        samples["import_main"].append(run_child("import", "main")["seconds"])
+        samples["import_eager"].append(
+            run_child("import", "Scripts.user_func")["seconds"])
+        samples["first_cold"].append(run_child("cold", *latency)["first"])
+        warm = run_child("warm", *latency)
+        samples["warmup"].append(warm["warmup"])
+        samples["first_warm"].append(warm["first"])
+
+    stages = {name: bench_utils.summarize(values)
+              for name, values in samples.items()}
+    baseline_path = bench_utils.find_latest_results("startup")
+    baseline = bench_utils.load_results(baseline_path) if baseline_path else None
+    bench_utils.print_stage_table(stages, baseline["stages"] if baseline else None)
+
+    if not args.no_save:
+        path = bench_utils.save_results("startup", {
+            "runs": args.runs, "latency": args.latency, "stages": stages})
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
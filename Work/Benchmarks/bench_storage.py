@@ -0,0 +1,176 @@
+"""
+Бенчмарк локального хранилища свечей: архив np.memmap и сжатый формат.
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_storage
+    python -m Benchmarks.bench_storage --sizes 100000,525600 --range 1440
+
+Для синтетических минутных свечей (цены с шагом 0.01, объем с тремя
+знаками) замеряются размер на диске, запись, чтение всей серии и
+диапазона --range свечей из середины, а также итоги диапазона по
+накопленным суммам (candle_storage.aggregate) и сезонность объема за
+последние --season-days дней по почасовой сводке (Scripts/seasonality.py).
+Чтение диапазона сравнивается с запросом того же числа свечей у биржи
+(--fetch-ms на страницу в 1000 свечей - типичное время ответа API).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from Benchmarks import bench_utils
+
+
+DEFAULT_SIZES = (10_000, 100_000, 525_600)
+DEFAULT_RANGE = 1440
+# Время ответа биржи на страницу свечей, мс
+DEFAULT_FETCH_MS = 150
+# Окно сезонности, дней
+DEFAULT_SEASON_DAYS = 90
+SERIES = ("bench", "SPOT", "BTC/USDT", "1")
+
+
+def make_series(size: int, seed: int = 0):
+    """ Синтетические минутные свечи массивом (N, 6) """
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + np.arange(size, dtype=np.int64) * 60_000
+    close = np.round(60000 * np.exp(np.cumsum(rng.normal(0, 0.0015, size))), 2)
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.round(np.abs(rng.normal(0, 0.001, size)) * close, 2)
+    # Цены округляются до шага, как у цен из ответов бирж
+    high = np.round(np.maximum(open_, close) + spread, 2)
+    low = np.round(np.minimum(open_, close) - spread, 2)
+    volume = np.round(np.abs(rng.normal(50, 20, size)) + 0.01, 3)
+    return np.column_stack([timestamps, open_, high, low, close, volume])
+
+
+def best_of(call, repeat: int):
+    """ Лучшее время вызова из repeat прогонов, с """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def directory_size(path: str):
+    """ Размер файла или папки в байтах """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name))
+               for name in os.listdir(path))
+
+
+def measure_size(storage, data, range_size: int, repeat: int,
+                 float32_volume: bool, season_days: int):
+    """ Замеры одного размера серии для архива и сжатого формата """
+    import Scripts.seasonality as seasonality
+
+    shutil.rmtree(storage.STORAGE_DIR, ignore_errors=True)
+    middle = len(data) // 2
+    start, end = data[middle, 0], data[min(middle + range_size, len(data)) - 1, 0]
+    season_end = int(data[-1, 0])
+    season_start = season_end - season_days * seasonality.DAY_MS
+
+    def season():
+        return seasonality.analyse(*SERIES[1:3], season_start, season_end)
+
+    def read_range():
+        columns = storage.read_columns(*SERIES, start, end)
+        # Чтение значений, а не только среза без копирования
+        return [np.asarray(values).sum() for values in columns.values()]
+
+    result = {"size": len(data)}
+    started = time.perf_counter()
+    storage.write_candles(*SERIES, data)
+    result["archive_write"] = time.perf_counter() - started
+    result["archive_bytes"] = directory_size(storage.series_path(*SERIES))
+    result["archive_read_all"] = best_of(
+        lambda: storage.read_array(*SERIES), repeat)
+    result["archive_read_range"] = best_of(read_range, repeat)
+    result["archive_aggregate"] = best_of(
+        lambda: storage.aggregate(*SERIES, start, end), repeat)
+    result["archive_seasonality"] = best_of(season, repeat)
+
+    started = time.perf_counter()
+    storage.compress_series(*SERIES, float32_volume=float32_volume)
+    result["compress"] = time.perf_counter() - started
+    result["compressed_bytes"] = directory_size(storage.compressed_path(*SERIES))
+    result["compressed_read_all"] = best_of(
+        lambda: storage.read_array(*SERIES), repeat)
+    result["compressed_read_range"] = best_of(read_range, repeat)
+    result["compressed_aggregate"] = best_of(
+        lambda: storage.aggregate(*SERIES, start, end), repeat)
+    result["compressed_seasonality"] = best_of(season, repeat)
+    # Без float32 сжатие без потерь
+    restored = storage.read_array(*SERIES)
+    assert np.allclose(restored, data, rtol=1e-6) if float32_volume \
+        else np.array_equal(restored, data)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк локального хранилища свечей")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="размеры серий через запятую")
+    parser.add_argument("--range", type=int, default=DEFAULT_RANGE,
+                        help="свечей в читаемом диапазоне")
+    parser.add_argument("--fetch-ms", type=float, default=DEFAULT_FETCH_MS,
+                        help="время ответа биржи на страницу в 1000 свечей, мс")
+    parser.add_argument("--season-days", type=int, default=DEFAULT_SEASON_DAYS,
+                        help="окно сезонности объема, дней")
+    parser.add_argument("--float32-volume", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    import Scripts.candle_storage as storage
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    fetch_seconds = -(-args.range // 1000) * args.fetch_ms / 1000
+    results = {}
+    previous_dir = storage.STORAGE_DIR
+    with tempfile.TemporaryDirectory(prefix="bench-storage-") as directory:
+        storage.STORAGE_DIR = directory
+        try:
+            for size in sizes:
+                data = make_series(size, args.seed)
+                stats = measure_size(storage, data, args.range, args.repeat,
+                                     args.float32_volume, args.season_days)
+                results[str(size)] = stats
+                ratio = stats["archive_bytes"] / stats["compressed_bytes"]
+                print(f"{size:>9} свечей: архив {stats['archive_bytes'] / 2**20:7.2f} МБ, "
+                      f"сжато {stats['compressed_bytes'] / 2**20:7.2f} МБ ({ratio:.1f}x)")
+                print(f"{'':>17}чтение всей серии: архив "
+                      f"{stats['archive_read_all'] * 1000:8.2f} мс, сжато "
+                      f"{stats['compressed_read_all'] * 1000:8.2f} мс")
+                print(f"{'':>17}диапазон {args.range} свечей: архив "
+                      f"{stats['archive_read_range'] * 1000:8.3f} мс, сжато "
+                      f"{stats['compressed_read_range'] * 1000:8.3f} мс, "
+                      f"запрос к бирже ~{fetch_seconds * 1000:.0f} мс")
+                print(f"{'':>17}итоги диапазона (aggregate): архив "
+                      f"{stats['archive_aggregate'] * 1000:8.3f} мс, сжато "
+                      f"{stats['compressed_aggregate'] * 1000:8.3f} мс")
+                print(f"{'':>17}сезонность за {args.season_days} дн.: архив "
+                      f"{stats['archive_seasonality'] * 1000:8.3f} мс, сжато "
+                      f"{stats['compressed_seasonality'] * 1000:8.3f} мс", flush=True)
+        finally:
+            storage.STORAGE_DIR = previous_dir
+
+    if not args.no_save:
+        path = bench_utils.save_results("storage", {
+            "range": args.range, "season_days": args.season_days,
+            "float32_volume": args.float32_volume,
+            "repeat": args.repeat, "seed": args.seed, "results": results,
+        })
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
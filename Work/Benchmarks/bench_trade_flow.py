@@ -0,0 +1,124 @@
+"""
+Бенчмарк свертки потока сделок (Scripts/trade_flow.py).
+
+Запуск из папки Work:
+    python -m Benchmarks.bench_trade_flow
+    python -m Benchmarks.bench_trade_flow --trades 500000 --exchange bybit
+
+Синтетические сообщения WebSocket о сделках (по умолчанию aggTrade Binance)
+проходят тот же путь, что и в TradeStream.run_websocket: json.loads,
+разбор адаптером биржи и TradeFlowAggregator.add, в одном потоке.
+Отдельно замеряется пакетная свертка add_many (догрузка через REST).
+Пиковый поток BTC/USDT на крупнейших биржах - порядка нескольких тысяч
+сделок в секунду, его и нужно с запасом перекрывать.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Benchmarks import bench_utils
+
+
+DEFAULT_TRADES = 200_000
+# Ориентир пикового потока сделок BTC/USDT на одной бирже, сделок/с
+PEAK_TRADES_PER_SECOND = 5_000
+
+
+def make_messages(exchange: str, count: int, seed: int = 0):
+    """ Синтетические сообщения WebSocket биржи о сделках, по одной сделке """
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + np.cumsum(rng.integers(0, 40, count))
+    prices = np.round(60000 + np.cumsum(rng.normal(0, 0.5, count)), 2)
+    sizes = np.round(rng.exponential(0.05, count) + 0.001, 3)
+    buys = rng.random(count) < 0.5
+    messages = []
+    for i, (ts, price, size, buy) in enumerate(zip(
+            timestamps.tolist(), prices.tolist(), sizes.tolist(), buys.tolist())):
+        if exchange == "binance":
+            message = {"e": "aggTrade", "E": ts, "s": "BTCUSDT", "a": i,
+                       "p": str(price), "q": str(size), "f": i, "l": i,
+                       "T": ts, "m": not buy, "M": True}
+        elif exchange == "bybit":
+            message = {"topic": "publicTrade.BTCUSDT", "type": "snapshot",
+                       "ts": ts, "data": [{"T": ts, "s": "BTCUSDT",
+                                           "S": "Buy" if buy else "Sell",
+                                           "v": str(size), "p": str(price),
+                                           "i": str(i), "BT": False}]}
+        else:
+            message = {"arg": {"channel": "trades", "instId": "BTC-USDT"},
+                       "data": [{"instId": "BTC-USDT", "tradeId": str(i),
+                                 "px": str(price), "sz": str(size),
+                                 "side": "buy" if buy else "sell",
+                                 "ts": str(ts)}]}
+        messages.append(json.dumps(message))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк свертки потока сделок")
+    parser.add_argument("--trades", type=int, default=DEFAULT_TRADES)
+    parser.add_argument("--exchange", default="binance",
+                        choices=("binance", "bybit", "okx"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    from Scripts.exchanges import get_adapter
+    from Scripts.trade_flow import TradeFlowAggregator
+
+    adapter = get_adapter(args.exchange)
+    messages = make_messages(args.exchange, args.trades, args.seed)
+
+    # Путь сообщения WebSocket: разбор JSON, разбор сделки, свертка
+    aggregator = TradeFlowAggregator()
+    add, parse = aggregator.add, adapter.parse_trade_message
+    started = time.perf_counter()
+    for message in messages:
+        for trade in parse(json.loads(message)):
+            add(*trade)
+    stream_seconds = time.perf_counter() - started
+
+    # Только свертка уже разобранных сделок
+    trades = [trade for message in messages
+              for trade in parse(json.loads(message))]
+    aggregator = TradeFlowAggregator()
+    started = time.perf_counter()
+    for trade in trades:
+        aggregator.add(*trade)
+    add_seconds = time.perf_counter() - started
+
+    # Пакетная свертка (догрузка через REST пачками по 1000 сделок)
+    aggregator = TradeFlowAggregator()
+    started = time.perf_counter()
+    for i in range(0, len(trades), 1000):
+        aggregator.add_many(trades[i:i + 1000])
+    batch_seconds = time.perf_counter() - started
+
+    results = {
+        "stream_trades_per_second": args.trades / stream_seconds,
+        "add_trades_per_second": args.trades / add_seconds,
+        "add_many_trades_per_second": args.trades / batch_seconds,
+    }
+    print(f"{args.exchange}, {args.trades} сделок, один поток:")
+    print(f"  сообщение WebSocket целиком: "
+          f"{results['stream_trades_per_second']:>10,.0f} сделок/с "
+          f"(x{results['stream_trades_per_second'] / PEAK_TRADES_PER_SECOND:.0f} "
+          f"от пика {PEAK_TRADES_PER_SECOND} сделок/с)")
+    print(f"  только свертка add:          "
+          f"{results['add_trades_per_second']:>10,.0f} сделок/с")
+    print(f"  пакетная свертка add_many:   "
+          f"{results['add_many_trades_per_second']:>10,.0f} сделок/с")
+
+    if not args.no_save:
+        path = bench_utils.save_results("trade_flow", {
+            "exchange": args.exchange, "trades": args.trades,
+            "seed": args.seed, "results": results,
+        })
+        print(f"Результаты сохранены в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import json
+import math
+import os
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+# Папка для хранения результатов бенчмарков
+RESULTS_DIR = Path("Output/benchmarks")
+
+
+def percentile(values, q):
+    """ Вычисляет перцентиль q (0-100) с линейной интерполяцией """
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) \
+        * (position - lower)
+
+
+def summarize(values):
+    """ Сводная статистика по списку замеров (в секундах) """
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else float("nan"),
+        "min": min(values) if values else float("nan"),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else float("nan"),
+    }
+
+
+def git_revision():
+    """ Возвращает короткий хеш текущего коммита (или None вне git) """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(kind: str, payload: dict):
+    """ Сохраняет результаты прогона в Output/benchmarks/<kind>-<время>.json """
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    payload = dict(payload)
+    payload.setdefault("kind", kind)
+    payload.setdefault("created_at", datetime.now().isoformat(timespec="seconds"))
+    payload.setdefault("git_revision", git_revision())
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = RESULTS_DIR / f"{kind}-{stamp}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_results(path):
+    """ Загружает сохраненный результат прогона """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_latest_results(kind: str, exclude=None):
+    """ Ищет последний сохраненный результат указанного вида """
+    candidates = sorted(RESULTS_DIR.glob(f"{kind}-*.json"))
+    if exclude is not None:
+        candidates = [p for p in candidates if p.resolve() != Path(exclude).resolve()]
+    return candidates[-1] if candidates else None
+
+
+@contextmanager
+def scratch_workdir():
+    """ Временно переходит во временную папку, чтобы графики не затирали Graphics/ """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        Path(directory, "Graphics").mkdir()
+        os.chdir(directory)
+        try:
+            yield Path(directory)
+        finally:
+            os.chdir(previous)
+
+
+def format_delta(current, baseline):
+    """ Форматирует относительное изменение метрики в процентах """
+    if not baseline or math.isnan(baseline) or math.isnan(current):
+        return "    n/a"
+    change = (current - baseline) / baseline * 100
+    return f"{change:+6.1f}%"
+
+
+def print_stage_table(stages: dict, baseline_stages: dict = None):
+    """ Печатает таблицу p50/p95/p99 по этапам (в миллисекундах) """
+    header = f"{'этап':<28}{'n':>6}{'p50, мс':>12}{'p95, мс':>12}{'p99, мс':>12}"
+    if baseline_stages:
+        header += f"{'Δp50':>10}{'Δp95':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in stages.items():
+        line = (
+            f"{name:<28}{stats['count']:>6}"
+            f"{stats['p50'] * 1000:>12.2f}{stats['p95'] * 1000:>12.2f}"
+            f"{stats['p99'] * 1000:>12.2f}"
+        )
+        if baseline_stages:
+            base = baseline_stages.get(name)
+            if base:
+                line += f"{format_delta(stats['p50'], base['p50']):>10}"
+                line += f"{format_delta(stats['p95'], base['p95']):>10}"
+        print(line)
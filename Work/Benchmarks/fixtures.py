@@ -0,0 +1,322 @@
+"""
+Фикстуры для локального стенда бирж.
+
+Фикстура одной биржи хранится в Benchmarks/Fixtures/<биржа>.json:
+    instruments - инструменты по категориям биржи в формате ответа ее
+                  каталога (символ, база, котировка, тип контракта, дата
+                  поставки);
+    klines - свечи по ключу "<категория>|<символ>|<интервал>"
+             в виде [ts, open, high, low, close, volume] по возрастанию времени.
+
+Фикстуры можно либо записать с живых API (record_fixtures),
+либо сгенерировать синтетически (generate_fixtures).
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import Library.utils as utils
+
+
+# Папка с фикстурами
+FIXTURES_DIR = Path("Benchmarks/Fixtures")
+
+# Таймфреймы бота (в минутах) и их запись на каждой бирже
+TIMEFRAMES = {
+    "1": {"bybit": "1", "okx": "1m", "binance": "1m"},
+    "3": {"bybit": "3", "okx": "3m", "binance": "3m"},
+    "5": {"bybit": "5", "okx": "5m", "binance": "5m"},
+    "15": {"bybit": "15", "okx": "15m", "binance": "15m"},
+    "30": {"bybit": "30", "okx": "30m", "binance": "30m"},
+    "60": {"bybit": "60", "okx": "1H", "binance": "1h"},
+}
+
+# Дата экспирации срочного фьючерса по умолчанию (формат бота)
+DEFAULT_EXPIRY = "26SEP25"
+
+MONTHS = {
+    'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
+    'MAY': '05', 'JUN': '06', 'JUL': '07', 'AUG': '08',
+    'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'
+}
+
+# Множители объема, чтобы биржи отличались на графиках
+VOLUME_SCALE = {"bybit": 0.8, "okx": 0.5, "binance": 1.5}
+
+
+def native_symbols(base: str, quote: str, expiry: str = DEFAULT_EXPIRY):
+    """ Возвращает нативные символы пары для каждой биржи и рынка """
+    # Дата экспирации в формате ГГММДД
+    expiry_short = expiry[5:] + MONTHS[expiry[2:5]] + expiry[:2]
+    return {
+        "bybit": {
+            "spot": [base + quote],
+            "linear": [base + quote, f"{base}{quote}-{expiry}"],
+        },
+        "okx": {
+            "SPOT": [f"{base}-{quote}"],
+            "SWAP": [f"{base}-{quote}-SWAP"],
+            "FUTURES": [f"{base}-{quote}-{expiry_short}"],
+        },
+        "binance": {
+            "api": [base + quote],
+            "fapi": [base + quote, f"{base}{quote}_{expiry_short}"],
+            "dapi": [f"{base}USD_PERP", f"{base}USD_{expiry_short}"],
+        },
+    }
+
+
+def catalog_items(base: str, quote: str, expiry: str = DEFAULT_EXPIRY):
+    """
+        Инструменты пары в формате каталогов бирж, в том же порядке,
+        что и символы native_symbols
+    """
+    symbols = native_symbols(base, quote, expiry)
+    # Поставка срочных фьючерсов - в 08:00 UTC дня экспирации
+    delivery = int(datetime(2000 + int(expiry[5:]), int(MONTHS[expiry[2:5]]),
+                            int(expiry[:2]), 8, tzinfo=timezone.utc)
+                   .timestamp() * 1000)
+    bybit_perp, bybit_future = symbols["bybit"]["linear"]
+    binance_perp, binance_future = symbols["binance"]["fapi"]
+    coin_perp, coin_future = symbols["binance"]["dapi"]
+    return {
+        "bybit": {
+            "spot": [{"symbol": symbols["bybit"]["spot"][0],
+                      "baseCoin": base, "quoteCoin": quote}],
+            "linear": [
+                {"symbol": bybit_perp, "contractType": "LinearPerpetual",
+                 "baseCoin": base, "quoteCoin": quote, "deliveryTime": "0"},
+                {"symbol": bybit_future, "contractType": "LinearFutures",
+                 "baseCoin": base, "quoteCoin": quote,
+                 "deliveryTime": str(delivery)}],
+        },
+        "okx": {
+            "SPOT": [{"instId": symbols["okx"]["SPOT"][0], "instType": "SPOT",
+                      "baseCcy": base, "quoteCcy": quote}],
+            "SWAP": [{"instId": symbols["okx"]["SWAP"][0], "instType": "SWAP",
+                      "uly": f"{base}-{quote}", "expTime": ""}],
+            "FUTURES": [{"instId": symbols["okx"]["FUTURES"][0],
+                         "instType": "FUTURES", "uly": f"{base}-{quote}",
+                         "expTime": str(delivery)}],
+        },
+        "binance": {
+            "api": [{"symbol": symbols["binance"]["api"][0], "status": "TRADING",
+                     "baseAsset": base, "quoteAsset": quote}],
+            "fapi": [
+                {"symbol": binance_perp, "contractType": "PERPETUAL",
+                 "baseAsset": base, "quoteAsset": quote,
+                 "deliveryDate": 4133404800000},
+                {"symbol": binance_future, "contractType": "CURRENT_QUARTER",
+                 "baseAsset": base, "quoteAsset": quote,
+                 "deliveryDate": delivery}],
+            "dapi": [
+                {"symbol": coin_perp, "contractType": "PERPETUAL",
+                 "baseAsset": base, "quoteAsset": "USD",
+                 "deliveryDate": 4133404800000},
+                {"symbol": coin_future, "contractType": "CURRENT_QUARTER",
+                 "baseAsset": base, "quoteAsset": "USD",
+                 "deliveryDate": delivery}],
+        },
+    }
+
+
+def kline_keys(exchange: str, instruments: dict):
+    """ Перечисляет ключи свечей (категория, символ) для инструментов биржи """
+    for category, symbols in instruments.items():
+        for symbol in symbols:
+            yield category, symbol
+
+
+def generate_random_walk(rng, count, start_price):
+    """ Генерирует последовательность цен закрытия случайным блужданием """
+    prices = []
+    price = start_price
+    for _ in range(count):
+        price *= 1 + rng.gauss(0, 0.0015)
+        prices.append(price)
+    return prices
+
+
+def generate_candles(rng, start_ms, step_ms, closes, volume_scale):
+    """ Строит свечи [ts, open, high, low, close, volume] по ценам закрытия """
+    candles = []
+    previous = closes[0]
+    for i, close in enumerate(closes):
+        open_price = previous
+        spread = abs(rng.gauss(0, 0.001)) * close
+        high = max(open_price, close) + spread
+        low = min(open_price, close) - spread
+        volume = abs(rng.gauss(50, 20)) * volume_scale + 0.01
+        candles.append([
+            start_ms + i * step_ms,
+            round(open_price, 2), round(high, 2), round(low, 2),
+            round(close, 2), round(volume, 4)
+        ])
+        previous = close
+    return candles
+
+
+def generate_fixtures(pairs=(("BTC", "USDT"),), count=1000, seed=42,
+                      end_ms=None):
+    """ Генерирует синтетические фикстуры для всех трех бирж """
+    rng = random.Random(seed)
+    if end_ms is None:
+        end_ms = int(time.time() * 1000)
+
+    fixtures = {
+        exchange: {"exchange": exchange, "instruments": {}, "klines": {}}
+        for exchange in ("bybit", "okx", "binance")
+    }
+
+    for base, quote in pairs:
+        symbols = native_symbols(base, quote)
+        start_price = rng.uniform(100, 60000)
+
+        for timeframe, native in TIMEFRAMES.items():
+            step_ms = int(timeframe) * 60 * 1000
+            start_ms = (end_ms // step_ms - count + 1) * step_ms
+            # Общая траектория цены, чтобы биржи были скоррелированы
+            closes = generate_random_walk(rng, count, start_price)
+
+            for exchange, instruments in symbols.items():
+                for category, symbol in kline_keys(exchange, instruments):
+                    noisy = [c * (1 + rng.gauss(0, 0.0002)) for c in closes]
+                    key = f"{category}|{symbol}|{native[exchange]}"
+                    fixtures[exchange]["klines"][key] = generate_candles(
+                        rng, start_ms, step_ms, noisy,
+                        VOLUME_SCALE[exchange]
+                    )
+
+        for exchange, instruments in catalog_items(base, quote).items():
+            catalog = fixtures[exchange]["instruments"]
+            for category, items in instruments.items():
+                catalog.setdefault(category, []).extend(items)
+
+    return fixtures
+
+
+def record_fixtures(pairs=(("BTC", "USDT"),), limit=1000):
+    """ Записывает фикстуры с живых API бирж (требуется доступ в сеть) """
+    fixtures = {
+        exchange: {"exchange": exchange, "instruments": {}, "klines": {}}
+        for exchange in ("bybit", "okx", "binance")
+    }
+
+    # Каталоги инструментов
+    for category in ("spot", "linear", "inverse"):
+        response = utils.send_request(
+            "https://api.bybit.com/v5/market/instruments-info", "GET",
+            {"category": category, "limit": 1000}, headers={})
+        fixtures["bybit"]["instruments"][category] = response["result"]["list"]
+    for inst_type in ("SPOT", "SWAP", "FUTURES"):
+        response = utils.send_request(
+            "https://www.okx.com/api/v5/public/instruments", "GET",
+            {"instType": inst_type}, headers={})
+        fixtures["okx"]["instruments"][inst_type] = response["data"]
+    for route, url in (("api", "https://api.binance.com/api/v3/exchangeInfo"),
+                       ("fapi", "https://fapi.binance.com/fapi/v1/exchangeInfo"),
+                       ("dapi", "https://dapi.binance.com/dapi/v1/exchangeInfo")):
+        response = utils.send_request(url, "GET", {}, headers={})
+        fixtures["binance"]["instruments"][route] = response["symbols"]
+
+    # Свечи для выбранных пар
+    for base, quote in pairs:
+        symbols = native_symbols(base, quote)
+        for native in TIMEFRAMES.values():
+            for category, symbol in kline_keys("bybit", symbols["bybit"]):
+                response = utils.send_request(
+                    "https://api.bybit.com/v5/market/kline", "GET",
+                    {"category": category, "symbol": symbol,
+                     "interval": native["bybit"], "limit": limit}, headers={})
+                rows = response.get("result", {}).get("list", [])
+                fixtures["bybit"]["klines"][f"{category}|{symbol}|{native['bybit']}"] = \
+                    sorted([int(r[0])] + [float(x) for x in r[1:6]] for r in rows)
+
+            for category, symbol in kline_keys("okx", symbols["okx"]):
+                response = utils.send_request(
+                    "https://www.okx.com/api/v5/market/candles", "GET",
+                    {"instId": symbol, "bar": native["okx"], "limit": 300},
+                    headers={})
+                rows = response.get("data", [])
+                fixtures["okx"]["klines"][f"{category}|{symbol}|{native['okx']}"] = \
+                    sorted([int(r[0])] + [float(x) for x in r[1:6]] for r in rows)
+
+            hosts = {"api": "https://api.binance.com/api/v3/klines",
+                     "fapi": "https://fapi.binance.com/fapi/v1/klines",
+                     "dapi": "https://dapi.binance.com/dapi/v1/klines"}
+            for category, symbol in kline_keys("binance", symbols["binance"]):
+                response = utils.send_request(
+                    hosts[category], "GET",
+                    {"symbol": symbol, "interval": native["binance"],
+                     "limit": limit}, headers={})
+                if isinstance(response, dict):
+                    continue
+                fixtures["binance"]["klines"][f"{category}|{symbol}|{native['binance']}"] = \
+                    [[int(r[0])] + [float(x) for x in r[1:6]] for r in response]
+
+    return fixtures
+
+
+def save_fixtures(fixtures, directory=FIXTURES_DIR):
+    """ Сохраняет фикстуры бирж в отдельные JSON-файлы """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for exchange, data in fixtures.items():
+        with open(directory / f"{exchange}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+def is_stale(fixtures):
+    """ Фикстуры старого формата: инструменты - только списки символов """
+    return any(isinstance(item, str)
+               for data in fixtures.values()
+               for items in data["instruments"].values() for item in items)
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """
+        Загружает фикстуры, при их отсутствии или старом формате
+        генерирует синтетические
+    """
+    directory = Path(directory)
+    if not all((directory / f"{e}.json").exists()
+               for e in ("bybit", "okx", "binance")):
+        save_fixtures(generate_fixtures(), directory)
+
+    fixtures = {}
+    for exchange in ("bybit", "okx", "binance"):
+        with open(directory / f"{exchange}.json", "r", encoding="utf-8") as f:
+            fixtures[exchange] = json.load(f)
+    if is_stale(fixtures):
+        fixtures = generate_fixtures()
+        save_fixtures(fixtures, directory)
+    return fixtures
+
+
+def fixture_time_span(fixtures, exchange="binance", key=None):
+    """ Возвращает (первый, последний) ts свечей фикстуры в мс """
+    klines = fixtures[exchange]["klines"]
+    rows = klines[key] if key else next(iter(klines.values()))
+    return rows[0][0], rows[-1][0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подготовка фикстур бирж")
+    parser.add_argument("mode", choices=("generate", "record"))
+    parser.add_argument("--pairs", default="BTC/USDT",
+                        help="список пар через запятую, например BTC/USDT,ETH/USDT")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="количество свечей на ключ")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    pairs = [tuple(p.strip().upper().split("/")) for p in args.pairs.split(",")]
+    if args.mode == "generate":
+        data = generate_fixtures(pairs, args.count, args.seed)
+    else:
+        data = record_fixtures(pairs, args.count)
+    save_fixtures(data)
+    print(f"Фикстуры сохранены в {FIXTURES_DIR}")
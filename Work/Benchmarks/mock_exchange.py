@@ -0,0 +1,289 @@
+"""
+Локальный HTTP-стенд бирж Bybit, OKX и Binance.
+
+Стенд отдает эндпоинты свечей и каталогов инструментов, которые
+используют модули Scripts/utils_for_api_*.py, воспроизводя свечи из фикстур
+в формате ответа каждой биржи. Поддерживаются искусственная задержка
+ответа и инъекция отказов. Эндпоинт /standin/v1/klines обслуживает
+дополнительные тестовые биржи (Benchmarks/stand_in_venues.py).
+"""
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from Benchmarks.fixtures import load_fixtures
+
+
+class MockExchangeConfig:
+    """ Параметры поведения стенда """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, failure_status: int = 503,
+                 seed: int = None):
+        # Базовая задержка ответа и равномерный разброс, в секундах
+        self.latency = latency
+        self.jitter = jitter
+        # Доля запросов, на которые стенд отвечает ошибкой
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next_delay(self):
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter,
+                                                            self.jitter))
+
+    def should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.failure_rate
+
+
+def select_rows(rows, start=None, end=None, limit=None, default_limit=200):
+    """ Выбирает свечи по диапазону времени и лимиту (rows по возрастанию) """
+    if start is not None:
+        rows = [r for r in rows if r[0] >= start]
+    if end is not None:
+        rows = [r for r in rows if r[0] <= end]
+    limit = default_limit if limit is None else limit
+    return rows[-limit:] if limit else []
+
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    """ Обработчик запросов стенда (маршрутизация по пути эндпоинта) """
+
+    server_version = "MockExchange/1.0"
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод бенчмарка журналом запросов
+        pass
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        stand = self.server.stand
+
+        time.sleep(stand.config.next_delay())
+        stand.count_request(parsed.path)
+
+        if stand.config.should_fail():
+            self.send_json({"error": "injected failure"},
+                           status=stand.config.failure_status)
+            return
+
+        route = stand.routes.get(parsed.path)
+        if route is None:
+            self.send_json({"error": "not found"}, status=404)
+            return
+        self.send_json(route(query))
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockExchangeServer:
+    """ Стенд бирж, работающий в фоновом потоке """
+
+    def __init__(self, fixtures=None, config: MockExchangeConfig = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.config = config or MockExchangeConfig()
+        self.httpd = ThreadingHTTPServer((host, port), MockExchangeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stand = self
+        self.thread = None
+        self.request_counts = {}
+        self.counts_lock = threading.Lock()
+
+        self.routes = {
+            # Bybit
+            "/v5/market/kline": self.bybit_kline,
+            "/v5/market/instruments-info": self.bybit_instruments,
+            # OKX
+            "/api/v5/market/candles": self.okx_candles,
+            "/api/v5/market/history-candles": self.okx_candles,
+            "/api/v5/public/instruments": self.okx_instruments,
+            # Binance
+            "/api/v3/klines": lambda q: self.binance_klines("api", q),
+            "/fapi/v1/klines": lambda q: self.binance_klines("fapi", q),
+            "/dapi/v1/klines": lambda q: self.binance_klines("dapi", q),
+            "/api/v3/exchangeInfo": lambda q: self.binance_info("api"),
+            "/fapi/v1/exchangeInfo": lambda q: self.binance_info("fapi"),
+            "/dapi/v1/exchangeInfo": lambda q: self.binance_info("dapi"),
+            # Дополнительные тестовые биржи
+            "/standin/v1/klines": self.standin_klines,
+        }
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name="mock-exchange", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def count_request(self, path):
+        with self.counts_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    # ----- Bybit -----
+    def bybit_instruments(self, query):
+        category = query.get("category", "spot")
+        items = self.fixtures["bybit"]["instruments"].get(category, [])
+        return {"retCode": 0, "retMsg": "OK",
+                "result": {"category": category, "list": items,
+                           "nextPageCursor": ""}}
+
+    def bybit_kline(self, query):
+        key = f"{query.get('category')}|{query.get('symbol')}|{query.get('interval')}"
+        rows = self.fixtures["bybit"]["klines"].get(key)
+        if rows is None:
+            return {"retCode": 10001, "retMsg": "Not supported symbols",
+                    "result": {}}
+        rows = select_rows(
+            rows,
+            start=int(query["start"]) if "start" in query else None,
+            end=int(query["end"]) if "end" in query else None,
+            limit=int(query["limit"]) if "limit" in query else None,
+            default_limit=200)
+        # Bybit отдает свечи от новых к старым, все поля строками
+        result = [[str(r[0])] + [str(x) for x in r[1:6]]
+                  + [str(r[4] * r[5])] for r in reversed(rows)]
+        return {"retCode": 0, "retMsg": "OK",
+                "result": {"symbol": query.get("symbol"),
+                           "category": query.get("category"),
+                           "list": result}}
+
+    # ----- OKX -----
+    def okx_instruments(self, query):
+        inst_type = query.get("instType", "SPOT")
+        items = self.fixtures["okx"]["instruments"].get(inst_type, [])
+        return {"code": "0", "msg": "", "data": items}
+
+    def okx_candles(self, query):
+        inst_id = query.get("instId", "")
+        if inst_id.endswith("-SWAP"):
+            category = "SWAP"
+        elif inst_id.count("-") == 2:
+            category = "FUTURES"
+        else:
+            category = "SPOT"
+        key = f"{category}|{inst_id}|{query.get('bar')}"
+        rows = self.fixtures["okx"]["klines"].get(key)
+        if rows is None:
+            return {"code": "51001", "msg": "Instrument ID does not exist",
+                    "data": []}
+        # after - свечи строго раньше ts, before - строго позже ts
+        end = int(query["after"]) - 1 if "after" in query else None
+        start = int(query["before"]) + 1 if "before" in query else None
+        limit = min(int(query.get("limit", 100)), 300)
+        rows = select_rows(rows, start=start, end=end, limit=limit)
+        data = [[str(r[0])] + [str(x) for x in r[1:6]]
+                + [str(r[5]), str(r[4] * r[5]), "1"] for r in reversed(rows)]
+        return {"code": "0", "msg": "", "data": data}
+
+    # ----- Binance -----
+    def binance_info(self, route):
+        items = self.fixtures["binance"]["instruments"].get(route, [])
+        return {"timezone": "UTC", "symbols": items}
+
+    def binance_klines(self, route, query):
+        key = f"{route}|{query.get('symbol')}|{query.get('interval')}"
+        rows = self.fixtures["binance"]["klines"].get(key, [])
+        rows = select_rows(
+            rows,
+            start=int(query["startTime"]) if "startTime" in query else None,
+            end=int(query["endTime"]) if "endTime" in query else None,
+            limit=min(int(query.get("limit", 500)), 1500),
+            default_limit=500)
+        # Binance отдает свечи от старых к новым, время - числом
+        return [[r[0]] + [str(x) for x in r[1:6]]
+                + [r[0] + 59999, str(r[4] * r[5]), 100, "0", "0", "0"]
+                for r in rows]
+
+    # ----- Тестовые биржи -----
+    def standin_klines(self, query):
+        # Свечи спота Bybit с объемом, масштабированным по имени биржи
+        key = f"spot|{query.get('symbol')}|{query.get('interval')}"
+        rows = self.fixtures["bybit"]["klines"].get(key, [])
+        rows = select_rows(
+            rows,
+            start=int(query["startTime"]) if "startTime" in query else None,
+            end=int(query["endTime"]) if "endTime" in query else None,
+            limit=int(query["limit"]) if "limit" in query else None)
+        scale = 0.5 + (sum(map(ord, query.get("venue", ""))) % 10) / 10
+        return [[r[0], r[1], r[2], r[3], r[4], r[5] * scale] for r in rows]
+
+
+@contextmanager
+def patched_exchange_urls(base_url: str):
+    """ Временно перенаправляет модули бирж на локальный стенд """
+    import Scripts.utils_for_api_bybit as bybit
+    import Scripts.utils_for_api_okx as okx
+    import Scripts.utils_for_api_binance as binance
+
+    saved = {
+        (bybit, "URL"): bybit.URL,
+        (okx, "URL"): okx.URL,
+        (binance, "URL"): binance.URL,
+        (binance, "URL_SPOT"): binance.URL_SPOT,
+        (binance, "URL_FUTURES_USDT"): binance.URL_FUTURES_USDT,
+        (binance, "URL_FUTURES_COIN"): binance.URL_FUTURES_COIN,
+    }
+    try:
+        for module, name in saved:
+            setattr(module, name, base_url)
+        yield
+    finally:
+        for (module, name), value in saved.items():
+            setattr(module, name, value)
+
+
+def reset_instrument_catalogs():
+    """ Сбрасывает загруженные каталоги инструментов (холодный старт) """
+    from Scripts.exchanges import get_adapters
+
+    for adapter in get_adapters():
+        adapter.reset_catalog()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный стенд бирж")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="разброс задержки, с")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="доля запросов с ошибкой (0-1)")
+    args = parser.parse_args()
+
+    server = MockExchangeServer(
+        config=MockExchangeConfig(args.latency, args.jitter,
+                                  args.failure_rate),
+        port=args.port)
+    print(f"Стенд бирж запущен на {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
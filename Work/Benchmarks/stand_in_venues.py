@@ -0,0 +1,56 @@
+"""
+Дополнительные тестовые биржи для проверки реестра Scripts/exchanges.py.
+
+Адаптер StandInAdapter запрашивает свечи у эндпоинта /standin/v1/klines
+локального стенда (Benchmarks/mock_exchange.py) по HTTP, поэтому каждая
+тестовая биржа добавляет настоящий сетевой запрос с задержкой стенда.
+Используется в bench_e2e (--extra-venues), чтобы убедиться, что время
+анализа не растет линейно с числом бирж.
+"""
+from contextlib import contextmanager
+
+import Library.utils as utils
+import Scripts.exchanges as exchanges
+
+
+class StandInAdapter(exchanges.ExchangeAdapter):
+    """ Тестовая биржа со спотовыми свечами локального стенда """
+
+    intervals = {'1': '1', '3': '3', '5': '5', '15': '15', '30': '30',
+                 '60': '60'}
+
+    def __init__(self, index: int, base_url: str):
+        self.name = f"standin{index}"
+        self.title = f"Venue {index}"
+        self.base_url = base_url
+
+    def symbol(self, trading_pair, type_of_trade):
+        return trading_pair.replace('/', '')
+
+    def fetch_candles(self, trading_pair, type_of_trade, timeframe,
+                      limit=None, start=None, end=None):
+        params = {"venue": self.name,
+                  "symbol": self.symbol(trading_pair, type_of_trade),
+                  "interval": self.interval(timeframe)}
+        if limit is not None:
+            params["limit"] = limit
+        if start is not None:
+            params["startTime"] = start
+            params["endTime"] = end
+        response = utils.send_request(self.base_url + "/standin/v1/klines",
+                                      "GET", params, headers={})
+        if "error" in response:
+            raise ConnectionError(response["message"])
+        return utils.parse_candles(response)
+
+
+@contextmanager
+def stand_in_venues(count: int, base_url: str):
+    """ Временно регистрирует count тестовых бирж """
+    adapters = [exchanges.register(StandInAdapter(index, base_url))
+                for index in range(1, count + 1)]
+    try:
+        yield adapters
+    finally:
+        for adapter in adapters:
+            exchanges.unregister(adapter.name)
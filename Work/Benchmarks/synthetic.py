@@ -0,0 +1,51 @@
+"""
+Генераторы синтетических свечей для микробенчмарков.
+
+Возвращают DataFrame того же вида, что и user_func.candles_to_df:
+индекс DatetimeIndex, колонки open/high/low/close/volume (float) и exchange.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Множители объема, чтобы биржи отличались на графиках
+VOLUME_SCALE = {"Bybit": 0.8, "OKX": 0.5, "Binance": 1.5}
+
+
+def make_candles(size: int, exchange: str = "Bybit", seed: int = 0,
+                 freq: str = "1min", start_price: float = 60000.0,
+                 returns=None):
+    """ Генерирует size свечей случайным блужданием цены """
+    rng = np.random.default_rng(seed)
+    if returns is None:
+        returns = rng.normal(0, 0.0015, size)
+
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.empty(size)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    spread = np.abs(rng.normal(0, 0.001, size)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = np.abs(rng.normal(50, 20, size)) * VOLUME_SCALE.get(exchange, 1.0) \
+        + 0.01
+
+    index = pd.date_range(end=pd.Timestamp("2025-06-12 12:00"),
+                          periods=size, freq=freq, name="timestamp")
+    df = pd.DataFrame({"open": open_, "high": high, "low": low,
+                       "close": close, "volume": volume}, index=index)
+    df["exchange"] = exchange
+    return df
+
+
+def make_exchange_frames(size: int, seed: int = 0, freq: str = "1min",
+                         exchanges=("Bybit", "OKX", "Binance")):
+    """ Генерирует скоррелированные свечи бирж: {биржа: DataFrame} """
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.0015, size)
+    frames = {}
+    for offset, exchange in enumerate(exchanges):
+        noise = rng.normal(0, 0.0002, size)
+        frames[exchange] = make_candles(size, exchange, seed + offset + 1,
+                                        freq, returns=common + noise)
+    return frames
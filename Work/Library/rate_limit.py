@@ -0,0 +1,115 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+# Скорость пополнения (запросов в секунду) и емкость корзины по умолчанию
+DEFAULT_RATE = 20.0
+DEFAULT_BURST = 40
+# Доля емкости корзины, которую могут расходовать только запросы бота
+BOT_RESERVE = 0.25
+# Максимальное ожидание токена в секундах для каждого приоритета
+MAX_WAIT = {"bot": 30.0, "api": 10.0}
+# Лимиты отдельных хостов: хост -> (скорость, емкость)
+LIMITS = {}
+
+_lock = threading.Lock()
+# Корзины токенов по хостам бирж
+_buckets = {}
+
+# Приоритет текущего запроса (наследуется потоками через copy_context)
+_priority = contextvars.ContextVar("rate_limit_priority", default="bot")
+
+
+class RateLimitExceeded(Exception):
+    # Токен для запроса к бирже не получен за допустимое время ожидания
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Превышен лимит запросов к {host}")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    # Корзина токенов: rate токенов в секунду, не более burst в запасе.
+    # Запросы с приоритетом, отличным от "bot", не опускают запас ниже
+    # резерва, поэтому внешние клиенты не вытесняют запросы бота
+
+    def __init__(self, rate: float, burst: float, reserve: float = BOT_RESERVE):
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self.reserve = min(self.capacity * reserve, self.capacity - 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, priority: str = "bot"):
+        # Забирает токен и возвращает 0 или время ожидания до появления токена
+        floor = 0.0 if priority == "bot" else self.reserve
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= floor + 1:
+                self.tokens -= 1
+                return 0.0
+            return (floor + 1 - self.tokens) / self.rate
+
+
+def configure(config: dict):
+    # Применяет настройки лимитов из config.json:
+    # RATE_LIMITS {хост: [скорость, емкость]} и RATE_LIMIT_BOT_RESERVE
+    global BOT_RESERVE
+    BOT_RESERVE = float(config.get("RATE_LIMIT_BOT_RESERVE", BOT_RESERVE))
+    with _lock:
+        for host, (rate, burst) in config.get("RATE_LIMITS", {}).items():
+            LIMITS[host] = (float(rate), float(burst))
+        # Корзины пересоздаются с новыми параметрами
+        _buckets.clear()
+
+
+def get_bucket(host: str):
+    # Возвращает корзину токенов хоста, создавая ее при первом обращении
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            rate, burst = LIMITS.get(host, (DEFAULT_RATE, DEFAULT_BURST))
+            bucket = _buckets[host] = TokenBucket(rate, burst, BOT_RESERVE)
+        return bucket
+
+
+@contextmanager
+def priority(name: str):
+    # Задает приоритет запросов к биржам внутри блока ("bot" или "api")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    # Возвращает приоритет текущего запроса
+    return _priority.get()
+
+
+def acquire(url: str):
+    # Ожидает токен для запроса к хосту url и возвращает время ожидания.
+    # Если токен не появится за MAX_WAIT, выбрасывает RateLimitExceeded
+    host = urlsplit(url).netloc
+    bucket = get_bucket(host)
+    name = _priority.get()
+    deadline = time.monotonic() + MAX_WAIT.get(name, MAX_WAIT["bot"])
+    waited = 0.0
+    while True:
+        delay = bucket.try_acquire(name)
+        if delay == 0:
+            return waited
+        if time.monotonic() + delay > deadline:
+            raise RateLimitExceeded(host, math.ceil(delay))
+        time.sleep(delay)
+        waited += delay
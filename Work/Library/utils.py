@@ -1,9 +1,21 @@
+import logging
+from datetime import datetime, timezone
+
 import requests
 
+from Library import rate_limit
+
+
+logger = logging.getLogger(__name__)
+
 
 def send_request(url_full: str, method: str, params: dict, headers: dict,
                  **kwargs):
     # Отправляет HTTP-запрос по указанному URL с заданным методом и параметрами
+    # Ожидание токена лимита запросов к хосту биржи
+    waited = rate_limit.acquire(url_full)
+    if waited:
+        logger.debug(f"Ожидание лимита запросов {waited:.2f} с: {url_full}")
     try:
         # Проверяет, является ли метод POST
         if method.upper() == "POST":
@@ -16,9 +28,21 @@ def send_request(url_full: str, method: str, params: dict, headers: dict,
         # Проверяет статус ответа на наличие HTTP-ошибок
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
-        # Выводит сообщение об ошибке сети в консоль
-        print(f"[Ошибка сети] {e}")
+        # Записывает сообщение об ошибке сети в журнал
+        logger.warning(f"[Ошибка сети] {e}")
         # Возвращает словарь с информацией об ошибке
         return {"error": "network", "message": str(e)}
     # Возвращает JSON-ответ от сервера
     return response.json()
+
+
+def parse_candles(rows):
+    # Преобразует строки свечей биржи в кортежи
+    # (время, открытие, максимум, минимум, закрытие, объем)
+    return [tuple(candle[:6]) for candle in rows]
+
+
+def expiry_from_ms(timestamp) -> str:
+    # Дата экспирации ГГММДД (UTC) по времени поставки фьючерса в мс
+    return datetime.fromtimestamp(int(timestamp) / 1000, tz=timezone.utc) \
+        .strftime("%y%m%d")
@@ -0,0 +1,477 @@
+"""
+HTTP API анализа объемов.
+
+Отдает данные, по которым бот строит графики: выровненные по времени
+свечи, OBV и VWAP всех бирж и объемные профили. Движок анализа, кеш
+свечей (Scripts/candle_cache.py) и лимиты запросов к биржам
+(Library/rate_limit.py) общие с ботом: при заданном API_PORT в
+config.json сервер запускается в цикле событий бота (см. main.py).
+Запросы API выполняются с приоритетом "api" и не расходуют резерв лимитов
+бирж, оставленный боту; одновременно выполняется не более MAX_CONCURRENCY
+анализов.
+
+Эндпоинты:
+    GET /health            - проверка работоспособности;
+    GET /api/v1/exchanges  - зарегистрированные биржи;
+    GET /api/v1/analysis   - свечи и индикаторы бирж по времени;
+    GET /api/v1/profile    - объемные профили бирж;
+    GET /api/v1/leadlag    - кросс-корреляция пар бирж по сдвигу и лучшие
+                             сдвиги (Scripts/lead_lag.py), параметр
+                             max_lag - окно сдвигов в свечах;
+    GET /api/v1/summary    - итоги за диапазон по загруженной истории
+                             (Scripts/candle_storage.py): объем в монетах,
+                             доля, VWAP и изменение OBV бирж без чтения
+                             свечей;
+    GET /api/v1/seasonality - средний объем по дню недели и часу (UTC) и
+                             доли бирж по часам суток по загруженной
+                             истории (Scripts/seasonality.py), параметр
+                             days - окно в днях или start и end.
+
+Параметры анализа: pair (BTC/USDT), type (SPOT, FUTURES, PERPETUAL
+FUTURES), timeframe (1, 3, 5, ..., Day, Week, Month), candles (последние
+N свечей) или start и end (ДД.ММ.ГГГГ ЧЧ:ММ или время в мс), format
+(json или arrow), indicators - дополнительные индикаторы /analysis через
+запятую (vwap_bands, anchored_vwap, volume_ma, relative_volume). Формат arrow (Arrow IPC stream) требует необязательного
+пакета pyarrow.
+
+Отдельный запуск из папки Work:
+    python -m Scripts.api --port 8080
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from Library import rate_limit
+import Scripts.memory as memory
+import Scripts.metrics as metrics
+from Scripts.candle_codec import UnsupportedVersion
+from Scripts.exchanges import get_adapters
+from Scripts.logger import log_warning
+
+
+# Максимальное количество одновременно выполняемых анализов
+MAX_CONCURRENCY = 8
+# Максимальное количество свечей в запросе (как в боте)
+MAX_CANDLES = 1000
+# Токен доступа из заголовка Authorization: Bearer <токен> (None - без него)
+API_TOKEN = None
+
+# Типы торговли, которые принимает анализ
+TRADE_TYPES = ("SPOT", "FUTURES", "PERPETUAL FUTURES")
+# Типы содержимого ответов
+JSON_CONTENT_TYPE = "application/json"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+class ApiError(Exception):
+    """ Ошибка запроса, возвращаемая клиенту с кодом status """
+
+    def __init__(self, status: int, message: str, retry_after: int = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def configure(config: dict):
+    """ Применяет настройки API из config.json """
+    global MAX_CONCURRENCY, API_TOKEN
+    MAX_CONCURRENCY = int(config.get("API_MAX_CONCURRENCY", MAX_CONCURRENCY))
+    API_TOKEN = config.get("API_TOKEN") or None
+
+
+def arrow_available():
+    """ Установлен ли необязательный пакет pyarrow """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_time(value: str, name: str):
+    """ Время в мс из строки ДД.ММ.ГГГГ ЧЧ:ММ или числа миллисекунд """
+    from datetime import datetime
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.strptime(value, "%d.%m.%Y %H:%M").timestamp() * 1000)
+    except ValueError:
+        raise ApiError(400, f"Неверный формат {name}: используйте "
+                            f"ДД.ММ.ГГГГ ЧЧ:ММ или время в мс")
+
+
+def parse_params(query):
+    """ Проверяет параметры анализа и возвращает их словарем """
+    pair = query.get("pair", "").strip().upper()
+    if "/" not in pair:
+        raise ApiError(400, "Параметр pair должен иметь вид BTC/USDT")
+
+    trade_type = query.get("type", "SPOT").strip().upper()
+    if trade_type not in TRADE_TYPES:
+        raise ApiError(400, f"Параметр type: одно из {', '.join(TRADE_TYPES)}")
+
+    timeframe = query.get("timeframe", "15").strip()
+    if not all(timeframe in adapter.intervals for adapter in get_adapters()):
+        raise ApiError(400, f"Неподдерживаемый таймфрейм: {timeframe}")
+
+    output_format = query.get("format", "json").lower()
+    if output_format not in ("json", "arrow"):
+        raise ApiError(400, "Параметр format: json или arrow")
+    if output_format == "arrow" and not arrow_available():
+        raise ApiError(406, "Формат arrow требует установленного пакета pyarrow")
+
+    params = {"pair": pair, "type": trade_type, "timeframe": timeframe,
+              "format": output_format, "candles": None,
+              "start": None, "end": None, "max_lag": None,
+              "indicators": ()}
+    if query.get("indicators"):
+        from Scripts.candle_analysis import INDICATORS
+
+        indicators = tuple(name.strip() for name in
+                           query["indicators"].split(",") if name.strip())
+        unknown = [name for name in indicators if name not in INDICATORS]
+        if unknown:
+            raise ApiError(400, f"Неизвестные индикаторы: {', '.join(unknown)}")
+        params["indicators"] = indicators
+    if "max_lag" in query:
+        try:
+            params["max_lag"] = int(query["max_lag"])
+        except ValueError:
+            raise ApiError(400, "Параметр max_lag должен быть числом")
+        if params["max_lag"] < 1:
+            raise ApiError(400, "Параметр max_lag: от 1")
+    if "start" in query or "end" in query:
+        if "start" not in query or "end" not in query:
+            raise ApiError(400, "Для диапазона нужны оба параметра start и end")
+        params["start"] = parse_time(query["start"], "start")
+        params["end"] = parse_time(query["end"], "end")
+        if params["end"] <= params["start"]:
+            raise ApiError(400, "Время end должно быть позже start")
+    else:
+        try:
+            params["candles"] = int(query.get("candles", "200"))
+        except ValueError:
+            raise ApiError(400, "Параметр candles должен быть числом")
+        if not 1 <= params["candles"] <= MAX_CANDLES:
+            raise ApiError(400, f"Параметр candles: от 1 до {MAX_CANDLES}")
+    return params
+
+
+def run_analysis(params):
+    """ Запрашивает свечи и рассчитывает индикаторы (выполняется в потоке) """
+    import Scripts.user_func as user_func
+
+    # Запросы API не расходуют резерв лимитов бирж, оставленный боту
+    with rate_limit.priority("api"), \
+            metrics.span("api_analysis", pair=params["pair"]):
+        if params["candles"] is not None:
+            candles = user_func.fetch_candles_numbers_candles(
+                params["pair"], params["type"], params["timeframe"],
+                str(params["candles"]))
+        else:
+            candles = user_func.fetch_candles_range(
+                params["pair"], params["type"], params["timeframe"],
+                params["start"], params["end"])
+        return user_func.analysis_data(candles, params["type"],
+                                       params["indicators"])
+
+
+def json_values(series):
+    """ Значения колонки для JSON: NaN заменяются на null """
+    return [None if value != value else value for value in series.tolist()]
+
+
+def encode_arrow(df):
+    """ Кодирует таблицу в формат Arrow IPC stream """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_analysis(params, frames, profiles):
+    """ Тело ответа /api/v1/analysis """
+    import Scripts.user_func as user_func
+
+    from Scripts.candle_analysis import INDICATORS
+
+    extra = [column for name in params["indicators"]
+             for column in INDICATORS[name]
+             if column not in user_func.ANALYSIS_COLUMNS]
+    df = user_func.aligned_frame(frames, user_func.ANALYSIS_COLUMNS + tuple(extra))
+    timestamps = df.index.as_unit("ms").asi8
+    if params["format"] == "arrow":
+        df = df.reset_index(drop=True)
+        df.insert(0, "timestamp", timestamps)
+        return encode_arrow(df), ARROW_CONTENT_TYPE
+
+    series = {}
+    for column in df.columns:
+        title, name = column.rsplit(".", 1)
+        series.setdefault(title, {})[name] = json_values(df[column])
+    body = {"pair": params["pair"], "type": params["type"],
+            "timeframe": params["timeframe"], "exchanges": list(frames),
+            "timestamp": timestamps.tolist(), "series": series}
+    return json.dumps(body).encode("utf-8"), JSON_CONTENT_TYPE
+
+
+def encode_profile(params, frames, profiles):
+    """ Тело ответа /api/v1/profile: ценовые диапазоны по возрастанию цены """
+    import pandas as pd
+
+    rows = []
+    for title, profile in profiles.items():
+        profile = profile.sort_index()
+        for interval, volume in profile.items():
+            rows.append((title, float(interval.left), float(interval.right),
+                         float(volume)))
+    if params["format"] == "arrow":
+        df = pd.DataFrame(rows, columns=["exchange", "low", "high", "volume"])
+        return encode_arrow(df), ARROW_CONTENT_TYPE
+
+    body = {"pair": params["pair"], "type": params["type"],
+            "timeframe": params["timeframe"], "profiles": {}}
+    for title, low, high, volume in rows:
+        body["profiles"].setdefault(title, []).append(
+            {"low": low, "high": high, "volume": volume})
+    return json.dumps(body).encode("utf-8"), JSON_CONTENT_TYPE
+
+
+def encode_lead_lag(params, frames, profiles):
+    """ Тело ответа /api/v1/leadlag (только JSON) """
+    import Scripts.lead_lag as lead_lag
+    import Scripts.user_func as user_func
+
+    result = lead_lag.analyse(
+        user_func.aligned_frame(frames, ("close", "volume")), params["max_lag"])
+    if result is None:
+        raise ValueError("для lead-lag анализа нужны минимум две биржи и "
+                         f"{lead_lag.MIN_CANDLES} свечей")
+    body = {"pair": params["pair"], "type": params["type"],
+            "timeframe": params["timeframe"], "candles": result["candles"],
+            "lags": result["lags"].tolist(), "best": result["best"],
+            "correlations": {
+                metric: {f"{first}/{second}": json_values(row)
+                         for (first, second), row in zip(result["pairs"], rows)}
+                for metric, rows in result["correlations"].items()}}
+    return json.dumps(body).encode("utf-8"), JSON_CONTENT_TYPE
+
+
+async def compute(request, encode):
+    """ Выполняет анализ в потоке и кодирует ответ функцией encode """
+    params = parse_params(request.query)
+    # Процесс у предела памяти (Scripts/memory.py): запрос стоит повторить
+    try:
+        memory.admit()
+    except memory.MemoryBudgetExceeded:
+        raise ApiError(503, "Недостаточно памяти, повторите запрос позже",
+                       retry_after=int(memory.SHED_INTERVAL))
+
+    def job():
+        # Анализ API учитывается вместе с анализами бота
+        with memory.job():
+            return encode(params, *run_analysis(params))
+
+    # Анализы API ограничены семафором, чтобы не занимать все потоки бота
+    async with request.app["semaphore"]:
+        try:
+            body, content_type = await asyncio.to_thread(job)
+        except rate_limit.RateLimitExceeded as e:
+            raise ApiError(429, str(e), retry_after=e.retry_after)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        except ConnectionError as e:
+            log_warning(f"Ошибка запроса к биржам из API: {e}")
+            raise ApiError(502, f"Ошибка запроса к биржам: {e}")
+    return web.Response(body=body, content_type=content_type)
+
+
+async def analysis(request):
+    return await compute(request, encode_analysis)
+
+
+async def profile(request):
+    return await compute(request, encode_profile)
+
+
+async def leadlag(request):
+    return await compute(request, encode_lead_lag)
+
+
+async def summary(request):
+    """ Итоги по локальному хранилищу свечей: pair, type, timeframe, start, end """
+    import Scripts.candle_storage as storage
+
+    query = request.query
+    pair = query.get("pair", "").strip().upper()
+    if "/" not in pair:
+        raise ApiError(400, "Параметр pair должен иметь вид BTC/USDT")
+    trade_type = query.get("type", "SPOT").strip().upper()
+    if trade_type not in TRADE_TYPES:
+        raise ApiError(400, f"Параметр type: одно из {', '.join(TRADE_TYPES)}")
+    timeframe = query.get("timeframe", "1").strip()
+    if timeframe not in storage.TIMEFRAME_MS:
+        raise ApiError(400, f"Неподдерживаемый таймфрейм: {timeframe}")
+    start = parse_time(query["start"], "start") if "start" in query else None
+    end = parse_time(query["end"], "end") if "end" in query else None
+
+    try:
+        results = await asyncio.to_thread(storage.aggregate_exchanges,
+                                          trade_type, pair, timeframe,
+                                          start, end)
+    except UnsupportedVersion as e:
+        # Серия записана до приведения объема к монетам
+        raise ApiError(409, str(e))
+    if not results:
+        raise ApiError(404, "История свечей для пары не загружена "
+                            "(python -m Scripts.backfill)")
+    return web.json_response({"pair": pair, "type": trade_type,
+                              "timeframe": timeframe, "start": start,
+                              "end": end, "exchanges": results})
+
+
+async def season(request):
+    """ Сезонность объема по локальному хранилищу: pair, type, days или start и end """
+    import Scripts.seasonality as seasonality
+
+    query = request.query
+    pair = query.get("pair", "").strip().upper()
+    if "/" not in pair:
+        raise ApiError(400, "Параметр pair должен иметь вид BTC/USDT")
+    trade_type = query.get("type", "SPOT").strip().upper()
+    if trade_type not in TRADE_TYPES:
+        raise ApiError(400, f"Параметр type: одно из {', '.join(TRADE_TYPES)}")
+    if "start" in query or "end" in query:
+        if "start" not in query or "end" not in query:
+            raise ApiError(400, "Для диапазона нужны оба параметра start и end")
+        start = parse_time(query["start"], "start")
+        end = parse_time(query["end"], "end")
+        if end <= start:
+            raise ApiError(400, "Время end должно быть позже start")
+    else:
+        try:
+            days = int(query.get("days", seasonality.DAYS))
+        except ValueError:
+            raise ApiError(400, "Параметр days должен быть числом")
+        if days < 1:
+            raise ApiError(400, "Параметр days: от 1")
+        end = int(time.time() * 1000)
+        start = end - days * seasonality.DAY_MS
+
+    try:
+        result = await asyncio.to_thread(seasonality.analyse, trade_type, pair,
+                                         start, end)
+    except UnsupportedVersion as e:
+        raise ApiError(409, str(e))
+    if result is None:
+        raise ApiError(404, "История свечей для пары не загружена "
+                            "(python -m Scripts.backfill)")
+    return web.json_response({
+        "pair": pair, "type": trade_type, "start": start, "end": end,
+        "weekdays": list(seasonality.WEEKDAYS),
+        "exchanges": [{
+            "title": title,
+            "timeframe": result["timeframes"][title],
+            "hours": result["hours"][title],
+            # Строки - дни недели с понедельника, столбцы - часы UTC
+            "mean": [json_values(row) for row in result["mean"][title]],
+            "share": result["shares"][title].tolist(),
+        } for title in result["titles"]],
+    })
+
+
+async def list_exchanges(request):
+    return web.json_response([
+        {"name": adapter.name, "title": adapter.title, "color": adapter.color}
+        for adapter in get_adapters()
+    ])
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+@web.middleware
+async def api_middleware(request, handler):
+    """ Авторизация, ошибки в JSON и метрики запросов API """
+    started = time.perf_counter()
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "other"
+    try:
+        if (API_TOKEN and route != "/health"
+                and request.headers.get("Authorization") != f"Bearer {API_TOKEN}"):
+            raise ApiError(401, "Требуется токен доступа")
+        response = await handler(request)
+    except ApiError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        response = web.json_response({"error": e.message}, status=e.status,
+                                     headers=headers)
+    except web.HTTPException as e:
+        response = web.json_response({"error": e.reason}, status=e.status)
+    metrics.inc_counter("api_requests_total", route=route,
+                        status=response.status)
+    metrics.observe("api_request_seconds", time.perf_counter() - started,
+                    route=route)
+    return response
+
+
+def make_app():
+    """ Создает приложение aiohttp с маршрутами API """
+    app = web.Application(middlewares=[api_middleware])
+    app["semaphore"] = asyncio.Semaphore(MAX_CONCURRENCY)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/api/v1/exchanges", list_exchanges),
+        web.get("/api/v1/analysis", analysis),
+        web.get("/api/v1/profile", profile),
+        web.get("/api/v1/leadlag", leadlag),
+        web.get("/api/v1/summary", summary),
+        web.get("/api/v1/seasonality", season),
+    ])
+    return app
+
+
+async def start_server(port: int, host: str = "127.0.0.1"):
+    """ Запускает API в текущем цикле событий и возвращает AppRunner """
+    runner = web.AppRunner(make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+metrics.describe("api_requests_total", "Запросы HTTP API по маршрутам и кодам")
+metrics.describe("api_request_seconds", "Длительность запросов HTTP API")
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    import Scripts.candle_cache as candle_cache
+    from Scripts.logger import setup_logging
+
+    parser = argparse.ArgumentParser(description="HTTP API анализа объемов")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    config = {}
+    if Path("config.json").exists():
+        with open("config.json", "r", encoding="utf-8") as f:
+            config = json.load(f)
+    setup_logging(level=config.get("LOG_LEVEL", "INFO"))
+    configure(config)
+    candle_cache.configure(config)
+    rate_limit.configure(config)
+
+    web.run_app(make_app(),
+                host=args.host or config.get("API_HOST", "127.0.0.1"),
+                port=args.port or int(config.get("API_PORT", 8080)))
@@ -0,0 +1,269 @@
+"""
+Загрузка истории свечей в локальное хранилище.
+
+Запуск из папки Work:
+    python -m Scripts.backfill --pair BTC/USDT --type SPOT --timeframe 1 \\
+        --start "01.01.2025 00:00" --end "31.01.2025 23:59" --exchange bybit
+
+Объем фрагментов сразу приводится к виду анализа бота
+(ExchangeAdapter.normalize), поэтому суммы и сводки хранилища по разным
+биржам сопоставимы. Диапазон делится на фрагменты по page_limit свечей биржи, фрагменты
+запрашиваются параллельно в пределах лимитов запросов к биржам
+(Library/rate_limit.py). Каждый загруженный фрагмент сразу сохраняется в
+папку <серия>.backfill/ рядом с архивом серии вместе с checkpoint.json,
+поэтому после сбоя та же команда загружает только недостающие фрагменты.
+Затем фрагменты объединяются с серией в хранилище
+(Scripts/candle_storage.py), а серия проверяется на непрерывность:
+пропуски и свечи вне сетки таймфрейма выводятся в отчете. С --compress
+серия после загрузки сжимается; сжатая серия дописывается без распаковки
+целиком.
+"""
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from Library import rate_limit
+import Scripts.candle_storage as storage
+from Scripts.exchanges import get_adapter, get_adapters
+from Scripts.logger import log_warning
+
+
+# Количество параллельных запросов фрагментов на биржу
+WORKERS = 4
+# Повторы запроса фрагмента при сетевых ошибках и задержка перед ними
+RETRIES = 3
+RETRY_DELAY = 1.0
+# Файл описания загрузки в папке фрагментов
+CHECKPOINT_FILENAME = "checkpoint.json"
+# Сколько пропусков выводить в отчете
+MAX_GAPS_SHOWN = 10
+
+
+def plan_chunks(start: int, end: int, step_ms: int, page: int):
+    """ Делит диапазон [start, end] на фрагменты не более page свечей """
+    span = step_ms * page
+    return [(chunk_start, min(chunk_start + span - step_ms, end))
+            for chunk_start in range(start, end + 1, span)]
+
+
+def prepare_staging(directory: str, checkpoint: dict):
+    """
+        Готовит папку фрагментов. Если в ней загрузка с другими
+        параметрами, фрагменты удаляются. Возвращает время начала
+        уже загруженных фрагментов.
+    """
+    path = os.path.join(directory, CHECKPOINT_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = None
+    if saved != checkpoint:
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    if saved != checkpoint:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    return {int(name[:-4]) for name in os.listdir(directory)
+            if name.endswith(".npy")}
+
+
+def normalize_volume(adapter, type_of_trade: str, data):
+    """ Исправляет объем свечей массива (N, 6) так же, как анализ бота """
+    df = pd.DataFrame({"volume": data[:, 5]})
+    data[:, 5] = adapter.normalize(df, type_of_trade)["volume"].to_numpy()
+    return data
+
+
+def fetch_chunk(adapter, trading_pair: str, type_of_trade: str,
+                timeframe: str, chunk, directory: str):
+    """ Загружает фрагмент и сохраняет его в папку; возвращает число свечей """
+    chunk_start, chunk_end = chunk
+    limit = adapter.page_limit
+    for attempt in range(RETRIES + 1):
+        try:
+            candles = adapter.fetch_history(trading_pair, type_of_trade,
+                                            timeframe, chunk_start, chunk_end,
+                                            limit)
+            break
+        except (ConnectionError, rate_limit.RateLimitExceeded) as e:
+            if attempt == RETRIES:
+                raise
+            log_warning(f"Повтор фрагмента {chunk_start} {adapter.name}: {e}")
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+    if candles is None:
+        raise ValueError(f"Ошибка валидации запроса к {adapter.title}")
+
+    data = normalize_volume(adapter, type_of_trade,
+                            storage.to_array(candles))
+    # Фрагмент появляется в папке только целиком
+    path = os.path.join(directory, f"{chunk_start}.npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, data)
+    os.replace(path + ".tmp", path)
+    return len(data)
+
+
+def merge_staging(directory: str, exchange: str, type_of_trade: str,
+                  trading_pair: str, timeframe: str):
+    """ Добавляет загруженные фрагменты в серию хранилища """
+    arrays = [np.load(os.path.join(directory, name))
+              for name in sorted(os.listdir(directory))
+              if name.endswith(".npy")]
+    if not arrays:
+        return 0
+    return storage.write_candles(exchange, type_of_trade, trading_pair,
+                                 timeframe, storage.merge_arrays(*arrays))
+
+
+def backfill_series(adapter, trading_pair: str, type_of_trade: str,
+                    timeframe: str, start: int, end: int,
+                    workers: int = WORKERS, log=print):
+    """ Загружает серию одной биржи и возвращает отчет о загрузке """
+    started = time.perf_counter()
+    step_ms = storage.TIMEFRAME_MS[timeframe]
+    chunks = plan_chunks(start, end, step_ms, adapter.page_limit)
+    directory = storage.series_path(adapter.name, type_of_trade,
+                                    trading_pair, timeframe) + ".backfill"
+    done = prepare_staging(directory, {
+        "exchange": adapter.name, "pair": trading_pair, "type": type_of_trade,
+        "timeframe": timeframe, "start": start, "end": end,
+        "page_limit": adapter.page_limit,
+        # Фрагменты другой версии хранилища загружаются заново
+        "version": storage.VERSION,
+    })
+    pending = [chunk for chunk in chunks if chunk[0] not in done]
+    log(f"{adapter.title}: фрагментов {len(chunks)}, "
+        f"уже загружено {len(chunks) - len(pending)}")
+
+    fetched, failed = 0, []
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix=f"backfill-{adapter.name}") as pool:
+        futures = {pool.submit(fetch_chunk, adapter, trading_pair,
+                               type_of_trade, timeframe, chunk, directory): chunk
+                   for chunk in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            try:
+                fetched += future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                log_warning(f"Фрагмент {futures[future][0]} {adapter.name} "
+                            f"не загружен: {e}")
+            if count % 50 == 0 or count == len(futures):
+                log(f"{adapter.title}: {count}/{len(futures)} фрагментов")
+
+    # Загруженные фрагменты добавляются в серию даже при ошибках,
+    # папка удаляется только после загрузки всех фрагментов
+    total = merge_staging(directory, adapter.name, type_of_trade,
+                          trading_pair, timeframe)
+    if not failed:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    timestamps = storage.read_columns(adapter.name, type_of_trade, trading_pair,
+                                      timeframe, start, end,
+                                      ("timestamp",))["timestamp"]
+    return {
+        "exchange": adapter.name,
+        "chunks": len(chunks),
+        "fetched_chunks": len(pending) - len(failed),
+        "failed_chunks": sorted(chunk[0] for chunk in failed),
+        "fetched_candles": fetched,
+        "series_candles": total,
+        "range_candles": len(timestamps),
+        "expected_candles": (end - start) // step_ms + 1,
+        "gaps": storage.find_gaps(timestamps, step_ms, start, end),
+        "misaligned": storage.misaligned(timestamps, step_ms),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def format_report(report: dict):
+    """ Текст отчета о загрузке серии """
+    from datetime import datetime
+
+    def readable(ms):
+        return datetime.fromtimestamp(ms / 1000).strftime("%d.%m.%Y %H:%M")
+
+    seconds = report["seconds"]
+    rate = report["fetched_candles"] / seconds if seconds else 0
+    lines = [
+        f"{report['exchange']}: свечей в диапазоне {report['range_candles']} "
+        f"из {report['expected_candles']}, загружено {report['fetched_candles']} "
+        f"за {seconds:.1f} с ({rate:.0f} свечей/с)"
+    ]
+    if report["failed_chunks"]:
+        lines.append(f"  не загружено фрагментов: {len(report['failed_chunks'])} "
+                     f"(повторите команду, чтобы догрузить)")
+    if report["gaps"]:
+        lines.append(f"  пропусков: {len(report['gaps'])}")
+        for gap_start, gap_end in report["gaps"][:MAX_GAPS_SHOWN]:
+            lines.append(f"    {readable(gap_start)} - {readable(gap_end)}")
+    else:
+        lines.append("  серия непрерывна")
+    if report["misaligned"]:
+        lines.append(f"  свечей вне сетки таймфрейма: {len(report['misaligned'])}")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+
+    from Scripts.user_func import time_to_ms
+
+    parser = argparse.ArgumentParser(
+        description="Загрузка истории свечей в локальное хранилище")
+    parser.add_argument("--exchange", default="all",
+                        help="биржи через запятую или all")
+    parser.add_argument("--pair", required=True, help="торговая пара, BTC/USDT")
+    parser.add_argument("--type", default="SPOT",
+                        choices=("SPOT", "FUTURES", "PERPETUAL FUTURES"))
+    parser.add_argument("--timeframe", default="1",
+                        choices=tuple(storage.TIMEFRAME_MS))
+    parser.add_argument("--start", required=True,
+                        help="ДД.ММ.ГГГГ ЧЧ:ММ или время в мс")
+    parser.add_argument("--end", required=True,
+                        help="ДД.ММ.ГГГГ ЧЧ:ММ или время в мс")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="параллельных запросов на биржу")
+    parser.add_argument("--compress", action="store_true",
+                        help="сжать серии после загрузки (Scripts/candle_codec.py)")
+    parser.add_argument("--float32-volume", action="store_true",
+                        help="при сжатии хранить объем во float32")
+    args = parser.parse_args()
+
+    start, end = time_to_ms(args.start), time_to_ms(args.end)
+    if end < start:
+        parser.error("время окончания раньше времени начала")
+    if args.exchange == "all":
+        adapters = get_adapters()
+    else:
+        adapters = [get_adapter(name.strip()) for name in args.exchange.split(",")]
+
+    # Биржи загружаются одновременно: лимиты запросов у каждой свои
+    with ThreadPoolExecutor(max_workers=len(adapters)) as pool:
+        futures = [pool.submit(backfill_series, adapter, args.pair.upper(),
+                               args.type, args.timeframe, start, end,
+                               args.workers)
+                   for adapter in adapters]
+    for adapter, future in zip(adapters, futures):
+        try:
+            print(format_report(future.result()))
+        except Exception as e:
+            print(f"Ошибка загрузки: {e}")
+            continue
+        if args.compress:
+            sizes = storage.compress_series(adapter.name, args.type,
+                                            args.pair.upper(), args.timeframe,
+                                            args.float32_volume)
+            if sizes is not None:
+                print(f"  сжато: {sizes[0] / 2**20:.1f} МБ -> "
+                      f"{sizes[1] / 2**20:.1f} МБ ({sizes[0] / sizes[1]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Пакетные отчеты по объемам для списка торговых пар.
+
+Запуск из папки Work:
+    python -m Scripts.batch_report manifest.csv --output Output/reports
+
+Манифест - CSV с колонками pair, type, timeframe, candles (или start и
+end в формате ДД.ММ.ГГГГ ЧЧ:ММ) либо JSON-список объектов с теми же
+ключами. Пустые type и candles берутся из параметров командной строки,
+пустой timeframe - из --timeframes; в колонке timeframe можно перечислить
+несколько таймфреймов через пробел.
+
+Свечи запрашиваются в основном процессе пулом потоков через общий кеш
+свечей и лимиты запросов к биржам, а индикаторы и графики считаются в
+пуле процессов. Каждая задача пишет графики, таблицу data.csv и
+report.json в свою папку <output>/<пара>_<тип>_<таймфрейм>_<свечи>/.
+Задачи с успешным report.json при повторном запуске пропускаются, поэтому
+прерванный прогон продолжается той же командой. В конце пишется
+summary.csv (и summary.parquet при --parquet, нужен pyarrow).
+"""
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+
+# Параметры задачи по умолчанию
+DEFAULT_TYPE = "SPOT"
+DEFAULT_TIMEFRAMES = ("60",)
+DEFAULT_CANDLES = 200
+# Количество потоков для запросов свечей
+FETCH_WORKERS = 8
+# Файл результата задачи и сводные файлы
+REPORT_FILENAME = "report.json"
+SUMMARY_FILENAME = "summary.csv"
+PARQUET_FILENAME = "summary.parquet"
+# Поля задачи в начале каждой строки сводки
+JOB_FIELDS = ("pair", "type", "timeframe", "candles", "start", "end")
+
+
+def load_manifest(path: str, trade_type: str = DEFAULT_TYPE,
+                  timeframes=DEFAULT_TIMEFRAMES, candles: int = DEFAULT_CANDLES):
+    """ Читает манифест и возвращает список задач """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        row = {key.strip().lower(): str(value).strip()
+               for key, value in row.items() if key and value is not None}
+        pair = row.get("pair", "").upper()
+        if not pair:
+            continue
+        start, end = row.get("start") or None, row.get("end") or None
+        for timeframe in (row.get("timeframe") or " ".join(timeframes)).split():
+            jobs.append({
+                "pair": pair,
+                "type": (row.get("type") or trade_type).upper(),
+                "timeframe": timeframe,
+                # Диапазон времени заменяет количество свечей
+                "candles": None if start else int(row.get("candles") or candles),
+                "start": start,
+                "end": end,
+            })
+    return jobs
+
+
+def job_name(job: dict):
+    """ Имя папки задачи, например BTC-USDT_spot_60_200 """
+    pair = job["pair"].replace("/", "-")
+    trade_type = job["type"].lower().replace(" ", "_")
+    if job["candles"] is not None:
+        size = str(job["candles"])
+    else:
+        from Scripts.user_func import time_to_ms
+
+        size = "-".join(str(time_to_ms(value))
+                        for value in (job["start"], job["end"]))
+    return f"{pair}_{trade_type}_{job['timeframe']}_{size}"
+
+
+def load_report(directory: str):
+    """ Возвращает сохраненный результат задачи или None """
+    try:
+        with open(os.path.join(directory, REPORT_FILENAME), "r",
+                  encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_report(directory: str, report: dict):
+    """ Сохраняет результат задачи; файл появляется только целиком """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, REPORT_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def fetch_job(job: dict):
+    """ Запрашивает свечи задачи у всех бирж (в основном процессе) """
+    import Scripts.user_func as user_func
+
+    if job["candles"] is not None:
+        return user_func.fetch_candles_numbers_candles(
+            job["pair"], job["type"], job["timeframe"], str(job["candles"]))
+    return user_func.fetch_candles_range(
+        job["pair"], job["type"], job["timeframe"],
+        user_func.time_to_ms(job["start"]), user_func.time_to_ms(job["end"]))
+
+
+def init_worker():
+    """ Загружает модули анализа в процессе пула """
+    import Scripts.user_func  # noqa: F401 - pandas, numpy, matplotlib
+
+
+def render_job(job: dict, candles: dict, directory: str):
+    """ Считает индикаторы, строит графики и таблицу задачи (в пуле процессов) """
+    import Scripts.create_graphs as graphs
+    import Scripts.user_func as user_func
+
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    frames, profiles = user_func.analysis_data(candles, job["type"])
+
+    # Процесс выполняет задачи по очереди, поэтому графики текущей задачи
+    # сохраняются прямо в ее папку
+    graphs.GRAPHICS_DIR = directory
+    leads = user_func.lead_lag_analysis(frames)
+    futures = user_func.submit_analysis_charts(
+        frames, profiles, pair_name=job["pair"].replace("/", "-"), leads=leads)
+    charts = [os.path.basename(future.result()[0])
+              for future in futures.values()]
+
+    user_func.aligned_frame(frames).to_csv(
+        os.path.join(directory, "data.csv"), index_label="timestamp")
+
+    # Суммарные объемы, доли бирж и последний VWAP для сводки
+    totals = {title: float(df["volume"].sum()) for title, df in frames.items()}
+    total = sum(totals.values())
+    result = {"charts": charts, "render_seconds": time.perf_counter() - started}
+    for title, df in frames.items():
+        result[f"{title}.candles"] = len(df)
+        result[f"{title}.volume"] = totals[title]
+        result[f"{title}.share"] = totals[title] / total if total else None
+        result[f"{title}.vwap"] = float(df["vwap"].iloc[-1]) if len(df) else None
+    # Лучший сдвиг и корреляция для каждой пары бирж (lead-lag)
+    for best in (leads or {}).get("best", []):
+        key = f"lead_lag.{best['metric']}.{best['first']}/{best['second']}"
+        result[f"{key}.lag"] = best["lag"]
+        result[f"{key}.corr"] = best["corr"]
+    return result
+
+
+def timed_fetch(job: dict):
+    """ Запрашивает свечи и возвращает их вместе с длительностью запроса """
+    started = time.perf_counter()
+    return fetch_job(job), time.perf_counter() - started
+
+
+def run_batch(jobs, output_dir: str, workers: int = None,
+              fetch_workers: int = FETCH_WORKERS, log=print):
+    """
+        Выполняет задачи и возвращает их результаты в порядке манифеста.
+        Задачи с успешным report.json в папке не выполняются повторно.
+    """
+    started = time.perf_counter()
+    reports = {}
+    pending = []
+    for index, job in enumerate(jobs):
+        directory = os.path.join(output_dir, job_name(job))
+        report = load_report(directory)
+        if report is not None and report.get("status") == "ok":
+            reports[index] = report
+        else:
+            pending.append((index, job, directory))
+    skipped = len(reports)
+    if skipped:
+        log(f"Пропущено готовых задач: {skipped}")
+
+    done_count = 0
+
+    def finish(index, job, directory, **fields):
+        nonlocal done_count
+        report = {field: job[field] for field in JOB_FIELDS}
+        report.update(status="error" if fields.get("error") else "ok",
+                      error=None)
+        report.update(fields)
+        write_report(directory, report)
+        reports[index] = report
+        done_count += 1
+        elapsed = time.perf_counter() - started
+        status = "ок" if report["status"] == "ok" else f"ошибка: {report['error']}"
+        log(f"[{done_count}/{len(pending)}] {job['pair']} {job['type']} "
+            f"{job['timeframe']} - {status} ({done_count / elapsed:.2f} задач/с)")
+
+    # Запросы к биржам выполняются потоками основного процесса через общий
+    # кеш и лимиты, расчеты и графики - в пуле процессов
+    context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=fetch_workers,
+                            thread_name_prefix="batch-fetch") as fetch_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=init_worker) as render_pool:
+        running = {fetch_pool.submit(timed_fetch, job): (index, job, directory, None)
+                   for index, job, directory in pending}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, job, directory, fetch_seconds = running.pop(future)
+                if fetch_seconds is None:
+                    # Свечи получены: задача передается в пул процессов
+                    try:
+                        candles, fetch_seconds = future.result()
+                    except Exception as e:
+                        finish(index, job, directory, error=str(e))
+                        continue
+                    render = render_pool.submit(render_job, job, candles, directory)
+                    running[render] = (index, job, directory, fetch_seconds)
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish(index, job, directory, error=str(e),
+                           fetch_seconds=fetch_seconds)
+                    continue
+                finish(index, job, directory, fetch_seconds=fetch_seconds,
+                       **result)
+
+    elapsed = time.perf_counter() - started
+    completed = [reports[i] for i, _, _ in pending]
+    failed = sum(1 for report in completed if report["status"] != "ok")
+    fetch_times = [r["fetch_seconds"] for r in completed if r.get("fetch_seconds")]
+    render_times = [r["render_seconds"] for r in completed if r.get("render_seconds")]
+    log(f"Выполнено задач: {len(completed)} (ошибок: {failed}, "
+        f"пропущено: {skipped}) за {elapsed:.1f} с, "
+        f"{len(completed) / elapsed if elapsed else 0:.2f} задач/с")
+    if fetch_times and render_times:
+        log(f"Среднее время: запрос свечей {sum(fetch_times) / len(fetch_times):.2f} с, "
+            f"расчет и графики {sum(render_times) / len(render_times):.2f} с")
+    return [reports[index] for index in sorted(reports)]
+
+
+def write_summary(reports, output_dir: str, parquet: bool = False):
+    """ Пишет сводку по задачам в summary.csv и при parquet - в summary.parquet """
+    import pandas as pd
+
+    rows = [{key: value for key, value in report.items() if key != "charts"}
+            for report in reports]
+    df = pd.DataFrame(rows).convert_dtypes()
+    paths = [os.path.join(output_dir, SUMMARY_FILENAME)]
+    df.to_csv(paths[0], index=False)
+    if parquet:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("Сводка Parquet не записана: не установлен пакет pyarrow")
+        else:
+            paths.append(os.path.join(output_dir, PARQUET_FILENAME))
+            df.to_parquet(paths[1], index=False)
+    return paths
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Пакетные отчеты по объемам для списка торговых пар")
+    parser.add_argument("manifest", help="CSV или JSON со списком задач")
+    parser.add_argument("--output", default="Output/reports",
+                        help="папка для отчетов")
+    parser.add_argument("--type", default=DEFAULT_TYPE,
+                        choices=("SPOT", "FUTURES", "PERPETUAL FUTURES"),
+                        help="тип торговли по умолчанию")
+    parser.add_argument("--timeframes", default=",".join(DEFAULT_TIMEFRAMES),
+                        help="таймфреймы по умолчанию через запятую")
+    parser.add_argument("--candles", type=int, default=DEFAULT_CANDLES,
+                        help="количество свечей по умолчанию")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="процессов для расчетов (по умолчанию - по числу ядер)")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS,
+                        help="потоков для запросов свечей")
+    parser.add_argument("--parquet", action="store_true",
+                        help="также записать summary.parquet")
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest, args.type,
+                         args.timeframes.split(","), args.candles)
+    os.makedirs(args.output, exist_ok=True)
+    reports = run_batch(jobs, args.output, args.workers, args.fetch_workers)
+    for path in write_summary(reports, args.output, args.parquet):
+        print(f"Сводка сохранена в {path}")
+
+
+if __name__ == "__main__":
+    main()
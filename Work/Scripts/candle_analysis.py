@@ -2,24 +2,246 @@ import numpy as np
 import pandas as pd
 
 
+# Размер блока строк ядра индикаторов: промежуточные ряды блока
+# помещаются в кеш процессора
+BLOCK_SIZE = 16_384
+# Окно скользящей средней объема, свечей
+VOLUME_WINDOW = 20
+# Ширина полос VWAP в стандартных отклонениях
+BAND_WIDTH = 2.0
+
+# Индикаторы ядра: имя -> колонки результата
+INDICATORS = {
+    "obv": ("obv",),
+    "vwap": ("vwap",),
+    "vwap_bands": ("vwap_upper", "vwap_lower"),
+    "anchored_vwap": ("anchored_vwap",),
+    "volume_ma": ("volume_ma",),
+    "relative_volume": ("relative_volume",),
+}
+# Промежуточные ряды, нужные индикаторам; каждый считается один раз на блок,
+# сколько бы индикаторов его ни использовали
+REQUIRES = {
+    "obv": ("signed_volume",),
+    "vwap": ("cum_volume", "cum_pv"),
+    "vwap_bands": ("cum_volume", "cum_pv", "cum_p2v"),
+    "anchored_vwap": ("cum_volume", "cum_pv"),
+    "volume_ma": ("cum_volume", "window"),
+    "relative_volume": ("cum_volume", "window"),
+}
+# Индикаторы анализа бота
+DEFAULT_INDICATORS = ("obv", "vwap")
+
+
+def accumulate(values, total, out):
+    # Накопленная сумма values в out с переносом total из прошлых блоков.
+    # Перенос прибавляется к первому элементу до суммирования, поэтому
+    # результат совпадает с cumsum всего ряда, а не отличается округлением
+    out[:] = values
+    out[0] += total
+    return np.cumsum(out, out=out)
+
+
+class IndicatorKernel:
+    # Рассчитывает набор индикаторов за один проход по столбцам свечей.
+    # Строки обрабатываются блоками по block_size: для блока один раз
+    # считаются общие промежуточные ряды (типичная цена, накопленные суммы
+    # объема и объема по цене), и из них в заранее выделенные массивы
+    # результата пишутся все запрошенные индикаторы. Накопленные суммы
+    # переносятся между блоками, поэтому каждый столбец читается из памяти
+    # один раз, а новый индикатор добавляет только свои операции над блоком.
+
+    def __init__(self, indicators=DEFAULT_INDICATORS, volume_window=None,
+                 band_width=None, anchor=0, block_size=None):
+        unknown = [name for name in indicators if name not in INDICATORS]
+        if unknown:
+            raise ValueError(f"Неизвестные индикаторы: {', '.join(unknown)}")
+        self.indicators = tuple(indicators)
+        self.columns = [column for name in self.indicators
+                        for column in INDICATORS[name]]
+        self.stages = {stage for name in self.indicators
+                       for stage in REQUIRES[name]}
+        self.volume_window = volume_window or VOLUME_WINDOW
+        self.band_width = BAND_WIDTH if band_width is None else band_width
+        # Позиция свечи, с которой считается привязанный VWAP
+        self.anchor = anchor
+        self.block_size = block_size or BLOCK_SIZE
+
+        # Рабочие массивы блока выделяются один раз на ядро. Перед
+        # накопленным объемом хранятся значения предыдущих volume_window
+        # свечей для скользящего окна
+        self.history = self.volume_window if "window" in self.stages else 0
+        self.scratch = {name: np.empty(self.block_size) for name in
+                        ("typical", "pv", "p2v", "cum_pv", "cum_p2v", "vwap",
+                         "signed", "spread")}
+        self.cum_volume = np.zeros(self.history + self.block_size)
+
+    def allocate(self, size: int):
+        # Массивы результата для size свечей
+        return {column: np.empty(size) for column in self.columns}
+
+    def run(self, columns: dict, out: dict = None):
+        # Считает индикаторы по столбцам high, low, close, volume.
+        # out - заранее выделенные массивы результата (см. allocate)
+        close = columns["close"]
+        volume = columns["volume"]
+        size = len(close)
+        out = out if out is not None else self.allocate(size)
+        stages = self.stages
+        s = self.scratch
+        history = self.history
+        window = self.volume_window
+
+        # Значения, переносимые между блоками
+        previous_close = shift = np.nan
+        total_volume = total_pv = total_p2v = total_obv = 0.0
+        anchor_volume = anchor_pv = 0.0
+        self.cum_volume[:history] = 0.0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for start in range(0, size, self.block_size):
+                end = min(start + self.block_size, size)
+                m = end - start
+                v = volume[start:end]
+
+                if "cum_pv" in stages:
+                    # Типичная цена (high + low + close) / 3
+                    typical = s["typical"][:m]
+                    np.add(columns["high"][start:end], columns["low"][start:end],
+                           out=typical)
+                    np.add(typical, close[start:end], out=typical)
+                    np.divide(typical, 3, out=typical)
+                    pv = s["pv"][:m]
+                    np.multiply(typical, v, out=pv)
+                    cum_pv = accumulate(pv, total_pv, s["cum_pv"][:m])
+                if "cum_p2v" in stages:
+                    # Квадраты отклонений от первой типичной цены: без сдвига
+                    # дисперсия теряет точность при ценах порядка 1e5
+                    if start == 0:
+                        shift = typical[0]
+                    p2v = s["p2v"][:m]
+                    np.subtract(typical, shift, out=p2v)
+                    np.multiply(p2v, p2v, out=p2v)
+                    np.multiply(p2v, v, out=p2v)
+                    cum_p2v = accumulate(p2v, total_p2v, s["cum_p2v"][:m])
+                if "cum_volume" in stages:
+                    cum_volume = accumulate(
+                        v, total_volume, self.cum_volume[history:history + m])
+
+                if "obv" in out:
+                    # Объем со знаком изменения цены закрытия
+                    signed = s["signed"][:m]
+                    signed[0] = close[start] - previous_close
+                    np.subtract(close[start + 1:end], close[start:end - 1],
+                                out=signed[1:])
+                    np.sign(signed, out=signed)
+                    np.multiply(signed, v, out=signed)
+                    if start == 0:
+                        signed[0] = 0.0
+                    obv = accumulate(signed, total_obv, out["obv"][start:end])
+                    total_obv = obv[-1]
+                    # У первой свечи нет изменения цены, как в pandas diff()
+                    if start == 0:
+                        obv[0] = np.nan
+                    previous_close = close[end - 1]
+
+                if "vwap" in out or "vwap_bands" in self.indicators:
+                    vwap = out["vwap"][start:end] if "vwap" in out \
+                        else s["vwap"][:m]
+                    np.divide(cum_pv, cum_volume, out=vwap)
+                if "vwap_bands" in self.indicators:
+                    # Взвешенное по объему отклонение типичной цены от VWAP
+                    spread = s["spread"][:m]
+                    np.divide(cum_p2v, cum_volume, out=spread)
+                    spread -= (vwap - shift) ** 2
+                    np.maximum(spread, 0.0, out=spread)
+                    np.sqrt(spread, out=spread)
+                    spread *= self.band_width
+                    np.add(vwap, spread, out=out["vwap_upper"][start:end])
+                    np.subtract(vwap, spread, out=out["vwap_lower"][start:end])
+
+                if "anchored_vwap" in out:
+                    anchored = out["anchored_vwap"][start:end]
+                    local = self.anchor - start
+                    if local >= m:
+                        anchored[:] = np.nan
+                    else:
+                        if local >= 0:
+                            # Суммы до свечи привязки
+                            anchor_volume = total_volume if local == 0 \
+                                else cum_volume[local - 1]
+                            anchor_pv = total_pv if local == 0 \
+                                else cum_pv[local - 1]
+                            anchored[:local] = np.nan
+                        first = max(local, 0)
+                        np.divide(cum_pv[first:] - anchor_pv,
+                                  cum_volume[first:] - anchor_volume,
+                                  out=anchored[first:])
+
+                if "window" in stages:
+                    # Сумма объема за окно - разность накопленных сумм
+                    ma = out["volume_ma"][start:end] if "volume_ma" in out \
+                        else s["spread"][:m]
+                    np.subtract(cum_volume, self.cum_volume[:m], out=ma)
+                    ma /= window
+                    if start < window - 1:
+                        ma[:window - 1 - start] = np.nan
+                    if "relative_volume" in out:
+                        np.divide(v, ma, out=out["relative_volume"][start:end])
+
+                if "cum_volume" in stages:
+                    total_volume = cum_volume[-1]
+                    # Последние значения накопленного объема переходят
+                    # в начало буфера для окна следующего блока
+                    if history:
+                        self.cum_volume[:history] = \
+                            self.cum_volume[m:m + history].copy()
+                if "cum_pv" in stages:
+                    total_pv = cum_pv[-1]
+                if "cum_p2v" in stages:
+                    total_p2v = cum_p2v[-1]
+        return out
+
+
+def anchor_position(index, anchor=None):
+    # Позиция свечи привязки VWAP в индексе времени: по умолчанию -
+    # первая свеча последних суток (00:00 UTC)
+    if len(index) == 0:
+        return 0
+    if anchor is None:
+        anchor = index[-1].normalize()
+    elif isinstance(anchor, (int, np.integer)):
+        anchor = pd.Timestamp(anchor, unit="ms")
+    return int(index.searchsorted(pd.Timestamp(anchor)))
+
+
+def calculate_indicator_set(df, indicators=DEFAULT_INDICATORS, anchor=None,
+                            **params):
+    # Рассчитывает набор индикаторов за один проход (IndicatorKernel) и
+    # добавляет их колонки в df без промежуточных колонок
+    columns = {name: df[name].to_numpy(dtype=np.float64)
+               for name in ("high", "low", "close", "volume")}
+    position = anchor_position(df.index, anchor) \
+        if "anchored_vwap" in indicators else 0
+    kernel = IndicatorKernel(indicators, anchor=position, **params)
+    for column, values in kernel.run(columns).items():
+        df[column] = values
+    return df
+
+
 def calculate_obv(df):
     # Вычисляет индикатор OBV (On-Balance Volume) на основе данных свечей
-    df['obv'] = (np.sign(df['close'].diff()) * df['volume']).cumsum()
-    return df
+    return calculate_indicator_set(df, ("obv",))
 
 
 def calculate_vwap(df):
     # Вычисляет индикатор VWAP (Volume Weighted Average Price)
-    df['typical_price'] = (df['high'] + df['low'] + df['close']) / 3
-    df['vwap'] = (df['typical_price'] * df['volume']).cumsum() / \
-        df['volume'].cumsum()
-    return df
+    return calculate_indicator_set(df, ("vwap",))
 
 
 def calculate_volume_profile(df, price_bins=20):
     # Вычисляет профиль объема для ценовых диапазонов
-    df['price_bin'] = pd.cut(df['close'], bins=price_bins)
-    volume_profile = df.groupby('price_bin', observed=False)['volume'].sum() \
+    bins = pd.cut(df['close'], bins=price_bins).rename('price_bin')
+    volume_profile = df['volume'].groupby(bins, observed=False).sum() \
         .sort_values(ascending=False)
     return volume_profile
-
@@ -0,0 +1,127 @@
+"""
+Кеш свечей бирж.
+
+Бот и HTTP API (Scripts/api.py) запрашивают свечи через fetch_candles():
+одинаковые запросы в пределах TTL_SECONDS обслуживаются из памяти, а
+одновременные одинаковые запросы объединяются в один запрос к бирже.
+Диапазоны, последняя свеча которых уже закрыта, не меняются и хранятся
+HISTORY_TTL_SECONDS. В кеше не более MAX_ENTRIES последних записей.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import Scripts.metrics as metrics
+
+
+# Время жизни последних свечей в секундах (0 - кеш отключен)
+TTL_SECONDS = 10.0
+# Время жизни закрытых диапазонов в секундах
+HISTORY_TTL_SECONDS = 3600.0
+# Максимальное количество записей
+MAX_ENTRIES = 512
+
+# Длительность свечи таймфрейма бота в секундах
+TIMEFRAME_SECONDS = {
+    '1': 60, '3': 180, '5': 300, '15': 900, '30': 1800,
+    '60': 3600, '120': 7200, '240': 14400, '360': 21600,
+    'Day': 86400, 'Week': 604800, 'Month': 2678400
+}
+
+_lock = threading.Lock()
+# ключ запроса -> (момент устаревания, свечи), в порядке использования
+_entries = OrderedDict()
+# ключ запроса -> Future выполняющегося запроса к бирже
+_inflight = {}
+
+
+def configure(config: dict):
+    """ Применяет настройки кеша из config.json """
+    global TTL_SECONDS, HISTORY_TTL_SECONDS, MAX_ENTRIES
+    TTL_SECONDS = float(config.get("CANDLE_CACHE_TTL", TTL_SECONDS))
+    HISTORY_TTL_SECONDS = float(config.get("CANDLE_CACHE_HISTORY_TTL",
+                                           HISTORY_TTL_SECONDS))
+    MAX_ENTRIES = int(config.get("CANDLE_CACHE_SIZE", MAX_ENTRIES))
+
+
+def entry_ttl(timeframe: str, end: int = None):
+    """ Время жизни записи: закрытые диапазоны хранятся дольше """
+    if TTL_SECONDS <= 0:
+        return 0.0
+    # Свеча, открытая не позже end, закрыта к моменту end + таймфрейм
+    if end is not None:
+        closed_at = end + TIMEFRAME_SECONDS.get(timeframe, 0) * 1000
+        if closed_at <= time.time() * 1000:
+            return HISTORY_TTL_SECONDS
+    return TTL_SECONDS
+
+
+def fetch_candles(adapter, trading_pair: str, type_of_trade: str,
+                  timeframe: str, limit: int = None,
+                  start: int = None, end: int = None):
+    """
+        Запрашивает свечи через adapter.fetch_candles с кешированием.
+        Возвращаемый список общий для всех получателей и не должен
+        изменяться.
+    """
+    ttl = entry_ttl(timeframe, end)
+    if ttl <= 0:
+        return adapter.fetch_candles(trading_pair, type_of_trade, timeframe,
+                                     limit=limit, start=start, end=end)
+
+    key = (adapter.name, trading_pair, type_of_trade, timeframe,
+           limit, start, end)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _entries.move_to_end(key)
+            future = None
+        else:
+            future = _inflight.get(key)
+            owner = future is None
+            if owner:
+                future = _inflight[key] = Future()
+
+    if future is None:
+        metrics.inc_counter("cache_hits_total", cache="candles",
+                            exchange=adapter.name)
+        return entry[1]
+    if not owner:
+        # Такой же запрос уже выполняется: ждем его результат
+        metrics.inc_counter("cache_hits_total", cache="candles_inflight",
+                            exchange=adapter.name)
+        return future.result()
+
+    metrics.inc_counter("cache_misses_total", cache="candles",
+                        exchange=adapter.name)
+    try:
+        candles = adapter.fetch_candles(trading_pair, type_of_trade, timeframe,
+                                        limit=limit, start=start, end=end)
+    except BaseException as e:
+        with _lock:
+            _inflight.pop(key, None)
+        future.set_exception(e)
+        raise
+
+    with _lock:
+        _inflight.pop(key, None)
+        # None - ошибка валидации, такой ответ не кешируется
+        if candles is not None:
+            _entries[key] = (time.monotonic() + ttl, candles)
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+    future.set_result(candles)
+    return candles
+
+
+def size():
+    """ Количество записей в кеше """
+    return len(_entries)
+
+
+def clear():
+    """ Очищает кеш """
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,426 @@
+"""
+Сжатый формат серий свечей.
+
+Серия делится на блоки по BLOCK_SIZE свечей, каждый блок кодируется и
+распаковывается независимо, поэтому чтение диапазона распаковывает только
+его блоки. Колонки блока:
+
+    время       первое время, шаг и разности второго порядка (для ровной
+                сетки - нули) в самом узком целом типе
+    цены        если все цены блока - десятичные с не более MAX_DECIMALS
+                знаками, то целые в единицах последнего знака: закрытие -
+                разности соседних свечей, открытие - разность с предыдущим
+                закрытием, максимум и минимум - отступ от тела свечи
+                (обычно это маленькие числа и нули)
+    объем       десятичные значения - целые с разностями соседних значений
+    иначе       биты float64 с XOR соседних значений
+    объем       при float32_volume - биты float32 с XOR (с потерей точности
+                после 7-го знака)
+
+Байты каждой колонки переставляются по разрядам (сначала все младшие
+байты, затем следующие) и сжимаются zlib: у медленно меняющихся рядов
+старшие разряды почти целиком нулевые. Распаковка - zlib и операции numpy
+над целыми колонками (cumsum, bitwise_xor.accumulate), без циклов по свечам.
+
+Файл серии: заголовок FILE_DTYPE, блоки подряд и таблица блоков
+BLOCK_TABLE_DTYPE в конце файла: первое и последнее время, число свечей,
+смещение и размер блока, а также накопленные с начала серии до конца
+блока суммы (candle_sums) и последнее закрытие. По ним суммы за диапазон
+считаются распаковкой не более двух крайних блоков.
+"""
+import os
+import zlib
+
+import numpy as np
+
+
+# Колонки серии (как в candle_storage)
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+# Свечей в блоке
+BLOCK_SIZE = 8192
+# Уровень сжатия zlib
+COMPRESSION_LEVEL = 6
+# Максимум знаков после запятой для кодирования цен целыми
+MAX_DECIMALS = 8
+# Код колонки, закодированной XOR битов
+XOR_CODE = 255
+# Колонки цен, которые кодируются относительно друг друга
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+# Заголовок файла; бит 0 флагов - объем в float32.
+# Версия 2: объем в монетах (ExchangeAdapter.normalize при загрузке)
+MAGIC = b"TGCANDZC"
+VERSION = 2
+FLAG_FLOAT32_VOLUME = 1
+FILE_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("flags", "<u4"),
+                       ("blocks", "<i8"), ("table_offset", "<i8")])
+# Суммы по свечам: число свечей, объем, объем по типичной цене (как у
+# VWAP) и объем со знаком изменения закрытия (как у OBV)
+SUMS = ("candles", "volume", "quote", "signed")
+# Таблица блоков
+BLOCK_TABLE_DTYPE = np.dtype([("first", "<i8"), ("last", "<i8"),
+                              ("count", "<i8"), ("offset", "<i8"),
+                              ("size", "<i8"), ("candles", "<f8"),
+                              ("volume", "<f8"),
+                              ("quote", "<f8"), ("signed", "<f8"),
+                              ("close", "<f8")])
+# Заголовок блока: число свечей, первое время, шаг, ширина разностей
+# времени в байтах, признак кодирования цен относительно друг друга, коды
+# колонок цен и объема (число знаков или XOR_CODE) и размеры сжатых колонок
+BLOCK_DTYPE = np.dtype([("count", "<u4"), ("t0", "<i8"), ("step", "<i8"),
+                        ("width", "u1"), ("related", "u1"),
+                        ("codes", "u1", (5,)), ("sizes", "<u4", (6,))])
+
+
+class UnsupportedVersion(ValueError):
+    """ Серия записана другой версией формата и должна быть загружена заново """
+
+    def __init__(self, path: str, version: int):
+        super().__init__(f"Неподдерживаемая версия серии {path}: {version}. "
+                         f"Удалите серию и загрузите ее заново "
+                         f"(python -m Scripts.backfill)")
+        self.path = path
+        self.version = version
+
+
+def shuffle(values):
+    """ Переставляет байты массива по разрядам и сжимает их """
+    planes = values.view(np.uint8).reshape(len(values), values.itemsize).T
+    return zlib.compress(planes.tobytes(), COMPRESSION_LEVEL)
+
+
+def unshuffle(payload: bytes, dtype, count: int):
+    """ Распаковывает и возвращает байты массива на места """
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+    return planes.reshape(dtype.itemsize, count).T.copy().view(dtype).ravel()
+
+
+def narrowest_int(values):
+    """ Самый узкий знаковый целый тип, вмещающий значения """
+    if len(values) == 0:
+        return np.dtype("<i1")
+    low, high = values.min(), values.max()
+    for dtype in ("<i1", "<i2", "<i4"):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype("<i8")
+
+
+def encode_timestamps(timestamps):
+    """ Время: (первое время, шаг, ширина, сжатые разности второго порядка) """
+    timestamps = timestamps.astype(np.int64)
+    deltas = np.diff(timestamps)
+    step = int(deltas[0]) if len(deltas) else 0
+    dod = np.diff(deltas, prepend=step)
+    dtype = narrowest_int(dod)
+    return int(timestamps[0]), step, dtype.itemsize, shuffle(dod.astype(dtype))
+
+
+def decode_timestamps(t0: int, step: int, width: int, payload: bytes, count: int):
+    """ Восстанавливает время свечей блока """
+    dod = unshuffle(payload, f"<i{width}", count - 1).astype(np.int64)
+    timestamps = np.empty(count, dtype=np.int64)
+    timestamps[0] = t0
+    np.cumsum(np.cumsum(dod) + step, out=timestamps[1:])
+    timestamps[1:] += t0
+    return timestamps
+
+
+def decimal_places(values):
+    """
+        Минимальное число знаков после запятой, при котором значения
+        восстанавливаются из целых без потерь, или None
+    """
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        scaled = np.round(values * scale)
+        if np.abs(scaled).max(initial=0) >= 2 ** 53:
+            return None
+        if np.array_equal(scaled / scale, values):
+            return decimals
+    return None
+
+
+def encode_floats(values, float32: bool = False):
+    """ Цены или объем: (код колонки, сжатые данные) """
+    if not float32:
+        decimals = decimal_places(values)
+        if decimals is not None:
+            scaled = np.round(values * 10.0 ** decimals).astype(np.int64)
+            return decimals, shuffle(np.diff(scaled, prepend=0))
+    bits = values.astype(np.float32 if float32 else np.float64)
+    bits = bits.view(np.uint32 if float32 else np.uint64)
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    return XOR_CODE, shuffle(xored)
+
+
+def decode_floats(code: int, payload: bytes, count: int, float32: bool = False):
+    """ Восстанавливает цены или объем блока как float64 """
+    if code != XOR_CODE:
+        scaled = np.cumsum(unshuffle(payload, "<i8", count))
+        return scaled / 10.0 ** code
+    dtype = np.dtype("<u4" if float32 else "<u8")
+    bits = np.bitwise_xor.accumulate(unshuffle(payload, dtype, count))
+    return bits.view(np.float32 if float32 else np.float64).astype(np.float64)
+
+
+def candle_sums(columns: dict, previous_close: float = None):
+    """
+        Слагаемые сумм по свечам массивом (N, 4) в порядке SUMS.
+        previous_close - закрытие свечи перед первой; без него знак первой
+        свечи нулевой, как у OBV в начале ряда
+    """
+    high, low, close, volume = (np.asarray(columns[name], dtype=np.float64)
+                                for name in ("high", "low", "close", "volume"))
+    if len(close) == 0:
+        return np.empty((0, len(SUMS)))
+    before = np.empty_like(close)
+    before[0] = close[0] if previous_close is None else previous_close
+    before[1:] = close[:-1]
+    return np.column_stack([np.ones_like(volume), volume,
+                            (high + low + close) / 3 * volume,
+                            np.sign(close - before) * volume])
+
+
+def encode_prices(columns: dict):
+    """
+        Цены блока относительно друг друга: (число знаков, {колонка: сжатые
+        данные}) или None, если цены не десятичные
+    """
+    prices = {name: np.asarray(columns[name], dtype=np.float64)
+              for name in PRICE_COLUMNS}
+    decimals = [decimal_places(values) for values in prices.values()]
+    if None in decimals:
+        return None
+    decimals = max(decimals)
+    scaled = {name: np.round(values * 10.0 ** decimals).astype(np.int64)
+              for name, values in prices.items()}
+    open_, high, low, close = (scaled[name] for name in PRICE_COLUMNS)
+    body_top, body_bottom = np.maximum(open_, close), np.minimum(open_, close)
+    residuals = {
+        "open": open_ - np.concatenate(([0], close[:-1])),
+        "high": high - body_top,
+        "low": body_bottom - low,
+        "close": np.diff(close, prepend=0),
+    }
+    return decimals, {name: shuffle(values) for name, values in residuals.items()}
+
+
+def decode_prices(decimals: int, payloads: dict, count: int):
+    """ Восстанавливает цены блока, закодированные encode_prices """
+    residuals = {name: unshuffle(payload, "<i8", count)
+                 for name, payload in payloads.items()}
+    close = np.cumsum(residuals["close"])
+    open_ = residuals["open"].copy()
+    open_[1:] += close[:-1]
+    scale = 10.0 ** decimals
+    return {
+        "open": open_ / scale,
+        "high": (np.maximum(open_, close) + residuals["high"]) / scale,
+        "low": (np.minimum(open_, close) - residuals["low"]) / scale,
+        "close": close / scale,
+    }
+
+
+def encode_block(columns: dict, float32_volume: bool = False):
+    """ Кодирует блок свечей {колонка: массив} в байты """
+    count = len(columns["timestamp"])
+    t0, step, width, payload = encode_timestamps(columns["timestamp"])
+    payloads = {"timestamp": payload}
+    codes = {}
+    prices = encode_prices(columns)
+    if prices is not None:
+        for name in PRICE_COLUMNS:
+            codes[name] = prices[0]
+        payloads.update(prices[1])
+    for name in COLUMNS[1:]:
+        if name not in payloads:
+            codes[name], payloads[name] = encode_floats(
+                np.asarray(columns[name], dtype=np.float64),
+                float32_volume and name == "volume")
+    header = np.array([(count, t0, step, width, prices is not None,
+                        [codes[name] for name in COLUMNS[1:]],
+                        [len(payloads[name]) for name in COLUMNS])],
+                      dtype=BLOCK_DTYPE)
+    return header.tobytes() + b"".join(payloads[name] for name in COLUMNS)
+
+
+def decode_block(data: bytes, float32_volume: bool = False, columns=COLUMNS):
+    """ Распаковывает блок в словарь {колонка: массив} """
+    header = np.frombuffer(data, dtype=BLOCK_DTYPE, count=1)[0]
+    count = int(header["count"])
+    offsets = BLOCK_DTYPE.itemsize + np.concatenate(
+        ([0], np.cumsum(header["sizes"], dtype=np.int64)))
+    payloads = {name: data[offsets[position]:offsets[position + 1]]
+                for position, name in enumerate(COLUMNS)}
+    codes = dict(zip(COLUMNS[1:], header["codes"].tolist()))
+
+    result = {}
+    if "timestamp" in columns:
+        result["timestamp"] = decode_timestamps(
+            int(header["t0"]), int(header["step"]), int(header["width"]),
+            payloads["timestamp"], count)
+    if header["related"] and set(PRICE_COLUMNS) & set(columns):
+        # Цены кодированы относительно друг друга и распаковываются вместе
+        prices = decode_prices(codes["close"], {name: payloads[name]
+                                                for name in PRICE_COLUMNS}, count)
+        result.update((name, prices[name]) for name in PRICE_COLUMNS
+                      if name in columns)
+    for name in COLUMNS[1:]:
+        if name in columns and name not in result:
+            result[name] = decode_floats(codes[name], payloads[name], count,
+                                         float32_volume and name == "volume")
+    return result
+
+
+def table_row(columns: dict, previous=None):
+    """
+        Строка таблицы для блока свечей: время, число свечей и накопленные
+        суммы; previous - строка предыдущего блока
+    """
+    row = np.zeros(1, dtype=BLOCK_TABLE_DTYPE)[0]
+    timestamps = columns["timestamp"]
+    row["first"], row["last"], row["count"] = \
+        timestamps[0], timestamps[-1], len(timestamps)
+    sums = candle_sums(columns, None if previous is None
+                       else float(previous["close"])).sum(axis=0)
+    for position, name in enumerate(SUMS):
+        row[name] = sums[position] + (0 if previous is None else previous[name])
+    row["close"] = columns["close"][-1]
+    return row
+
+
+def write_file(path: str, columns: dict, float32_volume: bool = False,
+               blocks=()):
+    """
+        Атомарно записывает сжатый файл серии. blocks - уже закодированные
+        блоки начала серии (байты, строка таблицы), которые копируются как есть
+    """
+    count = len(columns["timestamp"])
+    blocks = list(blocks)
+    for first in range(0, count, BLOCK_SIZE):
+        part = {name: values[first:first + BLOCK_SIZE]
+                for name, values in columns.items()}
+        blocks.append((encode_block(part, float32_volume),
+                       table_row(part, blocks[-1][1] if blocks else None)))
+
+    table = np.array([row for _, row in blocks], dtype=BLOCK_TABLE_DTYPE)
+    offset = FILE_DTYPE.itemsize
+    for row, (data, _) in zip(table, blocks):
+        row["offset"], row["size"] = offset, len(data)
+        offset += len(data)
+    header = np.array([(MAGIC, VERSION,
+                        FLAG_FLOAT32_VOLUME if float32_volume else 0,
+                        len(blocks), offset)], dtype=FILE_DTYPE)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(header.tobytes())
+        for data, _ in blocks:
+            f.write(data)
+        f.write(table.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class CompressedSeries:
+    """ Сжатый файл серии: таблица блоков в памяти, блоки читаются по запросу """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(FILE_DTYPE.itemsize), dtype=FILE_DTYPE)
+            if len(header) == 0 or header["magic"][0] != MAGIC:
+                raise ValueError(f"{path} не является сжатой серией свечей")
+            if header["version"][0] != VERSION:
+                raise UnsupportedVersion(path, int(header["version"][0]))
+            self.float32_volume = bool(header["flags"][0] & FLAG_FLOAT32_VOLUME)
+            f.seek(int(header["table_offset"][0]))
+            self.table = np.frombuffer(
+                f.read(BLOCK_TABLE_DTYPE.itemsize * int(header["blocks"][0])),
+                dtype=BLOCK_TABLE_DTYPE)
+
+    def __len__(self):
+        return int(self.table["count"].sum())
+
+    def last_timestamp(self):
+        """ Время последней свечи серии или None """
+        return int(self.table["last"][-1]) if len(self.table) else None
+
+    def block_range(self, start: int = None, end: int = None):
+        """ Номера блоков [first, last), в которые попадает [start, end] """
+        first = 0 if start is None else \
+            int(np.searchsorted(self.table["last"], start, "left"))
+        last = len(self.table) if end is None else \
+            int(np.searchsorted(self.table["first"], end, "right"))
+        return first, max(first, last)
+
+    def raw_blocks(self, first: int, last: int):
+        """ Закодированные блоки [first, last) с их строками таблицы """
+        if first >= last:
+            return []
+        rows = self.table[first:last]
+        with open(self.path, "rb") as f:
+            f.seek(int(rows["offset"][0]))
+            data = f.read(int(rows["size"].sum()))
+        offsets = np.concatenate(([0], np.cumsum(rows["size"])))
+        offsets = offsets.astype(np.int64)
+        return [(data[offsets[i]:offsets[i + 1]], row.copy())
+                for i, row in enumerate(rows)]
+
+    def read(self, start: int = None, end: int = None, columns=COLUMNS):
+        """
+            Свечи с временем открытия в [start, end] (мс) словарем
+            {колонка: массив}; распаковываются только блоки диапазона
+        """
+        first, last = self.block_range(start, end)
+        decoded = [decode_block(data, self.float32_volume,
+                                set(columns) | {"timestamp"})
+                   for data, _ in self.raw_blocks(first, last)]
+        if not decoded:
+            return {name: np.empty(0, dtype=np.int64 if name == "timestamp"
+                                   else np.float64) for name in columns}
+        timestamps = np.concatenate([block["timestamp"] for block in decoded])
+        low = 0 if start is None else int(np.searchsorted(timestamps, start, "left"))
+        high = len(timestamps) if end is None else \
+            int(np.searchsorted(timestamps, end, "right"))
+        return {name: np.concatenate([block[name] for block in decoded])[low:high]
+                for name in columns}
+
+    def prefix(self, timestamp: int, side: str):
+        """
+            Накопленные с начала серии суммы SUMS по свечам с временем
+            открытия < timestamp (side="left") или <= timestamp
+            (side="right"). Распаковывается не более одного блока
+        """
+        block = int(np.searchsorted(self.table["last"], timestamp, side))
+        before = np.zeros(len(SUMS)) if block == 0 else \
+            np.array([self.table[name][block - 1] for name in SUMS])
+        if block == len(self.table) or timestamp < self.table["first"][block] or \
+                (side == "left" and timestamp == self.table["first"][block]):
+            return before
+        # Граница внутри блока: суммы по его началу
+        data, _ = self.raw_blocks(block, block + 1)[0]
+        columns = decode_block(data, self.float32_volume)
+        position = int(np.searchsorted(columns["timestamp"], timestamp, side))
+        previous_close = float(self.table["close"][block - 1]) if block else None
+        return before + candle_sums({name: values[:position] for name, values
+                                     in columns.items()},
+                                    previous_close).sum(axis=0)
+
+    def sums(self, start: int = None, end: int = None):
+        """
+            Суммы SUMS по свечам с временем открытия в [start, end] (мс):
+            разность двух накопленных сумм
+        """
+        if not len(self.table) or \
+                (start is not None and end is not None and start > end):
+            return dict.fromkeys(SUMS, 0.0)
+        low = self.prefix(start, "left") if start is not None else np.zeros(len(SUMS))
+        high = self.prefix(end, "right") if end is not None else \
+            np.array([self.table[name][-1] for name in SUMS])
+        return dict(zip(SUMS, (high - low).tolist()))
@@ -0,0 +1,633 @@
+"""
+Локальное хранилище свечей.
+
+Свечи одной серии (биржа, тип торговли, торговая пара, таймфрейм) хранятся
+в колоночном архиве - папке <STORAGE_DIR>/<биржа>/<тип>/<пара>/<таймфрейм>/:
+
+    header.bin      заголовок: сигнатура, версия, число свечей, шаг индекса
+    timestamp.i64   время открытия свечей в мс (int64, little-endian)
+    open.f64 ... volume.f64
+                    цены и объем (float64, little-endian)
+    index.i64       время каждой INDEX_STEP-й свечи
+    cum_volume.f64, cum_quote.f64, cum_signed.f64
+                    накопленные с начала серии объем, объем по типичной
+                    цене (как у VWAP) и объем со знаком изменения закрытия
+                    (как у OBV)
+    hour_start.i64, hour_volume.f64, hour_end.i64
+                    почасовая сводка: начало часа в мс, объем свечей часа
+                    и число свечей серии по конец часа включительно
+
+Свечи лежат по возрастанию времени без повторов. Колонки открываются через
+np.memmap, поэтому чтение диапазона - это двоичный поиск по индексу и
+времени и срез без копирования: годовая серия минутных свечей открывается
+мгновенно, а память тратится только на прочитанные страницы. Суммы за
+любой диапазон (aggregate: объем, VWAP, изменение OBV) - разность двух
+значений накопленных сумм, без чтения самих свечей. Почасовая сводка
+(hourly_volume) дописывается вместе со свечами: окно в 90 дней минутных
+свечей - около 2160 строк сводки вместо 130 тысяч свечей.
+
+Новые свечи после последней дописываются в конец колонок; заголовок с
+числом свечей обновляется последним, поэтому недописанный хвост после
+сбоя не виден и отрезается при следующей записи. Свечи внутри или раньше
+серии объединяются с ней перезаписью архива в новую папку.
+
+Архив можно сжать (compress_series, python -m Scripts.backfill --compress)
+в файл <таймфрейм>.zc формата Scripts/candle_codec.py: он в несколько раз
+меньше, диапазон распаковывается по независимым блокам. Сжатая серия
+остается сжатой и при дозаписи свечей.
+
+Свечи хранятся в том виде, в котором их видит анализ бота: объем уже
+исправлен ExchangeAdapter.normalize (у срочных контрактов OKX - в монетах,
+а не в контрактах), поэтому объемы, доли и VWAP разных бирж в суммах и
+сводке сопоставимы. Заполняется командой Scripts/backfill.py.
+"""
+import os
+import shutil
+
+import numpy as np
+
+import Scripts.candle_codec as codec
+
+
+# Папка хранилища
+STORAGE_DIR = "Output/candles"
+# Колонки серии
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+# Тип данных колонок: время - int64, цены и объем - float64
+COLUMN_DTYPES = {name: np.dtype("<f8") for name in COLUMNS}
+COLUMN_DTYPES["timestamp"] = np.dtype("<i8")
+# Накопленные суммы codec.SUMS (кроме числа свечей - это номер свечи)
+SUM_COLUMNS = ("cum_volume", "cum_quote", "cum_signed")
+COLUMN_DTYPES.update((name, np.dtype("<f8")) for name in SUM_COLUMNS)
+# Почасовая сводка: начало часа, объем, число свечей серии по конец часа
+HOURLY_COLUMNS = ("hour_start", "hour_volume", "hour_end")
+COLUMN_DTYPES.update(hour_start=np.dtype("<i8"), hour_volume=np.dtype("<f8"),
+                     hour_end=np.dtype("<i8"))
+
+# Файлы архива
+HEADER_FILENAME = "header.bin"
+INDEX_FILENAME = "index.i64"
+# Заголовок архива. Версия 2: объем в монетах (ExchangeAdapter.normalize
+# при загрузке), архивы версии 1 с объемом бирж загружаются заново
+MAGIC = b"TGCANDLE"
+VERSION = 2
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"),
+                         ("index_step", "<u4"), ("count", "<i8")])
+# Через сколько свечей записывается время в индекс
+INDEX_STEP = 4096
+# Длительность часа в мс
+HOUR_MS = 3_600_000
+
+# Длительность свечи таймфрейма бота в мс (таймфреймы постоянной длины)
+TIMEFRAME_MS = {
+    '1': 60_000, '3': 180_000, '5': 300_000, '15': 900_000,
+    '30': 1_800_000, '60': 3_600_000, '120': 7_200_000,
+    '240': 14_400_000, '360': 21_600_000,
+    'Day': 86_400_000, 'Week': 604_800_000
+}
+
+
+def series_path(exchange: str, type_of_trade: str, trading_pair: str,
+                timeframe: str):
+    """ Путь к папке архива серии """
+    return os.path.join(STORAGE_DIR, exchange,
+                        type_of_trade.lower().replace(" ", "_"),
+                        trading_pair.replace("/", "-"), timeframe)
+
+
+def compressed_path(exchange: str, type_of_trade: str, trading_pair: str,
+                    timeframe: str):
+    """ Путь к сжатому файлу серии """
+    return series_path(exchange, type_of_trade, trading_pair, timeframe) + ".zc"
+
+
+def column_filename(name: str):
+    """ Имя файла колонки, например open.f64 """
+    return f"{name}.{COLUMN_DTYPES[name].kind}{COLUMN_DTYPES[name].itemsize * 8}"
+
+
+def to_array(candles):
+    """ Свечи в массив (N, 6): время в мс и OHLCV как float64 """
+    if len(candles) == 0:
+        return np.empty((0, len(COLUMNS)))
+    return np.array([[float(value) for value in candle[:6]]
+                     for candle in candles])
+
+
+def hourly_rollup(timestamps, volume):
+    """
+        Почасовая сводка свечей по возрастанию времени: (начала часов в мс,
+        объем часа, число свечей часа)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0),
+                np.empty(0, dtype=np.int64))
+    hours = timestamps // HOUR_MS
+    # Свечи отсортированы, поэтому свечи часа идут подряд
+    starts = np.flatnonzero(np.diff(hours, prepend=hours[0] - 1))
+    volumes = np.add.reduceat(np.asarray(volume, dtype=np.float64), starts)
+    counts = np.diff(np.append(starts, len(hours)))
+    return hours[starts] * HOUR_MS, volumes, counts
+
+
+def hour_bounds(start: int = None, end: int = None):
+    """ Границы свечей часов, начало которых в [start, end] (мс) """
+    return (None if start is None else start // HOUR_MS * HOUR_MS,
+            None if end is None else end // HOUR_MS * HOUR_MS + HOUR_MS - 1)
+
+
+def merge_arrays(*arrays):
+    """ Объединяет массивы свечей: по возрастанию времени, без повторов """
+    data = np.concatenate([a for a in arrays if len(a)] or
+                          [np.empty((0, len(COLUMNS)))])
+    # При повторе времени остается последняя запись (более свежие данные)
+    order = np.argsort(data[:, 0], kind="stable")[::-1]
+    _, first = np.unique(data[order, 0], return_index=True)
+    return data[order[first]]
+
+
+class CandleArchive:
+    """ Колоночный архив свечей одной серии, открытый только для чтения """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count, self.index_step = read_header(path)
+        # Индекс небольшой (одна запись на INDEX_STEP свечей) и читается целиком
+        self.index = np.fromfile(os.path.join(path, INDEX_FILENAME),
+                                 dtype=COLUMN_DTYPES["timestamp"],
+                                 count=-(-self.count // self.index_step))
+        self._columns = {}
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name: str):
+        """ Колонка архива целиком как np.memmap (без чтения с диска) """
+        if name not in self._columns:
+            if self.count == 0:
+                self._columns[name] = np.empty(0, dtype=COLUMN_DTYPES[name])
+            else:
+                self._columns[name] = np.memmap(
+                    os.path.join(self.path, column_filename(name)),
+                    dtype=COLUMN_DTYPES[name], mode="r", shape=(self.count,))
+        return self._columns[name]
+
+    def bounds(self, start: int = None, end: int = None):
+        """ Номера свечей [first, last) с временем открытия в [start, end] """
+        return (self.search(start, "left") if start is not None else 0,
+                self.search(end, "right") if end is not None else self.count)
+
+    def search(self, timestamp: int, side: str = "left"):
+        """
+            Двоичный поиск времени: сначала по индексу в памяти, затем
+            внутри одного блока колонки времени
+        """
+        block = max(int(np.searchsorted(self.index, timestamp, side)) - 1, 0)
+        first = block * self.index_step
+        timestamps = self.column("timestamp")[first:first + 2 * self.index_step]
+        return first + int(np.searchsorted(timestamps, timestamp, side))
+
+    def slice(self, start: int = None, end: int = None, columns=COLUMNS):
+        """
+            Свечи с временем открытия в [start, end] (мс) словарем
+            {колонка: срез np.memmap} без копирования данных
+        """
+        first, last = self.bounds(start, end)
+        return {name: self.column(name)[first:last] for name in columns}
+
+    def hourly(self, start: int = None, end: int = None):
+        """
+            Почасовая сводка часов, начало которых в [start, end] (мс,
+            start округляется вниз до часа): (начала часов, объемы). Без
+            сводки (архив старой версии) считается по свечам
+        """
+        rows = valid_hours(self.path, self.count)
+        if rows is None:
+            data = self.slice(*hour_bounds(start, end), ("timestamp", "volume"))
+            hours, volumes, _ = hourly_rollup(data["timestamp"], data["volume"])
+            return hours, volumes
+        hours = np.fromfile(os.path.join(self.path, column_filename("hour_start")),
+                            dtype=COLUMN_DTYPES["hour_start"], count=rows)
+        low = 0 if start is None else \
+            int(np.searchsorted(hours, start // HOUR_MS * HOUR_MS, "left"))
+        high = rows if end is None else int(np.searchsorted(hours, end, "right"))
+        volumes = np.fromfile(
+            os.path.join(self.path, column_filename("hour_volume")),
+            dtype=COLUMN_DTYPES["hour_volume"], count=high - low,
+            offset=low * COLUMN_DTYPES["hour_volume"].itemsize) \
+            if high > low else np.empty(0)
+        return hours[low:high], volumes
+
+    def sums(self, start: int = None, end: int = None):
+        """
+            Суммы codec.SUMS по свечам с временем открытия в [start, end]
+            (мс): разность накопленных сумм на границах диапазона
+        """
+        first, last = self.bounds(start, end)
+        result = {"candles": float(max(last - first, 0))}
+        for name, column in zip(codec.SUMS[1:], SUM_COLUMNS):
+            if last <= first:
+                result[name] = 0.0
+                continue
+            values = self.column(column)
+            result[name] = float(values[last - 1]) - \
+                (float(values[first - 1]) if first else 0.0)
+        return result
+
+
+def read_header(path: str):
+    """ Читает заголовок архива: (число свечей, шаг индекса) """
+    header = np.fromfile(os.path.join(path, HEADER_FILENAME),
+                         dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} не является архивом свечей")
+    if header["version"][0] != VERSION:
+        raise codec.UnsupportedVersion(path, int(header["version"][0]))
+    return int(header["count"][0]), int(header["index_step"][0])
+
+
+def write_header(path: str, count: int):
+    """ Атомарно записывает заголовок: свечи до count становятся видимыми """
+    header = np.array([(MAGIC, VERSION, INDEX_STEP, count)], dtype=HEADER_DTYPE)
+    tmp_path = os.path.join(path, HEADER_FILENAME + ".tmp")
+    header.tofile(tmp_path)
+    os.replace(tmp_path, os.path.join(path, HEADER_FILENAME))
+
+
+def open_archive(exchange: str, type_of_trade: str, trading_pair: str,
+                 timeframe: str):
+    """ Открывает архив серии или возвращает None, если серии нет """
+    path = series_path(exchange, type_of_trade, trading_pair, timeframe)
+    if not os.path.exists(os.path.join(path, HEADER_FILENAME)):
+        return None
+    return CandleArchive(path)
+
+
+def open_compressed(exchange: str, type_of_trade: str, trading_pair: str,
+                    timeframe: str):
+    """ Открывает сжатую серию или возвращает None, если ее нет """
+    path = compressed_path(exchange, type_of_trade, trading_pair, timeframe)
+    if not os.path.exists(path):
+        return None
+    return codec.CompressedSeries(path)
+
+
+def append_columns(path: str, count: int, data):
+    """ Дописывает свечи после count свечей архива и обновляет заголовок """
+    for position, name in enumerate(COLUMNS):
+        values = data[:, position].astype(COLUMN_DTYPES[name])
+        with open(os.path.join(path, column_filename(name)), "ab") as f:
+            # Недописанный после сбоя хвост отрезается
+            f.truncate(count * COLUMN_DTYPES[name].itemsize)
+            values.tofile(f)
+
+    # Индекс: время свечей с номерами, кратными INDEX_STEP
+    first_indexed = -(-count // INDEX_STEP) * INDEX_STEP
+    indexed = data[first_indexed - count::INDEX_STEP, 0].astype(
+        COLUMN_DTYPES["timestamp"])
+    with open(os.path.join(path, INDEX_FILENAME), "ab") as f:
+        f.truncate(first_indexed // INDEX_STEP * COLUMN_DTYPES["timestamp"].itemsize)
+        indexed.tofile(f)
+
+    append_sums(path, count, data)
+    append_hourly(path, count, data)
+
+    # Данные сбрасываются на диск до заголовка
+    for filename in [column_filename(name)
+                     for name in COLUMNS + SUM_COLUMNS + HOURLY_COLUMNS] + \
+            [INDEX_FILENAME]:
+        with open(os.path.join(path, filename), "rb+") as f:
+            os.fsync(f.fileno())
+    write_header(path, count + len(data))
+
+
+def append_sums(path: str, count: int, data):
+    """ Дописывает накопленные суммы для свечей после count свечей архива """
+    itemsize = COLUMN_DTYPES[SUM_COLUMNS[0]].itemsize
+    paths = [os.path.join(path, column_filename(name)) for name in SUM_COLUMNS]
+    if count and any(not os.path.exists(p) or os.path.getsize(p) < count * itemsize
+                     for p in paths):
+        # Сумм нет или они недописаны: пересчет по всем свечам архива
+        stored = np.column_stack([
+            np.fromfile(os.path.join(path, column_filename(name)),
+                        dtype=COLUMN_DTYPES[name], count=count)
+            for name in COLUMNS])
+        data, count = np.concatenate([stored, data]), 0
+
+    previous = np.zeros(len(SUM_COLUMNS))
+    previous_close = None
+    if count:
+        previous = np.array([np.fromfile(p, dtype=COLUMN_DTYPES[SUM_COLUMNS[0]],
+                                         count=1, offset=(count - 1) * itemsize)[0]
+                             for p in paths])
+        previous_close = float(np.fromfile(
+            os.path.join(path, column_filename("close")), dtype=COLUMN_DTYPES["close"],
+            count=1, offset=(count - 1) * COLUMN_DTYPES["close"].itemsize)[0])
+    terms = codec.candle_sums(to_columns(data), previous_close)[:, 1:]
+    sums = np.cumsum(terms, axis=0) + previous
+    for position, filename in enumerate(paths):
+        with open(filename, "ab") as f:
+            f.truncate(count * itemsize)
+            sums[:, position].astype(COLUMN_DTYPES[SUM_COLUMNS[position]]).tofile(f)
+
+
+def valid_hours(path: str, count: int):
+    """
+        Число строк почасовой сводки, покрывающих ровно count свечей
+        архива, или None, если сводки нет или она не совпадает со свечами.
+        Строки, дописанные после сбоя до обновления заголовка, не учитываются
+    """
+    paths = [os.path.join(path, column_filename(name)) for name in HOURLY_COLUMNS]
+    if not all(os.path.exists(p) for p in paths):
+        return None if count else 0
+    ends = np.fromfile(paths[2], dtype=COLUMN_DTYPES["hour_end"])
+    rows = int(np.searchsorted(ends, count, "right"))
+    sizes = [os.path.getsize(p) // COLUMN_DTYPES[name].itemsize
+             for p, name in zip(paths, HOURLY_COLUMNS)]
+    if min(sizes) < rows or (ends[rows - 1] if rows else 0) != count:
+        return None
+    return rows
+
+
+def append_hourly(path: str, count: int, data):
+    """ Дописывает почасовую сводку для свечей после count свечей архива """
+    rows = valid_hours(path, count)
+    if rows is None:
+        # Сводки нет или она недописана: пересчет по всем свечам архива
+        stored = np.column_stack([
+            np.fromfile(os.path.join(path, column_filename(name)),
+                        dtype=COLUMN_DTYPES[name], count=count)
+            for name in COLUMNS])
+        data, count, rows = np.concatenate([stored, data]), 0, 0
+
+    hours, volumes, counts = hourly_rollup(data[:, 0], data[:, 5])
+    ends = count + np.cumsum(counts)
+    paths = {name: os.path.join(path, column_filename(name))
+             for name in HOURLY_COLUMNS}
+    if rows and len(hours):
+        # Новые свечи продолжают последний час сводки: его строка
+        # переписывается с общим объемом
+        last_hour, last_volume = (
+            np.fromfile(paths[name], dtype=COLUMN_DTYPES[name], count=1,
+                        offset=(rows - 1) * COLUMN_DTYPES[name].itemsize)[0]
+            for name in ("hour_start", "hour_volume"))
+        if last_hour == hours[0]:
+            volumes[0] += last_volume
+            rows -= 1
+    for name, values in zip(HOURLY_COLUMNS, (hours, volumes, ends)):
+        with open(paths[name], "ab") as f:
+            f.truncate(rows * COLUMN_DTYPES[name].itemsize)
+            values.astype(COLUMN_DTYPES[name]).tofile(f)
+
+
+def rewrite_archive(path: str, data):
+    """ Записывает архив заново во временную папку и заменяет им старый """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    append_columns(tmp_path, 0, data)
+    old_path = path + ".old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def write_candles(exchange: str, type_of_trade: str, trading_pair: str,
+                  timeframe: str, candles):
+    """ Добавляет свечи в серию и возвращает количество свечей в ней """
+    path = series_path(exchange, type_of_trade, trading_pair, timeframe)
+    candles = candles if isinstance(candles, np.ndarray) else to_array(candles)
+    data = merge_arrays(candles)
+    archive = open_archive(exchange, type_of_trade, trading_pair, timeframe)
+    if archive is None and os.path.exists(
+            compressed_path(exchange, type_of_trade, trading_pair, timeframe)):
+        return write_compressed(exchange, type_of_trade, trading_pair,
+                                timeframe, data)
+    if archive is None:
+        if len(data):
+            os.makedirs(path, exist_ok=True)
+            append_columns(path, 0, data)
+        return len(data)
+
+    count = len(archive)
+    if len(data) == 0:
+        return count
+    if archive.index_step == INDEX_STEP and \
+            (count == 0 or data[0, 0] > archive.column("timestamp")[-1]):
+        # Обычный случай: новые свечи после последней дописываются в конец
+        del archive
+        append_columns(path, count, data)
+        return count + len(data)
+
+    # Свечи внутри или раньше серии: архив перезаписывается целиком,
+    # чтобы сбой не оставил частично измененных колонок
+    stored = np.column_stack([archive.column(name) for name in COLUMNS])
+    del archive
+    merged = merge_arrays(stored, data)
+    rewrite_archive(path, merged)
+    return len(merged)
+
+
+def write_compressed(exchange: str, type_of_trade: str, trading_pair: str,
+                     timeframe: str, data):
+    """
+        Добавляет свечи в сжатую серию: блоки до первого затронутого
+        копируются без распаковки, остальные кодируются заново
+    """
+    series = open_compressed(exchange, type_of_trade, trading_pair, timeframe)
+    if len(data) == 0:
+        return len(series)
+    # Неполный последний блок тоже перекодируется вместе с новыми свечами
+    first = min(series.block_range(data[0, 0])[0], max(len(series.table) - 1, 0))
+    kept = series.raw_blocks(0, first)
+    stored = series.read(int(series.table["first"][first]), None) \
+        if first < len(series.table) else {}
+    stored = np.column_stack([stored[name] for name in COLUMNS]) \
+        if stored else np.empty((0, len(COLUMNS)))
+    merged = merge_arrays(stored, data)
+    codec.write_file(series.path, to_columns(merged), series.float32_volume, kept)
+    return sum(int(row["count"]) for _, row in kept) + len(merged)
+
+
+def to_columns(data):
+    """ Массив свечей (N, 6) в словарь {колонка: массив} """
+    return {name: data[:, position].astype(COLUMN_DTYPES[name])
+            for position, name in enumerate(COLUMNS)}
+
+
+def compress_series(exchange: str, type_of_trade: str, trading_pair: str,
+                    timeframe: str, float32_volume: bool = False):
+    """
+        Сжимает архив серии в файл .zc и удаляет архив. Возвращает размеры
+        (архив, сжатый файл) в байтах или None, если архива нет
+    """
+    archive = open_archive(exchange, type_of_trade, trading_pair, timeframe)
+    if archive is None:
+        return None
+    raw_size = sum(os.path.getsize(os.path.join(archive.path, name))
+                   for name in os.listdir(archive.path))
+    columns = {name: np.asarray(archive.column(name)) for name in COLUMNS}
+    path = compressed_path(exchange, type_of_trade, trading_pair, timeframe)
+    codec.write_file(path, columns, float32_volume)
+    archive_path = archive.path
+    del archive, columns
+    shutil.rmtree(archive_path)
+    return raw_size, os.path.getsize(path)
+
+
+def read_columns(exchange: str, type_of_trade: str, trading_pair: str,
+                 timeframe: str, start: int = None, end: int = None,
+                 columns=COLUMNS):
+    """
+        Свечи серии с временем открытия в [start, end] (мс) словарем
+        {колонка: массив}: срезы архива без копирования данных или
+        распакованные блоки сжатой серии
+    """
+    archive = open_archive(exchange, type_of_trade, trading_pair, timeframe)
+    if archive is not None:
+        return archive.slice(start, end, columns)
+    series = open_compressed(exchange, type_of_trade, trading_pair, timeframe)
+    if series is not None:
+        return series.read(start, end, columns)
+    return {name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in columns}
+
+
+def read_array(exchange: str, type_of_trade: str, trading_pair: str,
+               timeframe: str, start: int = None, end: int = None):
+    """ Свечи серии с временем открытия в [start, end] (мс) массивом (N, 6) """
+    data = read_columns(exchange, type_of_trade, trading_pair, timeframe,
+                        start, end)
+    return np.column_stack([data[name] for name in COLUMNS]).astype(float)
+
+
+def read_candles(exchange: str, type_of_trade: str, trading_pair: str,
+                 timeframe: str, start: int = None, end: int = None):
+    """
+        Возвращает свечи серии с временем открытия в [start, end] (мс)
+        списком кортежей (время, открытие, максимум, минимум, закрытие, объем)
+    """
+    data = read_columns(exchange, type_of_trade, trading_pair, timeframe,
+                        start, end)
+    return list(zip(data["timestamp"].tolist(),
+                    *(data[name].tolist() for name in COLUMNS[1:])))
+
+
+def read_frame(exchange: str, type_of_trade: str, trading_pair: str,
+               timeframe: str, start: int = None, end: int = None):
+    """
+        Свечи серии с временем открытия в [start, end] (мс) в виде
+        DataFrame, как у user_func.candles_to_df, без списков кортежей
+    """
+    import pandas as pd
+
+    data = read_columns(exchange, type_of_trade, trading_pair, timeframe,
+                        start, end)
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(data["timestamp"]),
+                                            unit="ms"), name="timestamp")
+    return pd.DataFrame({name: np.asarray(data[name]) for name in COLUMNS[1:]},
+                        index=index)
+
+
+def hourly_volume(exchange: str, type_of_trade: str, trading_pair: str,
+                  timeframe: str, start: int = None, end: int = None):
+    """
+        Объем серии по часам, начало которых в [start, end] (мс):
+        (начала часов, объемы) из почасовой сводки архива или по свечам
+        сжатой серии. Возвращает None, если серии нет
+    """
+    archive = open_archive(exchange, type_of_trade, trading_pair, timeframe)
+    if archive is not None:
+        return archive.hourly(start, end)
+    series = open_compressed(exchange, type_of_trade, trading_pair, timeframe)
+    if series is None:
+        return None
+    # Сжатая серия хранит только суммы блоков: сводка по распакованным свечам
+    data = series.read(*hour_bounds(start, end), ("timestamp", "volume"))
+    hours, volumes, _ = hourly_rollup(data["timestamp"], data["volume"])
+    return hours, volumes
+
+
+def aggregate(exchange: str, type_of_trade: str, trading_pair: str,
+              timeframe: str, start: int = None, end: int = None):
+    """
+        Итоги серии за [start, end] (мс) без чтения свечей: число свечей,
+        объем, объем по типичной цене, VWAP за диапазон и изменение OBV.
+        Возвращает None, если серии нет
+    """
+    archive = open_archive(exchange, type_of_trade, trading_pair, timeframe)
+    source = archive if archive is not None else \
+        open_compressed(exchange, type_of_trade, trading_pair, timeframe)
+    if source is None:
+        return None
+    result = source.sums(start, end)
+    result["candles"] = int(round(result["candles"]))
+    result["vwap"] = result["quote"] / result["volume"] if result["volume"] else None
+    return result
+
+
+def stored_exchanges(type_of_trade: str, trading_pair: str, timeframe: str):
+    """ Биржи, для которых в хранилище есть серия """
+    if not os.path.isdir(STORAGE_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(STORAGE_DIR)
+        if os.path.exists(os.path.join(
+            series_path(name, type_of_trade, trading_pair, timeframe),
+            HEADER_FILENAME))
+        or os.path.exists(compressed_path(name, type_of_trade, trading_pair,
+                                          timeframe)))
+
+
+def aggregate_exchanges(type_of_trade: str, trading_pair: str, timeframe: str,
+                        start: int = None, end: int = None):
+    """
+        Итоги aggregate за [start, end] по всем биржам хранилища с долей
+        объема каждой биржи: {биржа: итоги}. Объем всех бирж в монетах
+        (приведен при загрузке), поэтому доли сопоставимы
+    """
+    results = {exchange: aggregate(exchange, type_of_trade, trading_pair,
+                                   timeframe, start, end)
+               for exchange in stored_exchanges(type_of_trade, trading_pair,
+                                                timeframe)}
+    total = sum(result["volume"] for result in results.values())
+    for result in results.values():
+        result["share"] = result["volume"] / total if total else None
+    return results
+
+
+def find_gaps(timestamps, step_ms: int, start: int = None, end: int = None):
+    """
+        Пропуски в сетке свечей с шагом step_ms: список диапазонов
+        (первая пропущенная свеча, последняя пропущенная свеча) в мс.
+        start и end задают ожидаемые границы серии.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if start is not None:
+        timestamps = timestamps[timestamps >= start]
+    if end is not None:
+        timestamps = timestamps[timestamps <= end]
+    if len(timestamps) == 0:
+        return [] if start is None or end is None else [(start, end)]
+
+    # Ожидаемые границы дополняют ряд, чтобы найти пропуски по краям
+    bounds = [timestamps]
+    if start is not None:
+        bounds.insert(0, np.array([start - step_ms]))
+    if end is not None:
+        bounds.append(np.array([end + step_ms]))
+    points = np.concatenate(bounds)
+    holes = np.flatnonzero(np.diff(points) > step_ms)
+    return [(int(points[i] + step_ms), int(points[i + 1] - step_ms))
+            for i in holes]
+
+
+def misaligned(timestamps, step_ms: int):
+    """ Время свечей, не попадающее на сетку таймфрейма от первой свечи """
+    # Сетка отсчитывается от первой свечи: дневные свечи OKX начинаются
+    # в 16:00 UTC, недельные свечи - по понедельникам
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return []
+    return timestamps[(timestamps - timestamps[0]) % step_ms != 0].tolist()
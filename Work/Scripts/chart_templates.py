@@ -0,0 +1,585 @@
+"""
+Шаблоны графиков.
+
+Каркас каждого графика (фигура, оси, заголовок, подписи, сетка, легенда,
+форматтеры) строится один раз на поток, макет рассчитывается один раз при
+создании шаблона и затем фиксируется. На каждый запрос обновляются только
+данные художников (высоты столбцов, данные линий, углы секторов), после
+чего фигура перерисовывается без tight_layout и bbox_inches='tight'.
+
+Фигуры создаются через объектный API (Figure + FigureCanvasAgg), без pyplot,
+поэтому шаблоны разных потоков не мешают друг другу. Для каждого вида
+графика есть своя очередь рендера (render_lane) с одним потоком: шаблон
+вида строится один раз в этом потоке, а графики разных видов рисуются
+параллельно.
+
+У каждого набора бирж свой шаблон с буфером отрисовки, поэтому в потоке
+хранится не более MAX_TEMPLATES последних шаблонов: давно не
+использованные закрываются (см. Scripts/memory.py).
+"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from Scripts.image_encoding import save_figure
+
+
+# Разрешение сохраняемых изображений
+DPI = 120
+# Максимум шаблонов в одном потоке: шаблон с буфером отрисовки занимает
+# около 5 МБ, а наборов бирж (рядов) у одного вида графика может быть много
+MAX_TEMPLATES = 4
+
+# Шаблоны текущего потока: (вид графика, ряды) -> шаблон, в порядке
+# использования
+_local = threading.local()
+# Количество открытых шаблонов (фигур) во всех потоках
+_open_templates = 0
+_count_lock = threading.Lock()
+
+# Очереди рендера: вид графика -> однопоточный исполнитель
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+
+def get_template(kind: str, series):
+    """ Возвращает шаблон графика kind для рядов series [(подпись, цвет)] """
+    templates = getattr(_local, "templates", None)
+    if templates is None:
+        templates = _local.templates = OrderedDict()
+    key = (kind, tuple(series))
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = TEMPLATE_CLASSES[kind](list(series))
+        count_templates(1)
+        # Давно не использованные шаблоны потока закрываются
+        while len(templates) > MAX_TEMPLATES:
+            close_template(templates.popitem(last=False)[1])
+    else:
+        templates.move_to_end(key)
+    return template
+
+
+def count_templates(amount: int):
+    global _open_templates
+    with _count_lock:
+        _open_templates += amount
+
+
+def close_template(template):
+    """ Освобождает фигуру шаблона """
+    template.fig.clear()
+    count_templates(-1)
+
+
+def template_count():
+    """ Количество открытых шаблонов (фигур matplotlib) во всех потоках """
+    return _open_templates
+
+
+def clear_thread_templates():
+    """ Закрывает все шаблоны текущего потока """
+    templates = getattr(_local, "templates", None) or {}
+    while templates:
+        close_template(templates.popitem()[1])
+
+
+def drop_templates():
+    """
+        Закрывает шаблоны всех очередей рендера: каждая очередь закрывает
+        свои шаблоны после текущих графиков. Возвращает список Future
+    """
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+    return [lane.submit(clear_thread_templates) for lane in lanes]
+
+
+def render_lane(kind: str):
+    """ Однопоточная очередь рендера графиков вида kind """
+    with _lanes_lock:
+        lane = _lanes.get(kind)
+        if lane is None:
+            lane = _lanes[kind] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"render-{kind}")
+        return lane
+
+
+def thread_templates():
+    """ Шаблоны, созданные в текущем потоке """
+    return dict(getattr(_local, "templates", None) or {})
+
+
+class ChartTemplate:
+    """ Базовый шаблон: фигура, холст и зафиксированный макет """
+
+    figsize = (14, 7)
+
+    def __init__(self, series):
+        self.series = series
+        self.fig = Figure(figsize=self.figsize, dpi=DPI)
+        FigureCanvasAgg(self.fig)
+        self.build()
+        # Макет рассчитывается один раз на характерных данных
+        self.update(**self.sample())
+        self.freeze_layout()
+
+    def build(self):
+        raise NotImplementedError
+
+    def sample(self):
+        raise NotImplementedError
+
+    def update(self, **data):
+        raise NotImplementedError
+
+    def freeze_layout(self):
+        self.fig.tight_layout()
+        # Без движка макета отрисовка не пересчитывает расположение элементов
+        self.fig.set_layout_engine('none')
+
+    def save(self, filepath):
+        # Расширение файла определяется форматом из Scripts.image_encoding
+        return save_figure(self.fig, filepath)
+
+
+def bar_offsets(count, total_width=0.75):
+    """ Ширина столбца и смещения групп столбцов для count рядов """
+    width = total_width / count
+    return width, [k * width for k in range(count)]
+
+
+class VolumeBarsTemplate(ChartTemplate):
+    """
+        Сгруппированные столбцы объемов по биржам. Для прореженного ряда
+        (Scripts/downsample.py) столбец интервала показывает максимум
+        объема, а его насыщенная нижняя часть - минимум
+    """
+
+    # Максимум подписей времени на оси X
+    max_ticks = 12
+
+    def build(self):
+        self.ax = self.fig.add_subplot()
+        self.ax.set_title('Сравнение торговых объемов по биржам', pad=20, fontsize=14)
+        self.ax.set_xlabel('Время', fontsize=12)
+        self.ax.set_ylabel('Объем торгов', fontsize=12)
+        self.ax.grid(axis='y', linestyle='--', alpha=0.7)
+        self.ax.set_axisbelow(True)
+        self.ax.tick_params(axis='x', labelrotation=45)
+        # Подписи ставятся локатором на части столбцов, а не на каждый
+        self.times = np.array([], dtype='datetime64[m]')
+        self.time_format = '%H:%M'
+        self.ax.xaxis.set_major_locator(
+            MaxNLocator(nbins=self.max_ticks, integer=True, min_n_ticks=1))
+        self.ax.xaxis.set_major_formatter(FuncFormatter(self.format_tick))
+        # Легенда строится по заместителям, поэтому не зависит от столбцов;
+        # место задано явно: loc='best' перебирает все столбцы при отрисовке
+        self.ax.legend(
+            handles=[Patch(color=color, alpha=0.8, label=label)
+                     for label, color in self.series],
+            fontsize=12, loc='upper left')
+        self.width, self.offsets = bar_offsets(len(self.series))
+        # Столбцы одной биржи - одна коллекция: Agg рисует ее одним вызовом,
+        # а не отдельным прямоугольником на каждую свечу
+        self.collections = [
+            self.ax.add_collection(PolyCollection(
+                [], facecolors=color, edgecolors='none', alpha=0.8))
+            for _, color in self.series
+        ]
+        # Минимумы интервалов прореженного ряда
+        self.low_collections = [
+            self.ax.add_collection(PolyCollection(
+                [], facecolors=color, edgecolors='none', alpha=1.0))
+            for _, color in self.series
+        ]
+
+    def format_tick(self, x, pos=None):
+        """ Подпись времени столбца с номером x """
+        index = int(round(x))
+        if not 0 <= index < len(self.times):
+            return ''
+        return self.times[index].astype(datetime).strftime(self.time_format)
+
+    def sample(self):
+        count = 24
+        # Самые широкие подписи осей без экспоненциальной записи
+        return {"heights": [np.full(count, 99999.0)] * len(self.series),
+                "times": np.arange(count).astype('datetime64[D]')}
+
+    def bars(self, collection, offset, values):
+        """ Задает столбцы коллекции по высотам values """
+        # Столбцы центрированы по x, как в Axes.bar
+        left = np.arange(len(values)) + offset - self.width / 2
+        right = left + self.width
+        zeros = np.zeros_like(values)
+        collection.set_verts(np.stack([
+            np.column_stack([left, zeros]),
+            np.column_stack([left, values]),
+            np.column_stack([right, values]),
+            np.column_stack([right, zeros]),
+        ], axis=1))
+
+    def update(self, heights, times, lows=None):
+        top = 0.0
+        count = 0
+        lows = lows or [None] * len(heights)
+        for collection, low_collection, offset, values, low_values in zip(
+                self.collections, self.low_collections, self.offsets,
+                heights, lows):
+            values = np.asarray(values, dtype=float)
+            self.bars(collection, offset, values)
+            # Максимумы прореженного ряда светлее, чтобы минимумы были видны
+            collection.set_alpha(0.8 if low_values is None else 0.4)
+            self.bars(low_collection, offset,
+                      np.asarray(low_values if low_values is not None else [],
+                                 dtype=float))
+            if len(values) and not np.isnan(values).all():
+                top = max(top, np.nanmax(values))
+            count = max(count, len(values))
+
+        self.times = np.asarray(times, dtype='datetime64[m]')
+        # Для рядов длиннее суток к времени добавляется дата
+        span = self.times[-1] - self.times[0] if len(self.times) else 0
+        self.time_format = '%d.%m %H:%M' \
+            if span >= np.timedelta64(1, 'D') else '%H:%M'
+        # Коллекции не участвуют в relim(), поэтому пределы задаются явно
+        # с теми же полями 5%, что и при автомасштабировании
+        x_min = self.offsets[0] - self.width / 2
+        x_max = max(count - 1, 0) + self.offsets[-1] + self.width / 2
+        margin = (x_max - x_min) * 0.05
+        self.ax.set_xlim(x_min - margin, x_max + margin)
+        self.ax.set_ylim(0, top * 1.05 if top > 0 else 1)
+
+
+class TimeLinesTemplate(ChartTemplate):
+    """ Линии по времени для каждой биржи (OBV, VWAP) """
+
+    title = ''
+    title_kwargs = {"fontsize": 14}
+    ylabel = ''
+    label_fontsize = None
+    label_suffix = ''
+    linewidth = 2
+    legend_kwargs = {}
+    date_format = None
+
+    def build(self):
+        self.ax = self.fig.add_subplot()
+        self.ax.set_title(self.title, **self.title_kwargs)
+        self.ax.set_xlabel('Время', fontsize=self.label_fontsize)
+        self.ax.set_ylabel(self.ylabel, fontsize=self.label_fontsize)
+        self.ax.xaxis_date()
+        if self.date_format:
+            self.ax.xaxis.set_major_formatter(
+                mdates.DateFormatter(self.date_format))
+        self.ax.tick_params(axis='x', labelrotation=45)
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        self.lines = [
+            self.ax.plot([], [], label=label + self.label_suffix,
+                         color=color, linewidth=self.linewidth)[0]
+            for label, color in self.series
+        ]
+        self.ax.legend(**self.legend_kwargs)
+
+    def sample(self):
+        x = mdates.date2num(np.array(
+            ['2025-01-01T00:00', '2025-01-01T12:00'], dtype='datetime64[m]'))
+        return {"xs": [x] * len(self.series),
+                "ys": [np.array([-99999.0, 99999.0])] * len(self.series)}
+
+    def update(self, xs, ys):
+        for line, x, y in zip(self.lines, xs, ys):
+            line.set_data(x, y)
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+
+class ObvTemplate(TimeLinesTemplate):
+    title = 'Сравнение On-Balance Volume (OBV) по биржам'
+    title_kwargs = {"pad": 20, "fontsize": 14}
+    ylabel = 'Значение OBV'
+    label_fontsize = 12
+    linewidth = 2.5
+    legend_kwargs = {"fontsize": 12, "loc": 'upper left'}
+    date_format = '%H:%M'
+
+
+class CvdTemplate(TimeLinesTemplate):
+    title = 'Кумулятивная дельта объема (CVD) по биржам'
+    title_kwargs = {"pad": 20, "fontsize": 14}
+    ylabel = 'Покупки - продажи'
+    label_fontsize = 12
+    linewidth = 2.5
+    legend_kwargs = {"fontsize": 12, "loc": 'upper left'}
+    date_format = '%H:%M'
+
+    def build(self):
+        super().build()
+        # Нулевая линия: выше нее покупатели агрессивнее продавцов
+        self.ax.axhline(0, color='grey', linewidth=1)
+
+
+class VwapTemplate(TimeLinesTemplate):
+    title = 'Сравнение VWAP по биржам'
+    ylabel = 'VWAP'
+    label_suffix = ' VWAP'
+
+
+class LeadLagTemplate(ChartTemplate):
+    """
+        Кросс-корреляция пар бирж по сдвигу (Scripts/lead_lag.py):
+        доходность сверху, объем снизу, лучший сдвиг отмечен точкой
+    """
+
+    figsize = (12, 8)
+    linestyles = ('-', '--', ':', '-.')
+
+    def build(self):
+        self.axes = self.fig.subplots(2, 1, sharex=True)
+        self.fig.suptitle('Кросс-корреляция бирж (lead-lag)', fontsize=14)
+        titles = [label for label, _ in self.series]
+        colors = dict(self.series)
+        self.pairs = [(first, second) for k, first in enumerate(titles)
+                      for second in titles[k + 1:]]
+        self.lines, self.markers = [], []
+        for ax, label in zip(self.axes, ('Доходность', 'Объем')):
+            ax.set_ylabel(f'Корреляция: {label.lower()}')
+            ax.axhline(0, color='grey', linewidth=1)
+            ax.axvline(0, color='grey', linewidth=1, linestyle='--')
+            ax.grid(True, linestyle='--', alpha=0.6)
+            lines, markers = [], []
+            # Цвет линии - первой биржи пары, стиль - номер пары
+            for k, (first, second) in enumerate(self.pairs):
+                color = colors[first]
+                style = self.linestyles[k % len(self.linestyles)]
+                lines.append(ax.plot([], [], color=color, linestyle=style,
+                                     linewidth=2, label=f'{first} / {second}')[0])
+                markers.append(ax.plot([], [], 'o', color=color,
+                                       markersize=8)[0])
+            self.lines.append(lines)
+            self.markers.append(markers)
+        if self.pairs:
+            self.axes[0].legend(loc='upper left', fontsize=10)
+        self.axes[1].set_xlabel(
+            'Сдвиг, свечей (> 0: первая биржа пары опережает вторую)')
+
+    def sample(self):
+        lags = np.arange(-20, 21)
+        values = [np.linspace(-1, 1, len(lags))] * len(self.pairs)
+        return {"lags": lags, "returns": values, "volume": values}
+
+    def update(self, lags, returns, volume):
+        for ax, lines, markers, rows in zip(self.axes, self.lines,
+                                            self.markers, (returns, volume)):
+            for line, marker, row in zip(lines, markers, rows):
+                row = np.asarray(row, dtype=float)
+                line.set_data(lags, row)
+                best = int(np.argmax(row))
+                marker.set_data([lags[best]], [row[best]])
+            ax.relim()
+            ax.autoscale_view()
+
+
+class VolumeProfileTemplate(ChartTemplate):
+    """ Горизонтальные столбцы объемного профиля по биржам """
+
+    figsize = (12, 8)
+
+    def build(self):
+        self.ax = self.fig.add_subplot()
+        self.ax.set_xlabel("Объём торгов")
+        self.ax.set_title("Сравнение объёмного профиля по биржам", fontsize=14)
+        self.ax.grid(True, axis='x', linestyle='--', alpha=0.6)
+        self.ax.set_axisbelow(True)
+        self.ax.legend(handles=[Patch(color=color, label=label)
+                                for label, color in self.series])
+        self.height = 0.75 / len(self.series)
+        middle = (len(self.series) - 1) / 2
+        # Первый ряд выше центра строки, последний - ниже
+        self.offsets = [(middle - k) * self.height
+                        for k in range(len(self.series))]
+        self.containers = [None] * len(self.series)
+
+    def sample(self):
+        rows = 20
+        return {"y_labels": ["100000 - 100000"] * rows,
+                "widths": [np.full(rows, 999999.0)] * len(self.series)}
+
+    def update(self, y_labels, widths):
+        indices = np.arange(len(y_labels))
+        for k, ((label, color), values) in enumerate(zip(self.series, widths)):
+            values = np.asarray(values, dtype=float)
+            container = self.containers[k]
+            if container is not None and len(container) == len(values):
+                for rect, value in zip(container, values):
+                    rect.set_width(value)
+            else:
+                if container is not None:
+                    container.remove()
+                self.containers[k] = self.ax.barh(
+                    indices + self.offsets[k], values,
+                    height=self.height, color=color)
+        self.ax.set_yticks(indices, y_labels)
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+
+class VolumePieTemplate(ChartTemplate):
+    """ Круговая диаграмма долей объема; обновляются только углы секторов """
+
+    figsize = (9, 6)
+    startangle = 90
+    labeldistance = 1.1
+    pctdistance = 0.6
+
+    def build(self):
+        self.ax = self.fig.add_axes([0.02, 0.02, 0.6, 0.82])
+        count = len(self.series)
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            [1] * count,
+            labels=[label for label, _ in self.series],
+            colors=[color for _, color in self.series],
+            autopct='%1.1f%%',
+            startangle=self.startangle,
+            textprops={'fontsize': 12},
+            labeldistance=self.labeldistance,
+            pctdistance=self.pctdistance,
+        )
+        for autotext in self.autotexts:
+            autotext.set_fontsize(14)
+            autotext.set_color('white')
+        for wedge in self.wedges:
+            wedge.set_edgecolor('white')
+            wedge.set_linewidth(2)
+        self.title = self.fig.suptitle('', fontsize=16, x=0.32, y=0.97)
+        self.legend = self.fig.legend(
+            self.wedges, [label for label, _ in self.series],
+            loc='upper left', bbox_to_anchor=(0.64, 0.84), fontsize=12)
+
+    def freeze_layout(self):
+        # Положение осей и легенды задано явно
+        pass
+
+    def sample(self):
+        return {"sizes": [1] * len(self.series),
+                "legend_labels": [label for label, _ in self.series],
+                "title": ''}
+
+    def update(self, sizes, legend_labels, title):
+        sizes = np.asarray(sizes, dtype=float)
+        total = sizes.sum()
+        fractions = sizes / total if total > 0 else np.zeros_like(sizes)
+
+        theta = self.startangle
+        for wedge, text, autotext, fraction in zip(
+                self.wedges, self.texts, self.autotexts, fractions):
+            theta2 = theta + 360 * fraction
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta2)
+
+            middle = math.radians((theta + theta2) / 2)
+            x, y = math.cos(middle), math.sin(middle)
+            text.set_position((self.labeldistance * x, self.labeldistance * y))
+            text.set_horizontalalignment('left' if x > 0 else 'right')
+            autotext.set_position((self.pctdistance * x, self.pctdistance * y))
+            autotext.set_text(f'{fraction * 100:1.1f}%')
+            visible = fraction > 0
+            text.set_visible(visible)
+            autotext.set_visible(visible)
+            theta = theta2
+
+        for legend_text, label in zip(self.legend.get_texts(), legend_labels):
+            legend_text.set_text(label)
+        self.title.set_text(title)
+
+
+class SeasonalityTemplate(ChartTemplate):
+    """
+        Сезонность объема (Scripts/seasonality.py): тепловая карта среднего
+        объема по дню недели и часу для каждой биржи и доли бирж по часам
+    """
+
+    weekdays = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+    hours = np.arange(24)
+
+    @property
+    def figsize(self):
+        # Высота растет с числом бирж: по тепловой карте на биржу
+        return (14, 2.4 * len(self.series) + 3.6)
+
+    def build(self):
+        count = len(self.series)
+        axes = self.fig.subplots(
+            count + 1, 1, gridspec_kw={"height_ratios": [1] * count + [1.2]})
+        self.title = self.fig.suptitle('', fontsize=14)
+        self.images = []
+        for ax, (label, _) in zip(axes, self.series):
+            image = ax.imshow(np.zeros((len(self.weekdays), len(self.hours))),
+                              aspect='auto', cmap='viridis',
+                              interpolation='nearest')
+            ax.set_title(label, fontsize=12)
+            ax.set_yticks(range(len(self.weekdays)), self.weekdays)
+            ax.set_xticks(self.hours[::2])
+            self.fig.colorbar(image, ax=ax, pad=0.01,
+                              label='Средний объем за час')
+            self.images.append(image)
+
+        self.share_ax = axes[-1]
+        self.bars = [self.share_ax.bar(self.hours, np.zeros(len(self.hours)),
+                                       width=0.8, color=color, label=label)
+                     for label, color in self.series]
+        self.share_ax.set_xlim(-0.5, len(self.hours) - 0.5)
+        self.share_ax.set_ylim(0, 1)
+        self.share_ax.set_xticks(self.hours)
+        self.share_ax.set_xlabel('Час (UTC)')
+        self.share_ax.set_ylabel('Доля объема')
+        self.share_ax.yaxis.set_major_formatter(
+            FuncFormatter(lambda x, pos: f'{x:.0%}'))
+        self.share_ax.legend(loc='upper left', ncol=count, fontsize=10)
+
+    def sample(self):
+        count = len(self.series)
+        mean = np.linspace(0, 999999, len(self.weekdays) * len(self.hours))
+        return {"means": [mean.reshape(len(self.weekdays), -1)] * count,
+                "shares": [np.full(len(self.hours), 1 / count)] * count,
+                "title": 'Сезонность объема BTCUSDT за 90 дн. (UTC)'}
+
+    def update(self, means, shares, title):
+        for image, mean in zip(self.images, means):
+            mean = np.asarray(mean, dtype=float)
+            image.set_data(np.ma.masked_invalid(mean))
+            finite = mean[np.isfinite(mean)]
+            if len(finite):
+                low, high = finite.min(), finite.max()
+                image.set_clim(low, high if high > low else low + 1)
+        # Доли бирж складываются в столбец часа
+        bottom = np.zeros(len(self.hours))
+        for bars, values in zip(self.bars, shares):
+            values = np.asarray(values, dtype=float)
+            for rect, value, base in zip(bars, values, bottom):
+                rect.set_y(base)
+                rect.set_height(value)
+            bottom = bottom + values
+        self.title.set_text(title)
+
+
+TEMPLATE_CLASSES = {
+    "volume_plot": VolumeBarsTemplate,
+    "obv_plot": ObvTemplate,
+    "cvd_plot": CvdTemplate,
+    "vwap_plot": VwapTemplate,
+    "volume_profile": VolumeProfileTemplate,
+    "lead_lag": LeadLagTemplate,
+    "volume_pie": VolumePieTemplate,
+    "seasonality": SeasonalityTemplate,
+}
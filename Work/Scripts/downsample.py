@@ -0,0 +1,116 @@
+"""
+Прореживание длинных рядов перед рендером графиков.
+
+Время рендера растет с числом столбцов и точек, а не со смыслом графика:
+тысяча столбцов на 14 дюймах ширины все равно сливается. Поэтому перед
+отрисовкой:
+
+- столбцы объемов группируются в не более MAX_BARS интервалов; для
+  интервала сохраняются максимум и минимум объема, так что всплески не
+  пропадают при усреднении;
+- линии (OBV, VWAP, CVD) прореживаются до MAX_POINTS точек алгоритмом
+  LTTB (Largest-Triangle-Three-Buckets), который сохраняет форму линии и
+  экстремумы.
+
+Ряды короче порогов не меняются. Пороги задаются в config.json:
+    "CHART_MAX_BARS": 120, "CHART_MAX_POINTS": 1500
+
+numpy импортируется внутри функций: модуль загружается из main.py при
+старте ради configure(), а тяжелые модули импортируются позже (см.
+Scripts/warmup.py).
+"""
+
+
+# Максимум столбцов одной биржи на графике объемов
+MAX_BARS = 120
+# Максимум точек одной линии
+MAX_POINTS = 1500
+
+
+def configure(config: dict):
+    """ Применяет настройки CHART_MAX_BARS и CHART_MAX_POINTS из config.json """
+    global MAX_BARS, MAX_POINTS
+    MAX_BARS = int(config.get("CHART_MAX_BARS", MAX_BARS))
+    MAX_POINTS = int(config.get("CHART_MAX_POINTS", MAX_POINTS))
+    if MAX_BARS < 1 or MAX_POINTS < 3:
+        raise ValueError("CHART_MAX_BARS >= 1, CHART_MAX_POINTS >= 3")
+
+
+def bucket_edges(size: int, buckets: int):
+    """ Начала интервалов: size позиций делятся на buckets почти равных частей """
+    import numpy as np
+
+    return np.linspace(0, size, buckets + 1).astype(np.int64)[:-1]
+
+
+def bucket_bars(values, max_bars: int = None):
+    """
+        Группирует столбцы по интервалам. Возвращает (начала интервалов,
+        максимумы, минимумы); минимумы - None, если ряд не прорежен.
+        Пропуски (NaN) не учитываются
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    max_bars = max_bars or MAX_BARS
+    if len(values) <= max_bars:
+        return np.arange(len(values)), values, None
+    starts = bucket_edges(len(values), max_bars)
+    with np.errstate(invalid="ignore"):
+        highs = np.fmax.reduceat(values, starts)
+        lows = np.fmin.reduceat(values, starts)
+    return starts, highs, lows
+
+
+def lttb(x, y, max_points: int = None):
+    """
+        Индексы точек ряда (x, y), отобранных алгоритмом LTTB.
+        Первая и последняя точки сохраняются всегда
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    max_points = max_points or MAX_POINTS
+    size = len(x)
+    if size <= max_points or max_points < 3:
+        return np.arange(size)
+
+    # Внутренние точки делятся на max_points - 2 интервала
+    edges = np.linspace(1, size - 1, max_points - 1).astype(np.int64)
+    # Средние точки интервалов считаются заранее одним проходом
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts
+    # Для последнего интервала "следующая" точка - последняя точка ряда
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        # Удвоенная площадь треугольника (предыдущая выбранная точка,
+        # точка интервала, среднее следующего интервала)
+        areas = np.abs((ax - mean_x[bucket]) * (y[start:end] - ay)
+                       - (ax - x[start:end]) * (mean_y[bucket] - ay))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_line(x, y, max_points: int = None):
+    """ Прореживает линию (x, y) по LTTB; пропуски (NaN) отбрасываются """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= (max_points or MAX_POINTS):
+        return x, y
+    finite = np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    selected = lttb(x, y, max_points)
+    return x[selected], y[selected]
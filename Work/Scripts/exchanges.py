@@ -0,0 +1,393 @@
+"""
+Реестр бирж.
+
+Каждая биржа описывается адаптером (подкласс ExchangeAdapter), который
+знает формат таймфреймов, символов и типов торговли биржи, умеет
+запрашивать свечи и приводить их к общему виду. Анализ и графики работают
+со всеми зарегистрированными адаптерами, поэтому добавление биржи сводится
+к одному классу адаптера и вызову register().
+"""
+import threading
+
+import Scripts.instruments as instruments
+import Scripts.utils_for_api_bybit as bybit
+import Scripts.utils_for_api_okx as okx
+import Scripts.utils_for_api_binance as binance
+
+
+# Цвета для бирж, у которых цвет не задан
+PALETTE = ("#e84142", "#8247e5", "#00a3ff", "#ff7a00", "#14b8a6",
+           "#d946ef", "#64748b", "#84cc16")
+
+_lock = threading.Lock()
+# Зарегистрированные адаптеры: имя -> адаптер (в порядке регистрации)
+_adapters = {}
+
+
+def expiry_to_yymmdd(symbol: str):
+    """ Заменяет дату экспирации ДДМММГГ в конце символа на ГГММДД """
+    return symbol[:-7] + instruments.parse_expiry(symbol[-7:])
+
+
+class ExchangeAdapter:
+    """ Адаптер биржи: преобразование параметров и запрос свечей """
+
+    # Ключ биржи в реестре
+    name = ""
+    # Название биржи на графиках и в сообщениях
+    title = ""
+    # Цвет биржи на графиках (None - из PALETTE)
+    color = None
+    # Таймфрейм бота -> таймфрейм биржи
+    intervals = {}
+    # Тип торговли бота -> тип торговли биржи
+    markets = {'SPOT': 'SPOT', 'FUTURES': 'FUTURES',
+               'PERPETUAL FUTURES': 'PERPETUAL FUTURES'}
+    # Максимальное количество свечей в одном ответе биржи
+    page_limit = 200
+    # Сообщение WebSocket для поддержания соединения (None - не нужно)
+    ping_message = None
+
+    def interval(self, timeframe: str):
+        """ Таймфрейм в формате биржи """
+        return self.intervals[timeframe]
+
+    def market(self, type_of_trade: str):
+        """ Тип торговли в формате биржи """
+        return self.markets[type_of_trade]
+
+    def symbol(self, trading_pair: str, type_of_trade: str):
+        """ Торговая пара вида BTC/USDT в формате биржи """
+        # Символ из таблицы инструментов, если каталог биржи загружен
+        found = instruments.native(self.name, trading_pair, type_of_trade)
+        if found:
+            return found[0]
+        return self.format_symbol(trading_pair, type_of_trade)
+
+    def format_symbol(self, trading_pair: str, type_of_trade: str):
+        """ Символ биржи по строке пары (инструмента нет в таблице) """
+        raise NotImplementedError
+
+    def category(self, trading_pair: str, type_of_trade: str):
+        """ Категория (рынок) инструмента на бирже """
+        found = instruments.native(self.name, trading_pair, type_of_trade)
+        if found:
+            return found[1]
+        return self.market(type_of_trade)
+
+    def fetch_candles(self, trading_pair: str, type_of_trade: str,
+                      timeframe: str, limit: int = None,
+                      start: int = None, end: int = None):
+        """
+            Запрашивает последние limit свечей или свечи диапазона
+            [start, end] (в мс). Возвращает список кортежей
+            (время, открытие, максимум, минимум, закрытие, объем)
+            или None при ошибке валидации.
+        """
+        raise NotImplementedError
+
+    def fetch_history(self, trading_pair: str, type_of_trade: str,
+                      timeframe: str, start: int, end: int, limit: int):
+        """
+            Запрашивает не более limit свечей диапазона [start, end] (в мс)
+            для загрузки истории (см. Scripts/backfill.py)
+        """
+        return self.fetch_candles(trading_pair, type_of_trade, timeframe,
+                                  limit=limit, start=start, end=end)
+
+    def normalize(self, df, type_of_trade: str):
+        """ Исправляет особенности данных биржи в DataFrame свечей """
+        return df
+
+    def fetch_trades(self, trading_pair: str, type_of_trade: str,
+                     limit: int = None):
+        """
+            Запрашивает последние сделки. Возвращает список кортежей
+            (id сделки, время в мс, цена, объем, покупка ли агрессор)
+            или None при ошибке валидации.
+        """
+        raise NotImplementedError
+
+    def trade_stream(self, trading_pair: str, type_of_trade: str):
+        """ Поток сделок: (URL WebSocket, сообщение подписки или None) """
+        raise NotImplementedError
+
+    def parse_trade_message(self, message):
+        """ Сделки из сообщения WebSocket; для служебных сообщений - [] """
+        raise NotImplementedError
+
+    def trade_size_scale(self, type_of_trade: str):
+        """ Множитель объема сделки до объема в монетах """
+        return 1.0
+
+    def load_catalog(self):
+        """ Загружает каталог инструментов биржи (если он есть) """
+
+    def reset_catalog(self):
+        """ Сбрасывает загруженный каталог инструментов """
+
+    def catalog_instruments(self):
+        """
+            Инструменты каталога биржи для Scripts/instruments.py:
+            [(база, котировка, тип торговли бота, экспирация ГГММДД,
+            символ, категория)] или None, если каталога нет
+        """
+        return None
+
+
+class BybitAdapter(ExchangeAdapter):
+    name = "bybit"
+    title = "Bybit"
+    color = "#2775ca"
+    intervals = {
+        '1': '1', '3': '3', '5': '5', '15': '15', '30': '30',
+        '60': '60', '120': '120', '240': '240', '360': '360',
+        'Day': 'D', 'Week': 'W', 'Month': 'M'
+    }
+    markets = {'SPOT': 'spot', 'FUTURES': 'linear',
+               'PERPETUAL FUTURES': 'linear'}
+    page_limit = 1000
+    # Bybit рекомендует отправлять {"op": "ping"} каждые 20 секунд
+    ping_message = {"op": "ping"}
+
+    def format_symbol(self, trading_pair, type_of_trade):
+        return trading_pair.replace('/', '')
+
+    def fetch_candles(self, trading_pair, type_of_trade, timeframe,
+                      limit=None, start=None, end=None):
+        return bybit.get_trading_candles(
+            self.category(trading_pair, type_of_trade),
+            self.symbol(trading_pair, type_of_trade),
+            self.interval(timeframe), start=start, end=end, limit=limit
+        )
+
+    def fetch_trades(self, trading_pair, type_of_trade, limit=None):
+        return bybit.get_recent_trades(
+            self.category(trading_pair, type_of_trade),
+            self.symbol(trading_pair, type_of_trade),
+            limit)
+
+    def trade_stream(self, trading_pair, type_of_trade):
+        symbol = self.symbol(trading_pair, type_of_trade)
+        return (bybit.WS_URLS[self.category(trading_pair, type_of_trade)],
+                {"op": "subscribe", "args": [f"publicTrade.{symbol}"]})
+
+    def parse_trade_message(self, message):
+        if not message.get("topic", "").startswith("publicTrade."):
+            return []
+        return bybit.parse_trades(message["data"])
+
+    def load_catalog(self):
+        return bybit.load_available_trading_pairs()
+
+    def reset_catalog(self):
+        bybit.AVAILABLE_TRADING_PAIRS = None
+        instruments.reset()
+
+    def catalog_instruments(self):
+        return self.load_catalog()["INSTRUMENTS"]
+
+
+class OkxAdapter(ExchangeAdapter):
+    name = "okx"
+    title = "OKX"
+    color = "#0ecb81"
+    intervals = {
+        '1': '1m', '3': '3m', '5': '5m', '15': '15m', '30': '30m',
+        '60': '1H', '120': '2H', '240': '4H', '360': '6H',
+        'Day': '1D', 'Week': '1W', 'Month': '1M'
+    }
+    page_limit = 100
+    # OKX ждет текстовое "ping" хотя бы раз в 30 секунд
+    ping_message = "ping"
+
+    def format_symbol(self, trading_pair, type_of_trade):
+        symbol = trading_pair.replace('/', '-')
+        if type_of_trade == "FUTURES":
+            # Форматирование даты для OKX
+            symbol = expiry_to_yymmdd(symbol)
+        elif type_of_trade == "PERPETUAL FUTURES":
+            # Добавление суффикса для вечных фьючерсов на OKX
+            symbol = symbol + "-SWAP"
+        return symbol
+
+    def fetch_candles(self, trading_pair, type_of_trade, timeframe,
+                      limit=None, start=None, end=None):
+        symbol = self.symbol(trading_pair, type_of_trade)
+        limit = None if limit is None else str(limit)
+        if start is not None:
+            # OKX отдает свечи строго раньше after и строго позже before
+            return okx.get_trading_candles(
+                symbol, self.interval(timeframe),
+                after=str(end+1), before=str(start-1), limit=limit
+            )
+        return okx.get_trading_candles(
+            symbol, self.interval(timeframe), limit=limit
+        )
+
+    def fetch_history(self, trading_pair, type_of_trade, timeframe,
+                      start, end, limit):
+        # Эндпоинт обычных свечей OKX отдает только последние 1440 свечей
+        return okx.get_trading_candles(
+            self.symbol(trading_pair, type_of_trade), self.interval(timeframe),
+            after=str(end+1), before=str(start-1), limit=str(limit),
+            history=True
+        )
+
+    def normalize(self, df, type_of_trade):
+        # OKX отдает объем срочных контрактов в контрактах, а не в монетах
+        if (type_of_trade == "FUTURES"):
+            df["volume"] = df["volume"] / 100
+
+        if (type_of_trade == "PERPETUAL FUTURES"):
+            for index in df.index:
+                if df.loc[index, 'volume'] > 10000:
+                    df.loc[index, 'volume'] = df.loc[index, 'volume'] / 100
+                else:
+                    df.loc[index, 'volume'] = df.loc[index, 'volume'] * 10
+
+        return df
+
+    def fetch_trades(self, trading_pair, type_of_trade, limit=None):
+        return okx.get_recent_trades(self.symbol(trading_pair, type_of_trade),
+                                     limit)
+
+    def trade_stream(self, trading_pair, type_of_trade):
+        return (okx.WS_URL, {"op": "subscribe", "args": [{
+            "channel": "trades",
+            "instId": self.symbol(trading_pair, type_of_trade)}]})
+
+    def parse_trade_message(self, message):
+        if message.get("arg", {}).get("channel") != "trades" or \
+                "data" not in message:
+            return []
+        return okx.parse_trades(message["data"])
+
+    def trade_size_scale(self, type_of_trade):
+        # Объем срочных контрактов OKX - в контрактах по 0.01 монеты (BTC),
+        # как и в normalize
+        return 0.01 if type_of_trade in ("FUTURES", "PERPETUAL FUTURES") else 1.0
+
+    def load_catalog(self):
+        return okx.load_available_trading_pairs()
+
+    def reset_catalog(self):
+        okx.AVAILABLE_TRADING_PAIRS = None
+        instruments.reset()
+
+    def catalog_instruments(self):
+        return self.load_catalog()["INSTRUMENTS"]
+
+
+class BinanceAdapter(ExchangeAdapter):
+    name = "binance"
+    title = "Binance"
+    color = "#f0b90b"
+    intervals = {
+        '1': '1m', '3': '3m', '5': '5m', '15': '15m', '30': '30m',
+        '60': '1h', '120': '2h', '240': '4h', '360': '6h',
+        'Day': '1d', 'Week': '1w', 'Month': '1M'
+    }
+    markets = {'SPOT': 'SPOT', 'FUTURES': 'FUTURES',
+               'PERPETUAL FUTURES': 'FUTURES_PERP'}
+    page_limit = 1000
+
+    def format_symbol(self, trading_pair, type_of_trade):
+        symbol = trading_pair.replace('/', '')
+        if type_of_trade == "FUTURES":
+            # Форматирование даты для Binance
+            symbol = expiry_to_yymmdd(symbol).replace('-', '_')
+        return symbol
+
+    def fetch_candles(self, trading_pair, type_of_trade, timeframe,
+                      limit=None, start=None, end=None):
+        return binance.get_trading_candles(
+            self.category(trading_pair, type_of_trade),
+            self.symbol(trading_pair, type_of_trade),
+            self.interval(timeframe), start=start, end=end, limit=limit
+        )
+
+    def fetch_trades(self, trading_pair, type_of_trade, limit=None):
+        return binance.get_recent_trades(
+            self.category(trading_pair, type_of_trade),
+            self.symbol(trading_pair, type_of_trade),
+            limit)
+
+    def trade_stream(self, trading_pair, type_of_trade):
+        symbol = self.symbol(trading_pair, type_of_trade)
+        if type_of_trade == "SPOT":
+            url = binance.WS_URL_SPOT
+        elif binance.is_usdt_margined(symbol):
+            url = binance.WS_URL_FUTURES_USDT
+        else:
+            url = binance.WS_URL_FUTURES_COIN
+        # Поток выбирается адресом, подписка не нужна
+        return f"{url}/{symbol.lower()}@aggTrade", None
+
+    def parse_trade_message(self, message):
+        if message.get("e") != "aggTrade":
+            return []
+        return binance.parse_trades([message])
+
+    def load_catalog(self):
+        return binance.load_available_trading_pairs()
+
+    def reset_catalog(self):
+        binance.AVAILABLE_TRADING_PAIRS = None
+        instruments.reset()
+
+    def catalog_instruments(self):
+        return self.load_catalog()["INSTRUMENTS"]
+
+
+def register(adapter: ExchangeAdapter):
+    """ Регистрирует адаптер биржи; повторная регистрация заменяет прежний """
+    with _lock:
+        if adapter.color is None:
+            used = {a.color for a in _adapters.values()}
+            adapter.color = next((c for c in PALETTE if c not in used),
+                                 PALETTE[len(_adapters) % len(PALETTE)])
+        _adapters[adapter.name] = adapter
+    # Таблица инструментов строится заново с каталогом новой биржи
+    instruments.reset()
+    return adapter
+
+
+def unregister(name: str):
+    """ Удаляет адаптер биржи из реестра """
+    with _lock:
+        adapter = _adapters.pop(name, None)
+    instruments.reset()
+    return adapter
+
+
+def get_adapters():
+    """ Зарегистрированные адаптеры в порядке регистрации """
+    with _lock:
+        return list(_adapters.values())
+
+
+def get_adapter(name: str):
+    """ Адаптер биржи по имени """
+    with _lock:
+        return _adapters[name]
+
+
+def color_of(title: str):
+    """ Цвет биржи на графиках по ее названию """
+    for adapter in get_adapters():
+        if adapter.title == title:
+            return adapter.color
+    return PALETTE[sum(map(ord, title)) % len(PALETTE)]
+
+
+def chart_series(titles=None):
+    """ Подписи и цвета рядов графиков: [(название, цвет)] """
+    if titles is None:
+        titles = [adapter.title for adapter in get_adapters()]
+    return tuple((title, color_of(title)) for title in titles)
+
+
+register(BybitAdapter())
+register(OkxAdapter())
+register(BinanceAdapter())
@@ -0,0 +1,134 @@
+"""
+Кеш file_id Telegram для отправленных графиков.
+
+После загрузки изображения Telegram возвращает file_id, по которому тот же
+файл можно отправить повторно без загрузки байтов. Кеш сопоставляет хеш
+SHA-256 содержимого графика с file_id, хранит не более MAX_ENTRIES
+последних записей и сохраняется в JSON-файл, чтобы переживать перезапуск.
+Одинаковые графики получаются, когда пользователи смотрят одну и ту же
+пару в пределах одной свечи.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import Scripts.metrics as metrics
+from Scripts.logger import log_warning
+
+
+# Файл для сохранения кеша
+CACHE_FILENAME = 'Output/file_id_cache.json'
+# Максимальное количество записей
+MAX_ENTRIES = 5000
+# Минимальный интервал между сохранениями файла в секундах
+SAVE_INTERVAL = 5.0
+
+_lock = threading.Lock()
+# хеш содержимого -> file_id, в порядке последнего использования
+_entries = OrderedDict()
+_loaded = False
+_dirty = False
+_last_save = 0.0
+
+
+def content_hash(data: bytes) -> str:
+    """ Хеш SHA-256 содержимого изображения """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(CACHE_FILENAME, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        log_warning(f"Не удалось прочитать кеш file_id: {e}")
+        return
+    for digest, file_id in list(stored.items())[-MAX_ENTRIES:]:
+        _entries[digest] = file_id
+
+
+def get_file_id(digest: str):
+    """ Возвращает file_id для хеша содержимого или None """
+    with _lock:
+        _ensure_loaded()
+        file_id = _entries.get(digest)
+        if file_id is not None:
+            _entries.move_to_end(digest)
+    metrics.inc_counter("file_id_cache_total",
+                        result="hit" if file_id else "miss")
+    return file_id
+
+
+def remember(digest: str, file_id: str):
+    """ Запоминает file_id, полученный после загрузки изображения """
+    global _dirty
+    with _lock:
+        _ensure_loaded()
+        changed = _entries.get(digest) != file_id
+        _entries[digest] = file_id
+        _entries.move_to_end(digest)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+        _dirty = _dirty or changed
+    if time.monotonic() - _last_save >= SAVE_INTERVAL:
+        save()
+
+
+def forget(digest: str):
+    """ Удаляет запись, если Telegram отклонил file_id """
+    global _dirty
+    with _lock:
+        if _entries.pop(digest, None) is not None:
+            _dirty = True
+
+
+def save():
+    """ Сохраняет кеш в файл, если он изменился """
+    global _dirty, _last_save
+    with _lock:
+        if not _dirty:
+            return
+        snapshot = dict(_entries)
+        _dirty = False
+        _last_save = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILENAME), exist_ok=True)
+        # Запись через временный файл, чтобы не повредить кеш при сбое
+        tmp_path = CACHE_FILENAME + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, CACHE_FILENAME)
+    except OSError as e:
+        with _lock:
+            _dirty = True
+        log_warning(f"Не удалось сохранить кеш file_id: {e}")
+
+
+def size():
+    """ Количество записей в памяти """
+    return len(_entries)
+
+
+def clear():
+    """ Очищает кеш в памяти (файл не удаляется) """
+    global _loaded, _dirty
+    with _lock:
+        _entries.clear()
+        _loaded = False
+        _dirty = False
+
+
+atexit.register(save)
+
+metrics.describe("file_id_cache_total",
+                 "Обращения к кешу file_id Telegram (hit/miss)")
@@ -0,0 +1,104 @@
+"""
+Кодирование графиков для отправки в Telegram.
+
+Фигура отрисовывается в буфер Agg один раз, после чего изображение
+кодируется через Pillow в компактный формат:
+    png  - PNG с палитрой (до IMAGE_COLORS цветов, без дизеринга);
+    webp - WebP с потерями;
+    jpeg - JPEG без прореживания цветности (текст остается четким).
+
+IMAGE_QUALITY - верхняя граница качества для форматов с потерями. Если
+изображение не укладывается в IMAGE_MAX_BYTES, качество снижается шагами
+QUALITY_STEP, но не ниже MIN_QUALITY. Настройки задаются в config.json
+(IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MAX_BYTES), см. configure().
+"""
+import io
+import os
+
+
+# Формат изображений графиков: png, webp или jpeg
+IMAGE_FORMAT = "png"
+# Верхняя граница качества для WebP и JPEG
+IMAGE_QUALITY = 85
+# Нижняя граница качества при подгонке под IMAGE_MAX_BYTES
+MIN_QUALITY = 50
+# Шаг снижения качества
+QUALITY_STEP = 10
+# Желаемый максимальный размер изображения в байтах (0 - без ограничения)
+IMAGE_MAX_BYTES = 0
+# Количество цветов палитры PNG
+IMAGE_COLORS = 256
+# Уровень сжатия zlib для PNG
+PNG_COMPRESS_LEVEL = 6
+
+# Расширения файлов для форматов
+EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+
+def configure(config: dict):
+    """ Применяет настройки кодирования из config.json """
+    global IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MAX_BYTES
+    image_format = str(config.get("IMAGE_FORMAT", IMAGE_FORMAT)).lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format not in EXTENSIONS:
+        raise ValueError(f"Неизвестный формат изображений: {image_format}")
+    IMAGE_FORMAT = image_format
+    IMAGE_QUALITY = min(max(int(config.get("IMAGE_QUALITY", IMAGE_QUALITY)), 1), 100)
+    IMAGE_MAX_BYTES = int(config.get("IMAGE_MAX_BYTES", IMAGE_MAX_BYTES))
+
+
+def render_image(fig):
+    """ Отрисовывает фигуру и возвращает RGB-изображение Pillow """
+    # numpy и Pillow импортируются при первом рендере: модуль загружается
+    # из main.py при старте, см. Scripts/warmup.py
+    import numpy as np
+    from PIL import Image
+
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    return Image.fromarray(rgba).convert("RGB")
+
+
+def encode_image(image, image_format=None, quality=None, max_bytes=None):
+    """ Кодирует изображение и возвращает байты """
+    from PIL import Image
+
+    image_format = image_format or IMAGE_FORMAT
+    quality = IMAGE_QUALITY if quality is None else quality
+    max_bytes = IMAGE_MAX_BYTES if max_bytes is None else max_bytes
+
+    if image_format == "png":
+        # Палитра без дизеринга: графики состоят из нескольких плоских цветов
+        palette = image.quantize(IMAGE_COLORS, method=Image.Quantize.FASTOCTREE,
+                                 dither=Image.Dither.NONE)
+        buffer = io.BytesIO()
+        palette.save(buffer, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+    while True:
+        buffer = io.BytesIO()
+        if image_format == "webp":
+            image.save(buffer, "WEBP", quality=quality, method=4)
+        else:
+            image.save(buffer, "JPEG", quality=quality, optimize=True,
+                       subsampling=0)
+        data = buffer.getvalue()
+        if not max_bytes or len(data) <= max_bytes or quality <= MIN_QUALITY:
+            return data
+        quality = max(quality - QUALITY_STEP, MIN_QUALITY)
+
+
+def encode_figure(fig, image_format=None, quality=None):
+    """ Отрисовывает фигуру и кодирует ее в байты """
+    return encode_image(render_image(fig), image_format, quality)
+
+
+def save_figure(fig, filepath, image_format=None, quality=None):
+    """ Сохраняет фигуру в файл; расширение заменяется по формату """
+    image_format = image_format or IMAGE_FORMAT
+    path = os.path.splitext(filepath)[0] + EXTENSIONS[image_format]
+    data = encode_figure(fig, image_format, quality)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
@@ -0,0 +1,187 @@
+"""
+Таблица инструментов бирж.
+
+Канонический инструмент - (база, котировка, тип торговли бота, экспирация
+ГГММДД или ""). Таблица сопоставляет ему нативный символ и категорию
+каждой биржи, на которой он торгуется:
+
+    ("BTC", "USD", "PERPETUAL FUTURES", "") ->
+        {"bybit": ("BTCUSD", "inverse"), "okx": ("BTC-USD-SWAP", "SWAP"),
+         "binance": ("BTCUSD_PERP", "FUTURES_PERP")}
+
+Таблица строится один раз из каталогов инструментов бирж
+(ExchangeAdapter.catalog_instruments) по их структурированным полям,
+поэтому символы не собираются из строки пары на каждом запросе, а биржи
+без инструмента не получают запросов. Биржи без каталога
+(catalog_instruments возвращает None) считаются поддерживающими любую пару.
+"""
+import difflib
+import functools
+import threading
+
+from Scripts.logger import log_warning
+
+
+# Номера месяцев для дат экспирации срочных фьючерсов
+MONTHS = {
+    'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
+    'MAY': '05', 'JUN': '06', 'JUL': '07', 'AUG': '08',
+    'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'
+}
+MONTH_NAMES = {number: name for name, number in MONTHS.items()}
+# Сколько похожих пар предлагать при опечатке
+SUGGESTIONS = 3
+
+_lock = threading.Lock()
+# Таблица: канонический инструмент -> {биржа: (символ, категория)}
+_table = None
+# Биржи, каталоги которых вошли в таблицу
+_covered = frozenset()
+# Названия инструментов по типам торговли для подсказок
+_names = {}
+
+
+def parse_expiry(expiry: str):
+    """ Дата экспирации ДДМММГГ (25DEC25) или ГГММДД в формате ГГММДД """
+    expiry = expiry.upper()
+    if len(expiry) == 6 and expiry.isdigit():
+        return expiry
+    if len(expiry) == 7 and expiry[2:5] in MONTHS \
+            and expiry[:2].isdigit() and expiry[5:].isdigit():
+        return expiry[5:] + MONTHS[expiry[2:5]] + expiry[:2]
+    raise ValueError(f"Неверная дата экспирации: {expiry}")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_pair(trading_pair: str, type_of_trade: str):
+    """ Канонический инструмент по паре вида BTC/USDT или BTC/USDT-25DEC25 """
+    base, _, quote = trading_pair.strip().upper().partition("/")
+    expiry = ""
+    if type_of_trade == "FUTURES" and "-" in quote:
+        quote, expiry = quote.split("-", 1)
+        expiry = parse_expiry(expiry)
+    if not base or not quote:
+        raise ValueError(f"Неверный формат пары: {trading_pair}")
+    return base, quote, type_of_trade, expiry
+
+
+def display_name(key) -> str:
+    """ Пара в формате ввода бота: BTC/USDT или BTC/USDT-25DEC25 """
+    base, quote, _, expiry = key
+    if expiry:
+        return f"{base}/{quote}-{expiry[4:]}{MONTH_NAMES[expiry[2:4]]}{expiry[:2]}"
+    return f"{base}/{quote}"
+
+
+def build(adapters):
+    """
+        Строит таблицу по каталогам адаптеров. Возвращает (таблица,
+        биржи с каталогом, все ли каталоги загрузились)
+    """
+    table, covered, complete = {}, set(), True
+    for adapter in adapters:
+        try:
+            rows = adapter.catalog_instruments()
+        except Exception as e:
+            # Биржа без каталога не отсекается и работает по строке пары
+            log_warning(f"Каталог инструментов {adapter.name} недоступен: {e}")
+            complete = False
+            continue
+        if rows is None:
+            continue
+        covered.add(adapter.name)
+        for base, quote, type_of_trade, expiry, symbol, category in rows:
+            table.setdefault((base, quote, type_of_trade, expiry), {}) \
+                [adapter.name] = (symbol, category)
+    return table, frozenset(covered), complete
+
+
+def get_table():
+    """ Таблица инструментов; строится при первом обращении """
+    global _table, _covered, _names
+    if _table is not None:
+        return _table
+    from Scripts.exchanges import get_adapters
+
+    with _lock:
+        if _table is None:
+            table, covered, complete = build(get_adapters())
+            names = {}
+            for key in table:
+                names.setdefault(key[2], []).append(display_name(key))
+            _covered, _names = covered, names
+            # Если каталог биржи не загрузился, таблица строится заново
+            # при следующем обращении
+            if not complete:
+                return table
+            _table = table
+    return _table
+
+
+def reset():
+    """ Сбрасывает таблицу (после сброса каталогов или смены бирж) """
+    global _table
+    with _lock:
+        _table = None
+
+
+def size():
+    """ Количество инструментов в таблице (0 - таблица не построена) """
+    return len(_table or {})
+
+
+def native(exchange: str, trading_pair: str, type_of_trade: str):
+    """
+        (символ, категория) инструмента на бирже или None, если таблица
+        еще не построена или биржа его не знает
+    """
+    if _table is None:
+        return None
+    try:
+        key = parse_pair(trading_pair, type_of_trade)
+    except ValueError:
+        return None
+    return _table.get(key, {}).get(exchange)
+
+
+def venues(trading_pair: str, type_of_trade: str, adapters):
+    """
+        Адаптеры, на биржах которых торгуется инструмент: биржи
+        с каталогом без инструмента отсекаются до запросов свечей
+    """
+    try:
+        key = parse_pair(trading_pair, type_of_trade)
+    except ValueError:
+        return list(adapters)
+    listed = get_table().get(key, {})
+    return [adapter for adapter in adapters
+            if adapter.name in listed or adapter.name not in _covered]
+
+
+def suggest(trading_pair: str, type_of_trade: str, count: int = SUGGESTIONS):
+    """ Похожие пары того же типа торговли из таблицы """
+    get_table()
+    query = trading_pair.strip().upper()
+    return difflib.get_close_matches(query, _names.get(type_of_trade, []),
+                                     n=count, cutoff=0.6)
+
+
+def unknown_pair_message(trading_pair: str, type_of_trade: str):
+    """
+        Текст ошибки, если пары нет ни на одной бирже (с подсказками),
+        иначе None. Пара считается известной, если у какой-то биржи нет
+        каталога
+    """
+    from Scripts.exchanges import get_adapters
+
+    try:
+        parse_pair(trading_pair, type_of_trade)
+    except ValueError as e:
+        return f"❌ {e}."
+    if venues(trading_pair, type_of_trade, get_adapters()):
+        return None
+    message = f"❌ Пара {trading_pair} ({type_of_trade}) не найдена ни на одной бирже."
+    suggestions = suggest(trading_pair, type_of_trade)
+    if suggestions:
+        message += f"\nВозможно, вы имели в виду: {', '.join(suggestions)}"
+    return message
@@ -0,0 +1,166 @@
+"""
+Lead-lag анализ бирж: какая биржа раньше других двигает цену и объем.
+
+Для каждой пары бирж считается кросс-корреляция доходностей (изменений
+логарифма цены закрытия) и изменений логарифма объема на сдвигах от
+-MAX_LAG до +MAX_LAG свечей. Корреляция на всех сдвигах сразу считается
+через БПФ (O(n log n)), поэтому анализ укладывается в обычный запрос даже
+для длинных рядов. Пропущенные свечи не участвуют в корреляции: число
+пересекающихся свечей на каждом сдвиге тоже считается через БПФ.
+
+Сдвиг k > 0 у пары (A, B) означает, что движение на A повторяется на B
+через k свечей, то есть A опережает B.
+
+numpy импортируется внутри функций: модуль загружается из main.py при
+старте ради configure() (см. Scripts/warmup.py).
+"""
+from itertools import combinations
+
+
+# Максимальный сдвиг, свечей
+MAX_LAG = 20
+# Минимум свечей для анализа
+MIN_CANDLES = 30
+# Порог значимости корреляции в единицах 1/sqrt(число свечей): максимум по
+# десяткам сдвигов у независимых рядов обычно не превышает 3/sqrt(n)
+SIGNIFICANCE = 4
+# Метрики: (ключ, колонка таблицы, подпись)
+METRICS = (("returns", "close", "Доходность"), ("volume", "volume", "Объем"))
+
+
+def configure(config: dict):
+    """ Применяет настройку LEAD_LAG_WINDOW из config.json """
+    global MAX_LAG
+    MAX_LAG = int(config.get("LEAD_LAG_WINDOW", MAX_LAG))
+    if MAX_LAG < 1:
+        raise ValueError("LEAD_LAG_WINDOW >= 1")
+
+
+def log_changes(values):
+    """ Изменения логарифма ряда; нулевые и пропущенные значения - NaN """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(np.where(values > 0, values, np.nan))
+    return np.diff(logs)
+
+
+def standardize(series):
+    """
+        Приводит ряды (m, n) к нулевому среднему и единичному отклонению.
+        Возвращает (ряды с нулями вместо пропусков, маску значений)
+    """
+    import numpy as np
+
+    mask = np.isfinite(series)
+    counts = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+    filled = np.where(mask, series, 0.0)
+    mean = filled.sum(axis=1, keepdims=True) / counts
+    centered = np.where(mask, series - mean, 0.0)
+    std = np.sqrt((centered ** 2).sum(axis=1, keepdims=True) / counts)
+    # Постоянный ряд ни с чем не коррелирует
+    return np.divide(centered, std, out=np.zeros_like(centered),
+                     where=std > 0), mask.astype(np.float64)
+
+
+def cross_correlations(series, pairs, max_lag: int):
+    """
+        Кросс-корреляции пар рядов (m, n) на сдвигах -max_lag..max_lag.
+        Возвращает массив (число пар, 2 * max_lag + 1)
+    """
+    import numpy as np
+
+    values, mask = standardize(series)
+    size = values.shape[1]
+    # Длина БПФ без наложения концов для сдвигов до max_lag
+    nfft = 1 << (size + max_lag - 1).bit_length()
+    spectra = np.fft.rfft(values, nfft, axis=1)
+    mask_spectra = np.fft.rfft(mask, nfft, axis=1)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    result = np.empty((len(pairs), len(lags)))
+    for row, (first, second) in enumerate(pairs):
+        # Элемент k - сумма first[t] * second[t + k]
+        sums = np.fft.irfft(np.conj(spectra[first]) * spectra[second], nfft)[lags]
+        overlap = np.fft.irfft(np.conj(mask_spectra[first])
+                               * mask_spectra[second], nfft)[lags]
+        result[row] = sums / np.maximum(np.rint(overlap), 1)
+    return result
+
+
+def analyse(aligned, max_lag: int = None):
+    """
+        Lead-lag анализ по выровненной таблице бирж (колонки
+        <биржа>.close и <биржа>.volume, см. user_func.aligned_frame).
+        Возвращает словарь с корреляциями и лучшими сдвигами пар
+        или None, если бирж меньше двух или свечей меньше MIN_CANDLES
+    """
+    import numpy as np
+
+    titles = [column[:-len(".close")] for column in aligned.columns
+              if column.endswith(".close")]
+    if len(titles) < 2 or len(aligned) < MIN_CANDLES:
+        return None
+    # Сдвиг не больше четверти ряда: дальше мало пересекающихся свечей
+    max_lag = max(1, min(max_lag or MAX_LAG, (len(aligned) - 1) // 4))
+    pairs = list(combinations(range(len(titles)), 2))
+
+    result = {
+        "titles": titles,
+        "pairs": [(titles[first], titles[second]) for first, second in pairs],
+        "lags": np.arange(-max_lag, max_lag + 1),
+        "candles": len(aligned),
+        "correlations": {},
+        "best": [],
+    }
+    for key, column, _ in METRICS:
+        series = np.vstack([log_changes(aligned[f"{title}.{column}"].to_numpy())
+                            for title in titles])
+        correlations = cross_correlations(series, pairs, max_lag)
+        result["correlations"][key] = correlations
+        for (first, second), row in zip(result["pairs"], correlations):
+            best = int(np.argmax(row))
+            result["best"].append({
+                "metric": key, "first": first, "second": second,
+                "lag": int(result["lags"][best]), "corr": float(row[best]),
+                "corr_zero": float(row[max_lag]),
+            })
+    return result
+
+
+def plural_candles(count: int):
+    """ Слово "свеча" в нужном падеже """
+    if count % 10 == 1 and count % 100 != 11:
+        return "свечу"
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return "свечи"
+    return "свечей"
+
+
+def format_summary(result, timeframe: str = None):
+    """ Текстовый итог lead-lag анализа для сообщения бота """
+    import numpy as np
+
+    # Корреляция ниже порога неотличима от шума для ряда такой длины
+    threshold = SIGNIFICANCE / np.sqrt(result["candles"])
+    lines = [f"🔀 Кто ведет рынок (сдвиг до ±{result['lags'][-1]} свечей):"]
+    for key, _, label in METRICS:
+        lines.append(f"{label}:")
+        for best in (item for item in result["best"] if item["metric"] == key):
+            pair = f"{best['first']} / {best['second']}"
+            if best["corr"] < threshold:
+                lines.append(f"• {pair}: связь не значима (r={best['corr']:.2f})")
+                continue
+            if best["lag"] == 0:
+                lines.append(f"• {pair}: синхронно (r={best['corr']:.2f})")
+                continue
+            leader = best["first"] if best["lag"] > 0 else best["second"]
+            lag = abs(best["lag"])
+            duration = f", {lag * int(timeframe)} мин" \
+                if timeframe and str(timeframe).isdigit() else ""
+            lines.append(
+                f"• {pair}: {leader} опережает на {lag} {plural_candles(lag)}"
+                f"{duration} (r={best['corr']:.2f}, без сдвига "
+                f"{best['corr_zero']:.2f})")
+    return "\n".join(lines)
@@ -1,25 +1,228 @@
+"""
+Неблокирующее журналирование.
+
+Обработчики запросов только кладут записи в очередь (QueueHandler),
+а запись в файл и вывод в консоль выполняет фоновый поток (QueueListener).
+В файл пишутся структурированные JSON-записи с идентификаторами задачи
+и пользователя из log_context(). Повторяющиеся предупреждения и ошибки
+ограничиваются по частоте, при переполнении очереди записи отбрасываются.
+"""
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
 
-# Имя файла для сохранения логов ошибок
+# Имя файла для сохранения логов
 LOG_FILENAME = 'Output/error_log.txt'
+# Максимальный размер очереди записей
+QUEUE_SIZE = 10000
+# Ограничение повторов: не более RATE_LIMIT_BURST одинаковых записей
+# уровня WARNING и выше за RATE_LIMIT_WINDOW секунд
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_WINDOW = 60.0
+
+# Идентификаторы задачи и пользователя для текущего запроса
+job_id_var = contextvars.ContextVar("job_id", default=None)
+user_id_var = contextvars.ContextVar("user_id", default=None)
+
+_listener = None
+_setup_lock = threading.Lock()
+_dropped = 0
+
+
+@contextmanager
+def log_context(job_id=None, user_id=None):
+    """ Привязывает идентификаторы задачи и пользователя к записям журнала """
+    tokens = [job_id_var.set(job_id), user_id_var.set(user_id)]
+    try:
+        yield
+    finally:
+        user_id_var.reset(tokens[1])
+        job_id_var.reset(tokens[0])
+
+
+class ContextFilter(logging.Filter):
+    """ Добавляет в запись идентификаторы из log_context() """
+
+    def filter(self, record):
+        if not hasattr(record, "job_id"):
+            record.job_id = job_id_var.get()
+        if not hasattr(record, "user_id"):
+            record.user_id = user_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """ Пропускает не более burst одинаковых записей за окно window """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, window=RATE_LIMIT_WINDOW,
+                 min_level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.min_level = min_level
+        self.lock = threading.Lock()
+        # ключ -> [начало окна, записей в окне, подавлено]
+        self.state = {}
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self.lock:
+            entry = self.state.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry else 0
+                self.state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                if len(self.state) > 10000:
+                    self.state = {k: v for k, v in self.state.items()
+                                  if now - v[0] < self.window}
+                return True
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """ QueueHandler, который отбрасывает записи при переполнении очереди """
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+    def prepare(self, record):
+        # Сообщение и трассировка исключения вычисляются в вызывающем потоке,
+        # поля записи (job_id, user_id, fields) сохраняются для JSON
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """ Форматирует запись как одну строку JSON """
+
+    def format(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for field in ("job_id", "user_id", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """ Краткий вывод в консоль: [LEVEL] сообщение """
+
+    def format(self, record):
+        line = f"[{record.levelname}] {record.getMessage()}"
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            line += f" (подавлено повторов: {suppressed})"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def setup_logging(log_file: str = LOG_FILENAME, level=logging.INFO,
+                  console: bool = True):
+    """ Настраивает корневой логгер на запись через очередь и фоновый поток """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        handlers = []
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setLevel(logging.WARNING)
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+        # httpx пишет каждый запрос к Telegram на уровне INFO
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """ Дописывает оставшиеся в очереди записи и останавливает фоновый поток """
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
 
-# Настройка конфигурации логирования
-logging.basicConfig(
-    filename=LOG_FILENAME,
-    level=logging.ERROR,
-    format='%(asctime)s [%(levelname)s] [%(module)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+def dropped_records():
+    """ Количество записей, отброшенных из-за переполненной очереди """
+    return _dropped
 
 
-def log_error(message: str):
-    # Логирование ошибки и вывод в консоль
-    logging.error(message)
-    print(f"[ERROR] {message}")
+def log_error(message: str, **fields):
+    # Логирование ошибки (запись в файл и консоль выполняет фоновый поток)
+    if _listener is None:
+        setup_logging()
+    logging.getLogger("bot").error(message, extra={"fields": fields},
+                                   stacklevel=2)
 
 
-def log_warning(message: str):
-    # Логирование предупреждения и вывод в консоль
-    logging.warning(message)
-    print(f"[WARNING] {message}")
-    
\ No newline at end of file
+def log_warning(message: str, **fields):
+    # Логирование предупреждения
+    if _listener is None:
+        setup_logging()
+    logging.getLogger("bot").warning(message, extra={"fields": fields},
+                                     stacklevel=2)
@@ -0,0 +1,391 @@
+"""
+Учет памяти и защита от утечек долгоживущего процесса бота.
+
+Бот создает фигуры matplotlib и DataFrame на каждый запрос, а кеши
+(свечи, file_id, шаблоны графиков, user_data пользователей) живут все
+время работы процесса. Модуль:
+
+- замеряет пиковое выделение памяти анализа через tracemalloc (job()).
+  Трассировка замедляет выделение памяти, поэтому включается только для
+  доли SAMPLE_RATE анализов и только если других анализов в это время нет.
+  Буферы отрисовки Agg выделяются вне Python и в замер не попадают;
+- публикует датчики памяти процесса, открытых фигур и размеров кешей
+  (update_gauges);
+- проверяет бюджеты: если задан JOB_BUDGET_MB (по умолчанию бюджет
+  отключен), анализ, оценка памяти которого больше бюджета,
+  выполняется по меньшему числу свечей или более крупному таймфрейму, а
+  если это не помогает - отклоняется (fit_budget). Оценка - постоянная
+  часть JOB_BASE_MB (рендер и кодирование графиков) и CANDLE_BYTES на
+  свечу каждой биржи, на которой торгуется пара. При RSS выше LIMIT_MB
+  кеши сбрасываются, а новые анализы отклоняются, пока память не
+  опустится (admit);
+- периодически ищет утечки (leak_check): если RSS растет LEAK_CHECKS
+  проверок подряд больше чем на LEAK_GROWTH_MB, а кеши не растут, в журнал
+  пишутся размеры кешей и типы объектов с наибольшим приростом.
+
+Настройки config.json: MEMORY_LIMIT_MB, JOB_MEMORY_MB, MEMORY_SAMPLE_RATE,
+LEAK_CHECK_SECONDS, LEAK_GROWTH_MB.
+"""
+import asyncio
+import ctypes
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import Scripts.candle_cache as candle_cache
+import Scripts.file_id_cache as file_id_cache
+import Scripts.instruments as instruments
+import Scripts.metrics as metrics
+from Scripts.logger import log_warning
+from Scripts.quick_commands import TIME_FORMAT, TIMEFRAMES
+
+
+# Предел памяти процесса (RSS) в МБ, обычно чуть ниже лимита контейнера
+# (None - без предела)
+LIMIT_MB = None
+# Бюджет памяти одного анализа в МБ (None - без бюджета). Самый большой
+# анализ, доступный в боте (1000 свечей на трех биржах), оценивается
+# примерно в 21 МБ; меньший бюджет уменьшает число свечей или таймфрейм
+JOB_BUDGET_MB = None
+# Доля анализов, для которых замеряется пиковое выделение памяти
+SAMPLE_RATE = 0.05
+# Период проверки утечек в секундах (0 - проверка отключена)
+LEAK_CHECK_SECONDS = 600.0
+# Рост RSS за LEAK_CHECKS проверок подряд, считающийся утечкой, в МБ
+LEAK_GROWTH_MB = 64
+LEAK_CHECKS = 3
+# Сколько типов объектов с наибольшим приростом писать в журнал
+LEAK_TYPES = 10
+# Минимальный интервал между сбросами кешей в секундах
+SHED_INTERVAL = 30.0
+# Оценка памяти анализа, не зависящая от числа свечей, в МБ: буферы
+# отрисовки Agg, кодирование и байты графиков при готовых шаблонах
+# (прирост пикового RSS анализа 300 свечей). Шаблоны новой комбинации
+# бирж - кеш, он ограничен MAX_TEMPLATES и в оценку не входит
+JOB_BASE_MB = 18
+# Оценка памяти на свечу одной биржи по всему конвейеру: ответ биржи,
+# список свечей, DataFrame, индикаторы, выровненная таблица и данные
+# графиков (наклон пикового RSS анализа от 300 до 60000 свечей, с запасом)
+CANDLE_BYTES = 1280
+
+# Ограниченные кеши: рост RSS вместе с ними не считается утечкой
+BOUNDED_CACHES = ("candles", "file_ids", "instruments", "chart_templates")
+
+
+class MemoryBudgetExceeded(Exception):
+    """ Анализ не помещается в бюджет памяти или процесс у предела памяти """
+
+
+_lock = threading.Lock()
+# Анализы, выполняющиеся сейчас
+_active = 0
+# Идет ли замер анализа и начинались ли во время него другие анализы
+_sampling = False
+_overlapped = False
+# RSS и размеры кешей последних проверок утечек
+_history = deque(maxlen=LEAK_CHECKS + 1)
+# Количество объектов по типам на прошлой проверке
+_types = None
+_last_shed = 0.0
+
+
+def configure(config: dict):
+    """ Применяет настройки памяти из config.json """
+    global LIMIT_MB, JOB_BUDGET_MB, SAMPLE_RATE, LEAK_CHECK_SECONDS, \
+        LEAK_GROWTH_MB
+    LIMIT_MB = config.get("MEMORY_LIMIT_MB", LIMIT_MB)
+    LIMIT_MB = float(LIMIT_MB) if LIMIT_MB else None
+    JOB_BUDGET_MB = config.get("JOB_MEMORY_MB", JOB_BUDGET_MB)
+    JOB_BUDGET_MB = float(JOB_BUDGET_MB) if JOB_BUDGET_MB else None
+    SAMPLE_RATE = float(config.get("MEMORY_SAMPLE_RATE", SAMPLE_RATE))
+    LEAK_CHECK_SECONDS = float(config.get("LEAK_CHECK_SECONDS",
+                                          LEAK_CHECK_SECONDS))
+    LEAK_GROWTH_MB = float(config.get("LEAK_GROWTH_MB", LEAK_GROWTH_MB))
+    if (JOB_BUDGET_MB is not None and JOB_BUDGET_MB <= JOB_BASE_MB) \
+            or not 0 <= SAMPLE_RATE <= 1:
+        raise ValueError(f"JOB_MEMORY_MB > {JOB_BASE_MB}, "
+                         f"0 <= MEMORY_SAMPLE_RATE <= 1")
+
+
+def rss_bytes():
+    """ Текущая память процесса (RSS) в байтах или None вне Linux """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def trim():
+    """
+        Возвращает системе свободную память аллокатора glibc: после
+        освобождения фигур и DataFrame она остается за процессом
+    """
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def cache_sizes(user_data=None):
+    """ Количество объектов в кешах процесса и user_data пользователей """
+    # Шаблоны считаются, только если модуль графиков уже загружен
+    templates = sys.modules.get("Scripts.chart_templates")
+    sizes = {
+        "candles": candle_cache.size(),
+        "file_ids": file_id_cache.size(),
+        "instruments": instruments.size(),
+        "chart_templates": templates.template_count() if templates else 0,
+    }
+    if user_data is not None:
+        users = list(user_data.values())
+        sizes["users"] = len(users)
+        sizes["recent_runs"] = sum(len(data.get("recent", ())) for data in users)
+    return sizes
+
+
+def update_gauges(user_data=None):
+    """ Обновляет датчики памяти и кешей; возвращает (RSS, размеры кешей) """
+    rss = rss_bytes()
+    if rss is not None:
+        metrics.set_gauge("memory_rss_bytes", rss)
+    sizes = cache_sizes(user_data)
+    for name, size in sizes.items():
+        metrics.set_gauge("memory_cached_objects", size, cache=name)
+    # Каждый шаблон графика - одна фигура matplotlib
+    metrics.set_gauge("memory_open_figures", sizes["chart_templates"])
+    return rss, sizes
+
+
+def shed(wait: bool = True):
+    """
+        Сбрасывает кеши и возвращает свободную память системе. Без wait
+        шаблоны графиков закрываются очередями рендера в фоне
+    """
+    global _last_shed
+    now = time.monotonic()
+    if now - _last_shed < SHED_INTERVAL:
+        return False
+    _last_shed = now
+    candle_cache.clear()
+    templates = sys.modules.get("Scripts.chart_templates")
+    if templates is not None:
+        # Очереди рендера закрывают свои шаблоны после текущих графиков
+        futures = templates.drop_templates()
+        if wait:
+            for future in futures:
+                future.result()
+    gc.collect()
+    trim()
+    metrics.inc_counter("memory_sheds_total")
+    return True
+
+
+def admit():
+    """
+        Проверяет предел памяти процесса перед анализом: при превышении
+        сбрасывает кеши, а если память не опустилась - отклоняет анализ
+    """
+    if not LIMIT_MB:
+        return
+    limit = LIMIT_MB * 2 ** 20
+    rss = rss_bytes()
+    if rss is None or rss <= limit:
+        return
+    # Анализ ждет в цикле событий, поэтому очереди рендера не ждем
+    if shed(wait=False):
+        rss = rss_bytes()
+        log_warning(f"Память процесса выше предела {LIMIT_MB:.0f} МБ, "
+                    f"кеши сброшены: {rss / 2 ** 20:.0f} МБ")
+    if rss > limit:
+        metrics.inc_counter("memory_rejections_total", reason="limit")
+        raise MemoryBudgetExceeded(
+            "❌ Бот перегружен, попробуйте через несколько минут.")
+
+
+def analysis_venues(params: dict):
+    """ Биржи, которые запросит анализ пары (Scripts/user_func.pair_venues) """
+    from Scripts.user_func import pair_venues
+
+    try:
+        return pair_venues(params["trade_pair"], params["trade_type"])
+    except ValueError:
+        # Пары нет ни на одной бирже: об этом сообщит сам анализ
+        return []
+
+
+def estimate_candles(params: dict, adapters=None):
+    """ Оценка числа свечей анализа по биржам пары (с учетом page_limit) """
+    if adapters is None:
+        adapters = analysis_venues(params)
+    if params["analysis_type"] == "last_candles":
+        count = int(params["candles_count"])
+    else:
+        start = datetime.strptime(params["start_time"], TIME_FORMAT)
+        end = datetime.strptime(params["end_time"], TIME_FORMAT)
+        minutes = (end - start).total_seconds() / 60
+        count = int(minutes // int(params["timeframe"])) + 1
+    # Биржа отдает не больше page_limit свечей на запрос
+    return sum(min(count, adapter.page_limit) for adapter in adapters)
+
+
+def fit_budget(params: dict, adapters=None):
+    """
+        Приводит анализ к бюджету памяти JOB_BUDGET_MB. Возвращает
+        (параметры, пояснение для пользователя или None); если анализ
+        не помещается в бюджет, вызывает MemoryBudgetExceeded
+    """
+    if not JOB_BUDGET_MB:
+        return params, None
+    if adapters is None:
+        adapters = analysis_venues(params)
+    budget = (JOB_BUDGET_MB - JOB_BASE_MB) * 2 ** 20
+
+    def fits(candidate):
+        return estimate_candles(candidate, adapters) * CANDLE_BYTES <= budget
+
+    if fits(params):
+        return params, None
+    if params["analysis_type"] == "last_candles":
+        # Наибольшее количество свечей, помещающееся в бюджет
+        low, high = 0, int(params["candles_count"])
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(dict(params, candles_count=middle)):
+                low = middle
+            else:
+                high = middle - 1
+        if low:
+            metrics.inc_counter("memory_downsampled_total")
+            return dict(params, candles_count=low), (
+                f"ℹ️ Запрос больше бюджета памяти: анализ по {low} "
+                f"последним свечам вместо {params['candles_count']}.")
+    else:
+        # Тот же диапазон с более крупным таймфреймом
+        for timeframe in TIMEFRAMES:
+            if int(timeframe) <= int(params["timeframe"]):
+                continue
+            candidate = dict(params, timeframe=timeframe)
+            if fits(candidate):
+                metrics.inc_counter("memory_downsampled_total")
+                return candidate, (
+                    f"ℹ️ Запрос больше бюджета памяти: таймфрейм "
+                    f"{timeframe}m вместо {params['timeframe']}m.")
+    metrics.inc_counter("memory_rejections_total", reason="budget")
+    raise MemoryBudgetExceeded(
+        f"❌ Анализ не помещается в бюджет памяти ({JOB_BUDGET_MB:.0f} МБ). "
+        f"Уменьшите количество свечей или диапазон времени.")
+
+
+@contextmanager
+def job(candles: int = None):
+    """
+        Учитывает выполняющийся анализ; для доли SAMPLE_RATE анализов
+        замеряет пиковое выделение памяти через tracemalloc. candles -
+        число свечей анализа для датчика памяти на свечу
+    """
+    global _active, _sampling, _overlapped
+    with _lock:
+        _active += 1
+        if _sampling:
+            # Пик замеряемого анализа включит память этого анализа
+            _overlapped = True
+        sample = (_active == 1 and SAMPLE_RATE > 0
+                  and not tracemalloc.is_tracing()
+                  and random.random() < SAMPLE_RATE)
+        if sample:
+            _sampling, _overlapped = True, False
+            tracemalloc.start()
+    try:
+        yield
+    finally:
+        with _lock:
+            _active -= 1
+            if sample:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                _sampling = False
+                overlapped = _overlapped
+        if sample:
+            if overlapped:
+                metrics.inc_counter("memory_samples_total", result="overlap")
+            else:
+                metrics.inc_counter("memory_samples_total", result="ok")
+                metrics.set_gauge("job_memory_peak_bytes", peak)
+                if candles:
+                    metrics.set_gauge("job_memory_per_candle_bytes",
+                                      peak / candles)
+
+
+def object_counts():
+    """ Количество объектов, отслеживаемых сборщиком мусора, по типам """
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+def leak_check(user_data=None):
+    """
+        Собирает мусор, обновляет датчики и сравнивает память с прошлыми
+        проверками. Возвращает True, если рост памяти похож на утечку
+    """
+    global _types
+    gc.collect()
+    trim()
+    rss, sizes = update_gauges(user_data)
+    types = object_counts()
+    previous_types, _types = _types, types
+    if rss is None:
+        return False
+    if LIMIT_MB and rss > LIMIT_MB * 2 ** 20:
+        shed()
+
+    _history.append((rss, sizes))
+    if len(_history) < _history.maxlen:
+        return False
+    values = [item[0] for item in _history]
+    first_sizes = _history[0][1]
+    growing = all(b > a for a, b in zip(values, values[1:]))
+    growth = values[-1] - values[0]
+    # Рост ограниченных кешей объясняет рост памяти
+    caches_grew = any(sizes[name] > first_sizes[name] for name in BOUNDED_CACHES)
+    if not growing or caches_grew or growth < LEAK_GROWTH_MB * 2 ** 20:
+        return False
+
+    metrics.inc_counter("memory_leak_suspects_total")
+    grown_types = (types - previous_types).most_common(LEAK_TYPES) \
+        if previous_types is not None else []
+    log_warning(
+        f"Память растет без роста кешей: +{growth / 2 ** 20:.0f} МБ за "
+        f"{LEAK_CHECKS} проверок, RSS {rss / 2 ** 20:.0f} МБ",
+        caches=sizes, grown_types=dict(grown_types))
+    # Следующее предупреждение - после нового окна проверок
+    _history.clear()
+    return True
+
+
+async def watch(user_data=None):
+    """ Периодическая проверка утечек в цикле событий бота """
+    while True:
+        await asyncio.sleep(LEAK_CHECK_SECONDS)
+        await asyncio.to_thread(leak_check, user_data)
+
+
+metrics.describe("memory_rss_bytes", "Память процесса (RSS)")
+metrics.describe("memory_cached_objects", "Объекты в кешах процесса")
+metrics.describe("memory_open_figures", "Открытые фигуры matplotlib")
+metrics.describe("job_memory_peak_bytes",
+                 "Пиковое выделение памяти последнего замеренного анализа")
+metrics.describe("job_memory_per_candle_bytes",
+                 "Пиковое выделение памяти анализа на свечу")
+metrics.describe("memory_rejections_total",
+                 "Анализы, отклоненные из-за бюджета или предела памяти")
+metrics.describe("memory_downsampled_total",
+                 "Анализы, уменьшенные до бюджета памяти")
+metrics.describe("memory_sheds_total", "Сбросы кешей при превышении памяти")
+metrics.describe("memory_leak_suspects_total", "Подозрения на утечку памяти")
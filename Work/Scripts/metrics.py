@@ -0,0 +1,239 @@
+"""
+Трассировка этапов анализа и метрики в формате Prometheus.
+
+span() замеряет длительность этапа и строит дерево вложенных этапов
+одного запроса; длительности попадают в гистограмму stage_duration_seconds.
+Счетчики и датчики регистрируются функциями inc_counter/set_gauge/add_gauge.
+start_metrics_server() поднимает локальный HTTP-эндпоинт /metrics.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Scripts.logger import log_warning
+
+
+# Границы корзин гистограмм длительностей (в секундах)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Порог медленного запроса в секундах (None - журнал отключен)
+SLOW_REQUEST_SECONDS = None
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_help = {}
+
+# Текущий этап трассировки (наследуется потоками через copy_context)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()
+                              if v is not None))
+
+
+def describe(name: str, text: str):
+    """ Задает описание метрики для вывода в # HELP """
+    _help[name] = text
+
+
+def inc_counter(name: str, amount: float = 1, **labels):
+    """ Увеличивает счетчик """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels):
+    """ Устанавливает значение датчика """
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name: str, amount: float, **labels):
+    """ Изменяет значение датчика на amount """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels):
+    """ Добавляет наблюдение в гистограмму """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def get_counter(name: str, **labels):
+    """ Возвращает текущее значение счетчика """
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def reset():
+    """ Сбрасывает все метрики (для бенчмарков) """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+class Span:
+    """ Этап обработки запроса с вложенными этапами """
+
+    def __init__(self, name, exchange=None, attrs=None):
+        self.name = name
+        self.exchange = exchange
+        self.attrs = attrs or {}
+        self.children = []
+        self.started = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def format_tree(self, depth=0):
+        """ Текстовое представление дерева этапов """
+        label = self.name
+        if self.exchange:
+            label += f"[{self.exchange}]"
+        details = "".join(f" {k}={v}" for k, v in self.attrs.items())
+        duration = "…" if self.duration is None else f"{self.duration * 1000:.1f} мс"
+        line = f"{'  ' * depth}{label} {duration}{details}"
+        if self.error:
+            line += f" ошибка={self.error}"
+        lines = [line]
+        for child in sorted(self.children, key=lambda s: s.started):
+            lines.append(child.format_tree(depth + 1))
+        return "\n".join(lines)
+
+
+def current_span():
+    """ Возвращает текущий этап трассировки или None """
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, exchange: str = None, **attrs):
+    """ Замеряет этап name; вложенные span() становятся его дочерними этапами """
+    parent = _current_span.get()
+    current = Span(name, exchange, attrs)
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.started
+        _current_span.reset(token)
+        observe("stage_duration_seconds", current.duration,
+                stage=name, exchange=exchange)
+        if parent is None:
+            _finish_root(current)
+
+
+def _finish_root(root: Span):
+    """ Пишет дерево этапов медленного запроса в журнал """
+    if SLOW_REQUEST_SECONDS is not None and root.duration >= SLOW_REQUEST_SECONDS:
+        inc_counter("slow_requests_total", stage=root.name)
+        log_warning(f"Медленный запрос ({root.duration:.2f} с):\n"
+                    f"{root.format_tree()}")
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    """ Возвращает все метрики в текстовом формате Prometheus """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"],
+                          "count": v["count"]}
+                      for k, v in _histograms.items()}
+
+    lines = []
+
+    def header(name, kind, seen):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter", seen)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge", seen)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in sorted(histograms.items()):
+        header(name, "histogram", seen)
+        for bound, count in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} "
+                     f"{histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Отдает метрики по GET /metrics """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """ Запускает HTTP-эндпоинт /metrics в фоновом потоке """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever,
+                              name="metrics-server", daemon=True)
+    thread.start()
+    return server
+
+
+describe("stage_duration_seconds", "Длительность этапов анализа")
+describe("cache_hits_total", "Попадания в кеш")
+describe("cache_misses_total", "Промахи кеша")
+describe("upstream_errors_total", "Ошибки запросов к биржам")
+describe("analysis_queue_depth", "Анализы, ожидающие или выполняющиеся")
+describe("analysis_requests_total", "Запуски анализа по результату")
+describe("slow_requests_total", "Запросы дольше порога медленного журнала")
+describe("time_to_first_chart_seconds",
+         "Время от начала анализа до отправки первого графика")
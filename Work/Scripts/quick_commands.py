@@ -0,0 +1,223 @@
+"""
+Однострочные команды анализа без пошагового диалога.
+
+    /vol BTC/USDT spot 15 200
+    /range BTC/USDT perp 5 12.06.2025 09:00 12.06.2025 12:00
+    /season BTC/USDT spot 90
+
+Аргументы разбираются за один шаг в словарь параметров с теми же ключами,
+что собирает диалог /start (analysis_type, trade_type, trade_pair,
+timeframe, candles_count, start_time, end_time), поэтому анализ
+запускается тем же кодом. Те же аргументы без имени команды принимаются
+в inline-режиме (@бот BTC/USDT spot 15 200).
+
+Недавние параметры пользователя хранятся в его user_data и кодируются
+в callback_data кнопок для повторного запуска одним нажатием.
+"""
+from datetime import datetime
+
+
+# Допустимые таймфреймы (в минутах), как в диалоге
+TIMEFRAMES = ("1", "3", "5", "15", "30", "60")
+# Максимум свечей в анализе последних свечей
+MAX_CANDLES = 1000
+# Формат времени в командах и диалоге
+TIME_FORMAT = "%d.%m.%Y %H:%M"
+# Максимальное окно сезонности, дней
+MAX_SEASON_DAYS = 3650
+# Сколько последних запусков помнить для повтора
+RECENT_LIMIT = 5
+# Префикс callback_data кнопок повторного запуска
+RERUN_PREFIX = "run:"
+
+# Написания типа контракта в командах
+TRADE_TYPES = {
+    "spot": "SPOT",
+    "fut": "FUTURES",
+    "futures": "FUTURES",
+    "perp": "PERPETUAL FUTURES",
+    "perpetual": "PERPETUAL FUTURES",
+    "swap": "PERPETUAL FUTURES",
+}
+# Короткие коды типа контракта в callback_data (не более 64 байт)
+TRADE_TYPE_CODES = {"SPOT": "S", "FUTURES": "F", "PERPETUAL FUTURES": "P"}
+# Компактный формат времени в callback_data
+CALLBACK_TIME_FORMAT = "%y%m%d%H%M"
+
+VOL_USAGE = "/vol ПАРА ТИП ТАЙМФРЕЙМ КОЛИЧЕСТВО\nПример: /vol BTC/USDT spot 15 200"
+RANGE_USAGE = ("/range ПАРА ТИП ТАЙМФРЕЙМ ДД.ММ.ГГГГ ЧЧ:ММ ДД.ММ.ГГГГ ЧЧ:ММ\n"
+               "Пример: /range BTC/USDT perp 5 12.06.2025 09:00 12.06.2025 12:00")
+
+SEASON_USAGE = "/season ПАРА ТИП [ДНЕЙ]\nПример: /season BTC/USDT spot 90"
+
+
+def validate_pair(trade_pair: str, trade_type: str):
+    """ Проверяет формат пары для типа контракта; возвращает текст ошибки или None """
+    if "/" not in trade_pair:
+        return "❌ Неверный формат. Используйте / для разделения пар."
+    base, quote = trade_pair.split("/", 1)
+    if trade_type == "FUTURES" and "-" not in quote:
+        return "❌ Для FUTURES укажите дату экспирации (например BTC/USDT-25DEC25)."
+    if trade_type != "FUTURES" and "-" in quote:
+        return "❌ Для SPOT/PERPETUAL не указывайте дату."
+    return None
+
+
+def parse_trade_type(value: str):
+    """ Тип контракта по написанию в команде """
+    trade_type = TRADE_TYPES.get(value.lower())
+    if trade_type is None:
+        raise ValueError("❌ Тип контракта: spot, fut или perp.")
+    return trade_type
+
+
+def parse_timeframe(value: str):
+    """ Таймфрейм в минутах; допускается суффикс m (15m) """
+    timeframe = value.lower().removesuffix("m")
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"❌ Таймфрейм: {', '.join(TIMEFRAMES)}.")
+    return timeframe
+
+
+def parse_common(args):
+    """ Пара, тип контракта и таймфрейм из первых трех аргументов """
+    trade_pair = args[0].upper()
+    trade_type = parse_trade_type(args[1])
+    error = validate_pair(trade_pair, trade_type)
+    if error:
+        raise ValueError(error)
+    return {"trade_pair": trade_pair, "trade_type": trade_type,
+            "timeframe": parse_timeframe(args[2])}
+
+
+def parse_vol(args):
+    """ Параметры анализа последних свечей из аргументов /vol """
+    if len(args) != 4:
+        raise ValueError(f"❌ Формат команды:\n{VOL_USAGE}")
+    params = parse_common(args)
+    try:
+        count = int(args[3])
+        if not 1 <= count <= MAX_CANDLES:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"❌ Количество свечей: от 1 до {MAX_CANDLES}.") from None
+    params.update(analysis_type="last_candles", candles_count=count)
+    return params
+
+
+def parse_range(args):
+    """ Параметры анализа диапазона времени из аргументов /range """
+    if len(args) != 7:
+        raise ValueError(f"❌ Формат команды:\n{RANGE_USAGE}")
+    params = parse_common(args)
+    start_time, end_time = " ".join(args[3:5]), " ".join(args[5:7])
+    try:
+        start = datetime.strptime(start_time, TIME_FORMAT)
+        end = datetime.strptime(end_time, TIME_FORMAT)
+    except ValueError:
+        raise ValueError("❌ Неверный формат времени. Используйте ДД.ММ.ГГГГ ЧЧ:ММ.") from None
+    if end <= start:
+        raise ValueError("❌ Время окончания должно быть позже начала.")
+    params.update(analysis_type="time_range", start_time=start_time,
+                  end_time=end_time)
+    return params
+
+
+def parse_season(args):
+    """
+        Пара, тип контракта и окно в днях (None - по умолчанию)
+        из аргументов /season
+    """
+    if len(args) not in (2, 3):
+        raise ValueError(f"❌ Формат команды:\n{SEASON_USAGE}")
+    trade_pair = args[0].upper()
+    trade_type = parse_trade_type(args[1])
+    error = validate_pair(trade_pair, trade_type)
+    if error:
+        raise ValueError(error)
+    days = None
+    if len(args) == 3:
+        try:
+            days = int(args[2])
+            if not 1 <= days <= MAX_SEASON_DAYS:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"❌ Окно: от 1 до {MAX_SEASON_DAYS} дней.") from None
+    return {"trade_pair": trade_pair, "trade_type": trade_type, "days": days}
+
+
+def parse_query(text: str):
+    """ Параметры из текста inline-запроса: аргументы /vol или /range """
+    args = text.split()
+    if args and args[0].lower() in ("/vol", "vol", "/range", "range"):
+        args = args[1:]
+    return parse_range(args) if len(args) == 7 else parse_vol(args)
+
+
+def describe(params: dict):
+    """ Короткое описание параметров для кнопок и подсказок """
+    text = f"{params['trade_pair']} {params['trade_type']} {params['timeframe']}m"
+    if params["analysis_type"] == "last_candles":
+        return f"{text}, {params['candles_count']} свечей"
+    return f"{text}, {params['start_time']} – {params['end_time']}"
+
+
+def to_command(params: dict):
+    """ Однострочная команда, повторяющая анализ """
+    trade_type = next(alias for alias, value in TRADE_TYPES.items()
+                      if value == params["trade_type"])
+    common = f"{params['trade_pair']} {trade_type} {params['timeframe']}"
+    if params["analysis_type"] == "last_candles":
+        return f"/vol {common} {params['candles_count']}"
+    return f"/range {common} {params['start_time']} {params['end_time']}"
+
+
+def encode_callback(params: dict):
+    """ callback_data кнопки повторного запуска """
+    fields = [params["trade_pair"], TRADE_TYPE_CODES[params["trade_type"]],
+              params["timeframe"]]
+    if params["analysis_type"] == "last_candles":
+        fields = ["v"] + fields + [str(params["candles_count"])]
+    else:
+        fields = ["r"] + fields + [
+            datetime.strptime(params[key], TIME_FORMAT)
+            .strftime(CALLBACK_TIME_FORMAT) for key in ("start_time", "end_time")]
+    return RERUN_PREFIX + "|".join(fields)
+
+
+def decode_callback(data: str):
+    """ Параметры анализа из callback_data кнопки повторного запуска """
+    fields = data.removeprefix(RERUN_PREFIX).split("|")
+    trade_type = next(value for value, code in TRADE_TYPE_CODES.items()
+                      if code == fields[2])
+    params = {"trade_pair": fields[1], "trade_type": trade_type,
+              "timeframe": fields[3]}
+    if fields[0] == "v":
+        params.update(analysis_type="last_candles", candles_count=int(fields[4]))
+    else:
+        params.update(analysis_type="time_range", **{
+            key: datetime.strptime(value, CALLBACK_TIME_FORMAT)
+            .strftime(TIME_FORMAT)
+            for key, value in zip(("start_time", "end_time"), fields[4:6])})
+    return params
+
+
+def analysis_params(user_data: dict):
+    """ Параметры анализа из user_data диалога """
+    keys = ["analysis_type", "trade_type", "trade_pair", "timeframe"]
+    keys += ["candles_count"] if user_data["analysis_type"] == "last_candles" \
+        else ["start_time", "end_time"]
+    return {key: user_data[key] for key in keys}
+
+
+def remember(user_data: dict, params: dict):
+    """ Добавляет параметры в начало списка недавних запусков пользователя """
+    recent = [item for item in user_data.get("recent", []) if item != params]
+    user_data["recent"] = [dict(params)] + recent[:RECENT_LIMIT - 1]
+
+
+def recent(user_data: dict, prefix: str = ""):
+    """ Недавние запуски пользователя, пара которых начинается с prefix """
+    prefix = prefix.strip().upper()
+    return [params for params in user_data.get("recent", [])
+            if params["trade_pair"].startswith(prefix)]
@@ -0,0 +1,160 @@
+"""
+Сезонность объема: объем по часу суток и дню недели (UTC) по биржам.
+
+Источник - локальное хранилище свечей (Scripts/candle_storage.py). При
+записи свечей в архив серии дописывается почасовая сводка объема, поэтому
+окно в 90 дней минутных свечей - это около 2160 строк сводки, а не 130
+тысяч свечей, и анализ занимает миллисекунды.
+
+Часы сводки раскладываются по 168 ячейкам (день недели × час) одним
+np.bincount по коду ячейки weekday * 24 + hour. Средний объем ячейки -
+сумма объема, деленная на число часов этой ячейки в окне (тоже bincount),
+поэтому неполные недели и пропуски в истории не искажают картину. Доля
+биржи в часе суток - ее объем в этом часе, деленный на объем всех бирж:
+объем в хранилище уже в монетах (ExchangeAdapter.normalize при загрузке),
+поэтому доли срочных контрактов OKX сравнимы с другими биржами.
+
+numpy и хранилище импортируются внутри функций: настройки модуля
+применяются из main.py при старте, до импорта тяжелых модулей.
+"""
+import time
+
+from Scripts.exchanges import get_adapter
+
+
+# Окно анализа по умолчанию, дней
+DAYS = 90
+# Таймфреймы хранилища, из которых строится сводка (от мелкого к крупному):
+# у более длинных свечей объем не делится по часам
+TIMEFRAMES = ("1", "3", "5", "15", "30", "60")
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+HOURS = 24
+CELLS = len(WEEKDAYS) * HOURS
+DAY_MS = 86_400_000
+
+
+def configure(config: dict):
+    """ Применяет настройку SEASONALITY_DAYS из config.json """
+    global DAYS
+    DAYS = int(config.get("SEASONALITY_DAYS", DAYS))
+    if DAYS < 1:
+        raise ValueError("SEASONALITY_DAYS >= 1")
+
+
+def cell_codes(hours):
+    """ Коды ячеек weekday * 24 + hour для начал часов в мс (UTC) """
+    import numpy as np
+    import Scripts.candle_storage as storage
+
+    hours = np.asarray(hours, dtype=np.int64)
+    # 1 января 1970 года - четверг (день 3, если понедельник - 0)
+    weekdays = (hours // DAY_MS + 3) % len(WEEKDAYS)
+    return weekdays * HOURS + hours // storage.HOUR_MS % HOURS
+
+
+def heatmap(hours, volumes):
+    """
+        Средний объем часа по ячейкам (7, 24): день недели × час суток.
+        Ячейки без часов в окне - NaN
+    """
+    import numpy as np
+
+    codes = cell_codes(hours)
+    totals = np.bincount(codes, weights=volumes, minlength=CELLS)
+    observed = np.bincount(codes, minlength=CELLS)
+    mean = np.divide(totals, observed, out=np.full(CELLS, np.nan),
+                     where=observed > 0)
+    return mean.reshape(len(WEEKDAYS), HOURS)
+
+
+def stored_series(type_of_trade: str, trading_pair: str):
+    """ Биржи хранилища с самым мелким подходящим таймфреймом: {биржа: таймфрейм} """
+    import Scripts.candle_storage as storage
+
+    found = {}
+    for timeframe in TIMEFRAMES:
+        for exchange in storage.stored_exchanges(type_of_trade, trading_pair,
+                                                 timeframe):
+            found.setdefault(exchange, timeframe)
+    return found
+
+
+def exchange_title(exchange: str):
+    """ Название биржи для графика; для незарегистрированной - имя папки """
+    try:
+        return get_adapter(exchange).title
+    except KeyError:
+        return exchange
+
+
+def analyse(type_of_trade: str, trading_pair: str, start: int = None,
+            end: int = None):
+    """
+        Сезонность объема пары по истории хранилища за [start, end] (мс),
+        по умолчанию - за последние DAYS дней. Возвращает словарь со
+        средним объемом по ячейкам и долями бирж по часам суток или None,
+        если истории по паре нет
+    """
+    import numpy as np
+    import Scripts.candle_storage as storage
+
+    if end is None:
+        end = int(time.time() * 1000)
+    if start is None:
+        start = end - DAYS * DAY_MS
+
+    result = {"pair": trading_pair, "type": type_of_trade, "start": start,
+              "end": end, "titles": [], "timeframes": {}, "hours": {},
+              "mean": {}, "by_hour": {}}
+    for exchange, timeframe in stored_series(type_of_trade, trading_pair).items():
+        hours, volumes = storage.hourly_volume(exchange, type_of_trade,
+                                               trading_pair, timeframe,
+                                               start, end)
+        if len(hours) == 0:
+            continue
+        title = exchange_title(exchange)
+        result["titles"].append(title)
+        result["timeframes"][title] = timeframe
+        result["hours"][title] = len(hours)
+        result["mean"][title] = heatmap(hours, volumes)
+        result["by_hour"][title] = np.bincount(
+            hours // storage.HOUR_MS % HOURS, weights=volumes, minlength=HOURS)
+    if not result["titles"]:
+        return None
+
+    # Доля биржи в объеме всех бирж по часу суток
+    by_hour = np.vstack([result["by_hour"][title] for title in result["titles"]])
+    total = by_hour.sum(axis=0)
+    shares = np.divide(by_hour, total, out=np.zeros_like(by_hour),
+                       where=total > 0)
+    result["shares"] = dict(zip(result["titles"], shares))
+    return result
+
+
+def format_summary(result):
+    """ Текстовый итог сезонности для сообщения бота """
+    import numpy as np
+
+    days = (result["end"] - result["start"]) / DAY_MS
+    lines = [f"🗓 Сезонность объема {result['pair']} за {days:.0f} дн. (UTC):"]
+    for title in result["titles"]:
+        mean = result["mean"][title]
+        if np.isnan(mean).all():
+            continue
+        average = np.nanmean(mean)
+        peak = np.unravel_index(np.nanargmax(mean), mean.shape)
+        low = np.unravel_index(np.nanargmin(mean), mean.shape)
+        ratio = f" (x{mean[peak] / average:.1f} к среднему)" if average > 0 else ""
+        lines.append(
+            f"• {title}: пик {WEEKDAYS[peak[0]]} {peak[1]:02d}:00{ratio}, "
+            f"минимум {WEEKDAYS[low[0]]} {low[1]:02d}:00")
+    if len(result["titles"]) > 1:
+        shares = np.vstack([result["shares"][title]
+                            for title in result["titles"]])
+        # Часы без объема ни на одной бирже не учитываются
+        leaders = np.argmax(shares[:, shares.sum(axis=0) > 0], axis=0)
+        counts = np.bincount(leaders, minlength=len(result["titles"]))
+        lines.append("Лидер по доле объема: " + ", ".join(
+            f"{title} - {count} ч" for title, count
+            in zip(result["titles"], counts) if count))
+    return "\n".join(lines)
@@ -0,0 +1,353 @@
+"""
+Поток сделок: объем покупок, продаж и дельта объема (CVD).
+
+Объем свечей не говорит, кто был агрессором, поэтому OBV - лишь грубая
+оценка потока. Для пар из TRADE_STREAMS в config.json бот подписывается
+на публичные потоки сделок бирж (WebSocket, при TRADE_STREAM_MODE="rest" -
+опрос REST) и сворачивает каждую сделку в минутный бар: объем покупок,
+объем продаж и число сделок. Сами сделки не хранятся: в памяти только
+последние MAX_BARS баров на биржу.
+
+После подключения и каждого переподключения последние сделки догружаются
+через REST; повторы отсекаются по id сделки. Графики CVD строятся по
+барам за окно анализа (flow_frames) рядом с графиком OBV.
+
+Пример config.json:
+    "TRADE_STREAMS": ["BTC/USDT SPOT", "BTC/USDT PERPETUAL FUTURES"]
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import Scripts.metrics as metrics
+from Scripts.exchanges import ExchangeAdapter, get_adapters
+from Scripts.logger import log_warning
+
+
+# Длительность бара в мс
+BAR_MS = 60_000
+# Сколько последних баров хранится на биржу (сутки минутных баров)
+MAX_BARS = 1440
+# Сколько последних id сделок помнится для отсева повторов
+SEEN_TRADES = 20_000
+# Потоки сделок: список (торговая пара, тип торговли)
+TRADE_STREAMS = []
+# Источник сделок: "ws" (WebSocket) или "rest" (опрос REST)
+MODE = "ws"
+# Интервал опроса REST и отправки ping в WebSocket, с
+POLL_SECONDS = 2.0
+PING_SECONDS = 20.0
+# Задержки перед переподключением, с
+RECONNECT_DELAYS = (1, 2, 5, 10, 30)
+# Типы торговли бота
+TRADE_TYPES = ("PERPETUAL FUTURES", "FUTURES", "SPOT")
+
+# Потоки: (биржа, пара, тип торговли) -> TradeStream
+_streams = {}
+
+
+def configure(config: dict):
+    """ Применяет настройки TRADE_STREAMS и TRADE_STREAM_MODE из config.json """
+    global TRADE_STREAMS, MODE
+    streams = []
+    for spec in config.get("TRADE_STREAMS", []):
+        pair, _, trade_type = spec.strip().partition(" ")
+        trade_type = trade_type.strip().upper() or "SPOT"
+        if trade_type not in TRADE_TYPES:
+            raise ValueError(f"Неизвестный тип торговли в TRADE_STREAMS: {spec}")
+        streams.append((pair.upper(), trade_type))
+    TRADE_STREAMS = streams
+    MODE = config.get("TRADE_STREAM_MODE", MODE)
+    if MODE not in ("ws", "rest"):
+        raise ValueError("TRADE_STREAM_MODE: ws или rest")
+
+
+class TradeFlowAggregator:
+    """
+        Свертка сделок в бары: [объем покупок, объем продаж, число сделок].
+        Сделки добавляются из цикла событий, бары читаются из потоков
+        рендера, поэтому изменения и чтение идут под блокировкой.
+    """
+
+    def __init__(self, bar_ms: int = BAR_MS, max_bars: int = MAX_BARS,
+                 size_scale: float = 1.0):
+        self.bar_ms = bar_ms
+        self.max_bars = max_bars
+        self.size_scale = size_scale
+        self.trades = 0
+        self.duplicates = 0
+        self._bars = {}
+        self._seen = set()
+        self._seen_order = deque()
+        self._lock = threading.Lock()
+
+    def _remember(self, trade_id):
+        """ Запоминает id сделки; True, если сделка уже была """
+        if trade_id in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen.add(trade_id)
+        self._seen_order.append(trade_id)
+        if len(self._seen_order) > SEEN_TRADES:
+            self._seen.discard(self._seen_order.popleft())
+        return False
+
+    def _bar(self, start: int):
+        """ Бар с началом start; при переполнении удаляется самый старый """
+        bar = self._bars.get(start)
+        if bar is None:
+            bar = self._bars[start] = [0.0, 0.0, 0]
+            if len(self._bars) > self.max_bars:
+                del self._bars[min(self._bars)]
+        return bar
+
+    def add(self, trade_id, timestamp: int, price: float, size: float,
+            is_buy: bool):
+        """ Добавляет одну сделку (путь для сообщений WebSocket) """
+        with self._lock:
+            if self._remember(trade_id):
+                return
+            bar = self._bar(timestamp - timestamp % self.bar_ms)
+            bar[0 if is_buy else 1] += size * self.size_scale
+            bar[2] += 1
+            self.trades += 1
+
+    def add_many(self, trades):
+        """
+            Добавляет пачку сделок [(id, время, цена, объем, покупка)]:
+            повторы отсекаются, бары пачки считаются через np.bincount
+        """
+        with self._lock:
+            fresh = [trade for trade in trades if not self._remember(trade[0])]
+            if not fresh:
+                return 0
+            _, timestamps, _, sizes, is_buy = zip(*fresh)
+            timestamps = np.fromiter(timestamps, dtype=np.int64, count=len(fresh))
+            sizes = np.fromiter(sizes, dtype=np.float64, count=len(fresh)) \
+                * self.size_scale
+            is_buy = np.fromiter(is_buy, dtype=bool, count=len(fresh))
+
+            starts, positions = np.unique(timestamps - timestamps % self.bar_ms,
+                                          return_inverse=True)
+            buys = np.bincount(positions, weights=sizes * is_buy,
+                               minlength=len(starts))
+            sells = np.bincount(positions, weights=sizes * ~is_buy,
+                                minlength=len(starts))
+            counts = np.bincount(positions, minlength=len(starts))
+            for start, buy, sell, count in zip(starts.tolist(), buys.tolist(),
+                                               sells.tolist(), counts.tolist()):
+                bar = self._bar(start)
+                bar[0] += buy
+                bar[1] += sell
+                bar[2] += count
+            self.trades += len(fresh)
+            return len(fresh)
+
+    def bars(self, start: int = None, end: int = None):
+        """
+            Бары с началом в [start, end] (мс) массивом (N, 4):
+            начало бара, объем покупок, объем продаж, число сделок
+        """
+        with self._lock:
+            rows = [(bar_start, *bar) for bar_start, bar in self._bars.items()
+                    if (start is None or bar_start >= start)
+                    and (end is None or bar_start <= end)]
+        rows.sort()
+        return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def flow_frame(bars, interval_ms: int = None):
+    """
+        DataFrame потока сделок по барам aggregator.bars(): объемы покупок
+        и продаж, дельта, число сделок и CVD (накопленная дельта от начала
+        окна), сгруппированные по interval_ms
+    """
+    import pandas as pd
+
+    starts = bars[:, 0].astype(np.int64)
+    if interval_ms:
+        starts = starts - starts % interval_ms
+    df = pd.DataFrame({"buy_volume": bars[:, 1], "sell_volume": bars[:, 2],
+                       "trades": bars[:, 3]},
+                      index=pd.to_datetime(starts, unit="ms"))
+    df = df.groupby(level=0).sum()
+    df.index.name = "timestamp"
+    df["delta"] = df["buy_volume"] - df["sell_volume"]
+    df["cvd"] = df["delta"].cumsum()
+    return df
+
+
+class TradeStream:
+    """ Поток сделок одной биржи по одной паре """
+
+    def __init__(self, adapter, trading_pair: str, type_of_trade: str,
+                 mode: str = None):
+        self.adapter = adapter
+        self.trading_pair = trading_pair
+        self.type_of_trade = type_of_trade
+        self.mode = mode or MODE
+        self.aggregator = TradeFlowAggregator(
+            size_scale=adapter.trade_size_scale(type_of_trade))
+        self.connected = False
+
+    @property
+    def label(self):
+        return f"{self.adapter.name} {self.trading_pair} {self.type_of_trade}"
+
+    async def poll_once(self):
+        """ Догружает последние сделки через REST """
+        trades = await asyncio.to_thread(self.adapter.fetch_trades,
+                                         self.trading_pair, self.type_of_trade)
+        if trades is None:
+            raise ValueError(f"Ошибка валидации запроса сделок {self.label}")
+        added = self.aggregator.add_many(trades)
+        metrics.inc_counter("trades_total", added, exchange=self.adapter.name,
+                            source="rest")
+        return added
+
+    async def run(self):
+        """ Получает сделки до отмены задачи, переподключаясь при ошибках """
+        import aiohttp
+
+        attempt = 0
+        async with aiohttp.ClientSession() as session:
+            while True:
+                started = time.monotonic()
+                try:
+                    if self.mode == "ws":
+                        await self.run_websocket(session)
+                    else:
+                        await self.run_polling()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log_warning(f"Поток сделок {self.label} прерван: {e}")
+                self.connected = False
+                metrics.inc_counter("trade_stream_reconnects_total",
+                                    exchange=self.adapter.name)
+                # Счетчик попыток сбрасывается после долгой работы потока
+                attempt = 0 if time.monotonic() - started > 60 else attempt + 1
+                await asyncio.sleep(
+                    RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)])
+
+    async def run_polling(self):
+        """ Опрос REST каждые POLL_SECONDS секунд """
+        while True:
+            await self.poll_once()
+            self.connected = True
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def run_websocket(self, session):
+        """ Чтение потока WebSocket до разрыва соединения """
+        import aiohttp
+
+        url, subscribe = self.adapter.trade_stream(self.trading_pair,
+                                                   self.type_of_trade)
+        async with session.ws_connect(url, autoping=True) as ws:
+            if subscribe is not None:
+                await ws.send_json(subscribe)
+            # Сделки, пропущенные до подключения, догружаются через REST
+            await self.poll_once()
+            self.connected = True
+            pinger = asyncio.create_task(self.ping(ws)) \
+                if self.adapter.ping_message is not None else None
+            add = self.aggregator.add
+            parse = self.adapter.parse_trade_message
+            received = 0
+            try:
+                async for message in ws:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        if message.type in (aiohttp.WSMsgType.CLOSED,
+                                            aiohttp.WSMsgType.ERROR):
+                            break
+                        continue
+                    if message.data == "pong":
+                        continue
+                    for trade in parse(json.loads(message.data)):
+                        add(*trade)
+                        received += 1
+                    # Счетчик метрик обновляется пачками, а не на каждую сделку
+                    if received >= 1000:
+                        metrics.inc_counter("trades_total", received,
+                                            exchange=self.adapter.name,
+                                            source="ws")
+                        received = 0
+            finally:
+                if pinger is not None:
+                    pinger.cancel()
+                metrics.inc_counter("trades_total", received,
+                                    exchange=self.adapter.name, source="ws")
+
+    async def ping(self, ws):
+        """ Периодически отправляет ping биржи """
+        while True:
+            await asyncio.sleep(PING_SECONDS)
+            message = self.adapter.ping_message
+            if isinstance(message, str):
+                await ws.send_str(message)
+            else:
+                await ws.send_json(message)
+
+
+def supports_trades(adapter):
+    """ Умеет ли адаптер получать сделки """
+    return type(adapter).fetch_trades is not ExchangeAdapter.fetch_trades
+
+
+def start_streams(streams=None, mode: str = None):
+    """
+        Запускает потоки сделок всех бирж для пар streams (по умолчанию -
+        TRADE_STREAMS) в текущем цикле событий. Возвращает список задач
+    """
+    tasks = []
+    for trading_pair, type_of_trade in (TRADE_STREAMS if streams is None
+                                        else streams):
+        for adapter in get_adapters():
+            if not supports_trades(adapter):
+                continue
+            key = (adapter.name, trading_pair, type_of_trade)
+            stream = _streams[key] = TradeStream(adapter, trading_pair,
+                                                 type_of_trade, mode)
+            tasks.append(asyncio.get_running_loop().create_task(
+                stream.run(), name=f"trades-{stream.label}"))
+    return tasks
+
+
+async def stop_streams(tasks):
+    """ Останавливает потоки сделок """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _streams.clear()
+
+
+def get_stream(exchange: str, trading_pair: str, type_of_trade: str):
+    """ Поток сделок биржи по паре или None """
+    return _streams.get((exchange, trading_pair, type_of_trade))
+
+
+def flow_frames(trading_pair: str, type_of_trade: str, interval_ms: int,
+                start: int = None, end: int = None):
+    """
+        Поток сделок бирж по паре за [start, end] (мс), сгруппированный по
+        interval_ms: {название биржи: DataFrame}. Биржи без сделок в окне
+        не попадают в результат
+    """
+    frames = {}
+    for adapter in get_adapters():
+        stream = get_stream(adapter.name, trading_pair, type_of_trade)
+        if stream is None:
+            continue
+        bars = stream.aggregator.bars(start, end)
+        if len(bars):
+            frames[adapter.title] = flow_frame(bars, interval_ms)
+    return frames
+
+
+metrics.describe("trades_total", "Сделки, свернутые в бары потока сделок")
+metrics.describe("trade_stream_reconnects_total",
+                 "Переподключения потоков сделок")
@@ -1,115 +1,67 @@
+import contextvars
+import functools
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import Scripts.utils_for_api_bybit as bybit
-import Scripts.utils_for_api_okx as okx
-import Scripts.utils_for_api_binance as binance
 import Scripts.candle_analysis as analysis
+import Scripts.candle_cache as candle_cache
 import Scripts.create_graphs as graphs
+import Scripts.exchanges as exchanges
+import Scripts.instruments as instruments
+import Scripts.lead_lag as lead_lag
+import Scripts.metrics as metrics
+from Scripts.chart_templates import render_lane
+
+
+# Функции Scripts.create_graphs для каждого вида графика
+CHART_BUILDERS = {
+    "volume_plot": "create_volume_plot",
+    "obv_plot": "create_obv_plot",
+    "cvd_plot": "create_cvd_plot",
+    "vwap_plot": "create_plot_vwap",
+    "volume_pie": "create_volume_pie_chart",
+    "volume_profile": "create_plot_volume_profiles",
+    "lead_lag": "create_lead_lag_plot",
+    "seasonality": "create_seasonality_plot",
+}
+# Порядок графиков в результате анализа
+# (CVD - только для пар с потоком сделок, см. Scripts/trade_flow.py)
+CHART_ORDER = ("volume_plot", "obv_plot", "cvd_plot", "vwap_plot",
+               "volume_pie", "volume_profile", "lead_lag")
+
+# Колонки выровненной таблицы анализа для каждой биржи
+ANALYSIS_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'obv', 'vwap')
+
+# Пул для параллельных запросов свечей к биржам: запросы ко всем биржам
+# выполняются одновременно, поэтому время не растет с числом бирж
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fetch")
 
 
 def convert_interval(timeframe: str):
     """ Преобразует строковый таймфрейм в формат, подходящий для разных бирж """
-    mapping_bybit = {
-        '1': '1', '3': '3', '5': '5', '15': '15', '30': '30',
-        '60': '60', '120': '120', '240': '240', '360': '360',
-        'Day': 'D', 'Week': 'W', 'Month': 'M'
-    }
-
-    mapping_okx = {
-        '1': '1m', '3': '3m', '5': '5m', '15': '15m', '30': '30m',
-        '60': '1H', '120': '2H', '240': '4H', '360': '6H',
-        'Day': '1D', 'Week': '1W', 'Month': '1M'
-    }
-
-    mapping_binance = {
-        '1': '1m', '3': '3m', '5': '5m', '15': '15m', '30': '30m',
-        '60': '1h', '120': '2h', '240': '4h', '360': '6h',
-        'Day': '1d', 'Week': '1w', 'Month': '1M'
-    }
     # Создание словаря с результатами преобразования для каждой биржи
-    result = {"bybit": mapping_bybit[timeframe], "okx": mapping_okx[timeframe],
-              "binance": mapping_binance[timeframe]}
-
-    return result
+    return {adapter.name: adapter.interval(timeframe)
+            for adapter in exchanges.get_adapters()}
 
 
 def convert_trading_pair(trading_pair: str, exchange: str, type_of_trade: str):
     """ Преобразует формат торговой пары в зависимости от биржи и типа торговли """
-    result = {"bybit": trading_pair.replace('/', ''),
-              "okx": trading_pair.replace('/', '-'),
-              "binance": trading_pair.replace('/', '')}
-
-    trading_pair = result[exchange]
-
-    months_dict = {
-        'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04',
-        'MAY': '05', 'JUN': '06', 'JUL': '07', 'AUG': '08',
-        'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'
-    }
-
-    if type_of_trade == "FUTURES":
-        # Извлечение дня, месяца и года из торговой пары для фьючерсов
-        day = trading_pair[len(trading_pair)-7:len(trading_pair)-5]
-        month = trading_pair[len(trading_pair)-5:len(trading_pair)-2]
-        year = trading_pair[len(trading_pair)-2:]
-
-        if exchange == 'binance':
-            # Форматирование даты для Binance
-            trading_pair = trading_pair[:len(trading_pair)-7] + year \
-                           + months_dict[month] + day
-            trading_pair = trading_pair.replace('-', '_')
-            result['binance'] = trading_pair
-        elif exchange == 'okx':
-            # Форматирование даты для OKX
-            trading_pair = trading_pair[:len(trading_pair)-7] + year \
-                           + months_dict[month] + day
-            result['okx'] = trading_pair
-
-    elif type_of_trade == "PERPETUAL FUTURES" and exchange == "okx":
-        # Добавление суффикса для вечных фьючерсов на OKX
-        trading_pair = trading_pair + "-SWAP"
-        result['okx'] = trading_pair
-
-    return result
+    return {adapter.name: adapter.symbol(trading_pair, type_of_trade)
+            for adapter in exchanges.get_adapters()}
 
 
 def convert_type_of_trade(type_of_trade: str, trading_pair: str = '',
                           exchange: str = ''):
     """ Преобразует тип торговли в формат, подходящий для конкретной биржи """
-    mapping_bybit = {
-        'SPOT': 'spot',
-        'FUTURES': 'linear',
-        'PERPETUAL FUTURES': 'linear'
-    }
-
-    mapping_binance = {
-        'SPOT': 'SPOT',
-        'FUTURES': 'FUTURES',
-        'PERPETUAL FUTURES': 'FUTURES_PERP'
-    }
-
-    result = {
-        'binance': mapping_binance[type_of_trade],
-        'bybit': mapping_bybit[type_of_trade]
-    }
-
-    return result
+    return {adapter.name: adapter.category(trading_pair, type_of_trade)
+            if trading_pair else adapter.market(type_of_trade)
+            for adapter in exchanges.get_adapters()}
 
 
 def fix_some_API_error(df: pd.DataFrame, type_of_trade: str):
-    """ Корректирует ошибки в данных, полученных от API, в зависимости от типа торговли """
-    if (type_of_trade == "FUTURES"):
-        df["volume"] = df["volume"] / 100
-
-    if (type_of_trade == "PERPETUAL FUTURES"):
-        for index in df.index:
-            if df.loc[index, 'volume'] > 10000:
-                df.loc[index, 'volume'] = df.loc[index, 'volume'] / 100
-            else:
-                df.loc[index, 'volume'] = df.loc[index, 'volume'] * 10
-
-    return df
+    """ Корректирует ошибки в данных, полученных от API OKX, в зависимости от типа торговли """
+    return exchanges.get_adapter("okx").normalize(df, type_of_trade)
 
 
 def candles_to_df(candles, exchange_name):
@@ -136,6 +88,260 @@ def readable_time_to_ms(time_str) -> int:
     return milliseconds
 
 
+def time_to_ms(value) -> int:
+    """ Время в мс из строки ДД.ММ.ГГГГ ЧЧ:ММ или числа миллисекунд """
+    value = str(value).strip()
+    return int(value) if value.isdigit() else readable_time_to_ms(value)
+
+
+def fetch_concurrently(requests: dict):
+    """
+        Параллельно выполняет запросы свечей к биржам.
+
+        requests: {биржа: функция без аргументов}. Возвращает словарь
+        {биржа: список свечей} в том же порядке; None от биржи означает
+        ошибку валидации.
+    """
+    futures = {}
+    for exchange, request in requests.items():
+        # Контекст копируется, чтобы этапы fetch попали в трассировку запроса
+        def job(exchange=exchange, request=request):
+            with metrics.span("fetch", exchange=exchange):
+                return request()
+        futures[exchange] = FETCH_EXECUTOR.submit(
+            contextvars.copy_context().run, job)
+
+    result = {}
+    for exchange, future in futures.items():
+        candles = future.result()
+        if candles is None:
+            title = exchanges.get_adapter(exchange).title
+            raise ValueError(f"Ошибка валидации данных от {title}. Проверьте вводимые данные. Для подробностей обратитесь к админу")
+        result[exchange] = candles
+    return result
+
+
+def render_chart(kind: str, *args):
+    """ Строит график kind и возвращает путь к файлу и его содержимое """
+    with metrics.span(f"render.{kind}"):
+        # Функция берется из модуля при вызове (ее подменяют бенчмарки)
+        path = getattr(graphs, CHART_BUILDERS[kind])(*args)
+    # Файл читается в той же очереди рендера, пока его не перезаписал
+    # следующий запрос
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+def submit_chart(kind: str, *args):
+    """ Ставит построение графика в очередь рендера его вида """
+    return render_lane(kind).submit(
+        contextvars.copy_context().run, render_chart, kind, *args)
+
+
+def convert_candles(candles: dict, type_of_trade: str):
+    """
+        Преобразует свечи бирж {биржа: список свечей} в словарь
+        {название биржи: DataFrame} с исправленными особенностями бирж
+    """
+    frames = {}
+    with metrics.span("convert"):
+        for exchange, list_of_candles in candles.items():
+            adapter = exchanges.get_adapter(exchange)
+            df = candles_to_df(list_of_candles, adapter.title)
+            frames[adapter.title] = adapter.normalize(df, type_of_trade)
+    return frames
+
+
+def calculate_indicators(frames: dict, indicators=()):
+    """
+        Добавляет OBV, VWAP и дополнительные индикаторы indicators
+        (см. candle_analysis.INDICATORS) в DataFrame бирж и возвращает
+        объемные профили {название биржи: Series}
+    """
+    requested = tuple(dict.fromkeys(analysis.DEFAULT_INDICATORS
+                                    + tuple(indicators)))
+    profiles = {}
+    with metrics.span("indicators"):
+        for title, df in frames.items():
+            # Все индикаторы считаются одним проходом ядра индикаторов
+            frames[title] = analysis.calculate_indicator_set(df, requested)
+            # Расчет объемного профиля
+            profiles[title] = analysis.calculate_volume_profile(frames[title])
+    return profiles
+
+
+def analysis_data(candles: dict, type_of_trade: str, indicators=()):
+    """ Индикаторы без графиков: (DataFrame бирж, объемные профили) """
+    frames = convert_candles(candles, type_of_trade)
+    profiles = calculate_indicators(frames, indicators)
+    return frames, profiles
+
+
+def aligned_frame(frames: dict, columns=ANALYSIS_COLUMNS):
+    """
+        Объединяет DataFrame бирж по времени свечей в одну таблицу
+        с колонками вида <биржа>.<колонка>; отсутствующие свечи - NaN
+    """
+    df = pd.concat({title: frame[list(columns)]
+                    for title, frame in frames.items()}, axis=1, join="outer")
+    df.columns = [f"{title}.{column}" for title, column in df.columns]
+    return df.sort_index()
+
+
+def lead_lag_analysis(frames: dict):
+    """
+        Lead-lag анализ бирж по выровненным свечам (Scripts/lead_lag.py)
+        или None, если бирж меньше двух или свечей слишком мало
+    """
+    with metrics.span("lead_lag"):
+        return lead_lag.analyse(aligned_frame(frames, ("close", "volume")))
+
+
+def trade_flow_frames(frames: dict, trading_pair: str, type_of_trade: str,
+                      timeframe: str):
+    """
+        Поток сделок бирж за окно свечей frames, сгруппированный по
+        таймфрейму: {название биржи: DataFrame с колонкой cvd}. Для
+        таймфреймов без постоянной длины (Month) поток не строится
+    """
+    from Scripts import trade_flow
+    from Scripts.candle_storage import TIMEFRAME_MS
+
+    indexes = [df.index for df in frames.values() if len(df)]
+    timeframe_ms = TIMEFRAME_MS.get(timeframe)
+    if not indexes or timeframe_ms is None:
+        return {}
+    start = min(index[0] for index in indexes).value // 1_000_000
+    end = max(index[-1] for index in indexes).value // 1_000_000
+    return trade_flow.flow_frames(trading_pair, type_of_trade, timeframe_ms,
+                                  start, end + timeframe_ms - 1)
+
+
+def render_analysis_charts(candles: dict, type_of_trade: str,
+                           trading_pair: str = None, timeframe: str = None,
+                           report: dict = None):
+    """
+        Строит индикаторы и ставит графики в очереди рендера.
+
+        candles: {биржа: список свечей}. Возвращает словарь
+        {вид графика: Future} в порядке CHART_ORDER; результат Future -
+        (путь к файлу, содержимое). Круговой диаграмме нужна только сумма
+        объемов, поэтому она ставится в очередь сразу после преобразования
+        свечей, до расчета индикаторов. График CVD строится, только если
+        переданы пара и таймфрейм и по паре есть сделки в окне свечей.
+        Если передан словарь report, в него записывается текстовый итог
+        lead-lag анализа бирж (ключ "lead_lag").
+    """
+    # Преобразование свечей в DataFrame и исправление особенностей бирж
+    frames = convert_candles(candles, type_of_trade)
+
+    futures = {}
+    # Создание круговой диаграммы объемов
+    futures["volume_pie"] = submit_chart(
+        "volume_pie", {title: df[['volume']].copy()
+                       for title, df in frames.items()})
+
+    profiles = calculate_indicators(frames)
+
+    # Графики объемов, OBV и VWAP рисуются параллельно в своих очередях
+    for kind in ("volume_plot", "obv_plot", "vwap_plot"):
+        futures[kind] = submit_chart(kind, frames)
+    # Создание графика объемного профиля
+    futures["volume_profile"] = submit_chart("volume_profile", profiles)
+
+    # Какая биржа опережает другие по цене и объему
+    leads = lead_lag_analysis(frames)
+    if leads is not None:
+        futures["lead_lag"] = submit_chart("lead_lag", leads)
+        if report is not None:
+            report["lead_lag"] = lead_lag.format_summary(leads, timeframe)
+
+    if trading_pair and timeframe:
+        flows = trade_flow_frames(frames, trading_pair, type_of_trade, timeframe)
+        if flows:
+            futures["cvd_plot"] = submit_chart("cvd_plot", flows)
+
+    return {kind: futures[kind] for kind in CHART_ORDER if kind in futures}
+
+
+def submit_analysis_charts(frames: dict, profiles: dict, pair_name: str = None,
+                           leads: dict = None):
+    """
+        Ставит в очереди рендера все графики по уже рассчитанным
+        индикаторам (см. analysis_data) и итогу lead_lag_analysis.
+        Возвращает словарь {вид графика: Future} в порядке CHART_ORDER.
+    """
+    futures = {kind: submit_chart(kind, frames)
+               for kind in ("volume_plot", "obv_plot", "vwap_plot")}
+    pie_args = (pair_name,) if pair_name else ()
+    futures["volume_pie"] = submit_chart(
+        "volume_pie", {title: df[['volume']] for title, df in frames.items()},
+        *pie_args)
+    futures["volume_profile"] = submit_chart("volume_profile", profiles)
+    if leads is not None:
+        futures["lead_lag"] = submit_chart("lead_lag", leads)
+    return {kind: futures[kind] for kind in CHART_ORDER if kind in futures}
+
+
+def create_analysis_graphs(candles: dict, type_of_trade: str):
+    """ Строит индикаторы и графики по свечам бирж {биржа: список свечей} """
+    futures = render_analysis_charts(candles, type_of_trade)
+    # Возвращение путей к созданным графикам
+    return tuple(future.result()[0] for future in futures.values())
+
+
+def pair_venues(trading_pair: str, type_of_trade: str):
+    """
+        Адаптеры бирж, на которых торгуется пара (Scripts/instruments.py):
+        остальным биржам запросы не отправляются
+    """
+    adapters = instruments.venues(trading_pair, type_of_trade,
+                                  exchanges.get_adapters())
+    if not adapters:
+        raise ValueError(f"Торговой пары {trading_pair} не существует "
+                         f"ни на одной бирже")
+    return adapters
+
+
+def fetch_candles_numbers_candles(
+        trading_pair: str, type_of_trade: str,
+        timeframe: str, numbers_of_candles: str
+        ):
+    """ Параллельно запрашивает последние свечи у всех бирж """
+    return fetch_concurrently({
+        adapter.name: functools.partial(
+            candle_cache.fetch_candles, adapter, trading_pair, type_of_trade,
+            timeframe, limit=int(numbers_of_candles))
+        for adapter in pair_venues(trading_pair, type_of_trade)
+    })
+
+
+def fetch_candles_range(
+        trading_pair: str, type_of_trade: str, timeframe: str,
+        start: int, end: int
+        ):
+    """ Параллельно запрашивает свечи диапазона [start, end] (в мс) у всех бирж """
+    return fetch_concurrently({
+        adapter.name: functools.partial(
+            candle_cache.fetch_candles, adapter, trading_pair, type_of_trade,
+            timeframe, start=start, end=end)
+        for adapter in pair_venues(trading_pair, type_of_trade)
+    })
+
+
+def fetch_candles_start_end(
+        trading_pair: str, type_of_trade: str, timeframe: str,
+        start_time: str, end_time: str
+        ):
+    """ Параллельно запрашивает свечи заданного диапазона у всех бирж """
+    # Преобразование времени начала и конца в миллисекунды
+    start = readable_time_to_ms(start_time)
+    end = readable_time_to_ms(end_time)
+
+    return fetch_candles_range(trading_pair, type_of_trade, timeframe,
+                               start, end)
+
+
 def analys_based_on_trading_pair_timeframe_numbers_candles(
         trading_pair: str, type_of_trade: str,
         timeframe: str, numbers_of_candles: str
@@ -156,97 +362,11 @@ def analys_based_on_trading_pair_timeframe_numbers_candles(
 
             numbers_of_candles: str - кол-во крайних свечей
     """
-    # Преобразование таймфрейма для каждой биржи
-    timeframe_bybit = convert_interval(timeframe)["bybit"]
-    timeframe_okx = convert_interval(timeframe)["okx"]
-    timeframe_binance = convert_interval(timeframe)["binance"]
-
-    # Преобразование торговой пары для каждой биржи
-    trading_pair_bybit = convert_trading_pair(
-        trading_pair, 'bybit', type_of_trade
-    )['bybit']
-    trading_pair_okx = convert_trading_pair(
-        trading_pair, 'okx', type_of_trade
-    )['okx']
-    trading_pair_binance = convert_trading_pair(
-        trading_pair, 'binance', type_of_trade
-    )['binance']
-
-    # Преобразование типа торговли для каждой биржи
-    type_of_trade_bybit = convert_type_of_trade(type_of_trade)["bybit"]
-    type_of_trade_binance = convert_type_of_trade(type_of_trade)["binance"]
-
-    # Получение данных свечей для Bybit
-    if ((list_of_candles_bybit := bybit.get_trading_candles(
-        type_of_trade_bybit, trading_pair_bybit,
-        timeframe_bybit, limit=int(numbers_of_candles)
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Получение данных свечей для OKX
-    if ((list_of_candles_okx := okx.get_trading_candles(
-        trading_pair_okx, timeframe_okx,
-        limit=numbers_of_candles
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Получение данных свечей для Binance
-    if ((list_of_candles_binance := binance.get_trading_candles(
-        type_of_trade_binance, trading_pair_binance, timeframe_binance,
-        limit=int(numbers_of_candles)
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Преобразование свечей в DataFrame для каждой биржи
-    df_bybit = candles_to_df(list_of_candles_bybit, 'Bybit')
-    df_okx = candles_to_df(list_of_candles_okx, 'OKX')
-    df_binance = candles_to_df(list_of_candles_binance, 'Binance')
-
-    # Корректировка ошибок в данных OKX
-    df_okx = fix_some_API_error(df_okx, type_of_trade)
-
-    # Расчет индикаторов OBV для всех DataFrame
-    df_bybit = analysis.calculate_obv(df_bybit)
-    df_okx = analysis.calculate_obv(df_okx)
-    df_binance = analysis.calculate_obv(df_binance)
-
-    # Расчет индикаторов VWAP для всех DataFrame
-    df_bybit = analysis.calculate_vwap(df_bybit)
-    df_okx = analysis.calculate_vwap(df_okx)
-    df_binance = analysis.calculate_vwap(df_binance)
-
-    # Расчет объемного профиля для всех DataFrame
-    df_volume_profile_bybit = analysis.calculate_volume_profile(df_bybit)
-    df_volume_profile_okx = analysis.calculate_volume_profile(df_okx)
-    df_volume_profile_binance = analysis.calculate_volume_profile(df_binance)
-
-    # Создание графика объемов
-    path_to_volume_plot = graphs.create_volume_plot(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика OBV
-    path_to_obv_plot = graphs.create_obv_plot(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика VWAP
-    path_to_plot_vwap = graphs.create_plot_vwap(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание круговой диаграммы объемов
-    path_to_volume_pie_chart = graphs.create_volume_pie_chart(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика объемного профиля
-    path_to_plot_volume_profilies = graphs.create_plot_volume_profiles(
-        df_volume_profile_bybit, df_volume_profile_okx,
-        df_volume_profile_binance
-    )
-
-    # Возвращение путей к созданным графикам
-    return (
-        path_to_volume_plot, path_to_obv_plot, path_to_plot_vwap,
-        path_to_volume_pie_chart, path_to_plot_volume_profilies
-    )
+    with metrics.span("analysis", mode="candles", pair=trading_pair):
+        candles = fetch_candles_numbers_candles(
+            trading_pair, type_of_trade, timeframe, numbers_of_candles
+        )
+        return create_analysis_graphs(candles, type_of_trade)
 
 
 def analys_based_on_trading_pair_timeframe_start_end(
@@ -277,101 +397,11 @@ def analys_based_on_trading_pair_timeframe_start_end(
             То есть в результат пойдут свечи, время открытия которых больше 
             или равны start_time, но меньше или равны end_time
     """
-    # Преобразование таймфрейма для каждой биржи
-    timeframe_bybit = convert_interval(timeframe)["bybit"]
-    timeframe_okx = convert_interval(timeframe)["okx"]
-    timeframe_binance = convert_interval(timeframe)["binance"]
-
-    # Преобразование торговой пары для каждой биржи
-    trading_pair_bybit = convert_trading_pair(
-        trading_pair, 'bybit', type_of_trade
-    )['bybit']
-    trading_pair_okx = convert_trading_pair(
-        trading_pair, 'okx', type_of_trade
-    )['okx']
-    trading_pair_binance = convert_trading_pair(
-        trading_pair, 'binance', type_of_trade
-    )['binance']
-
-    # Преобразование типа торговли для каждой биржи
-    type_of_trade_bybit = convert_type_of_trade(type_of_trade)["bybit"]
-    type_of_trade_binance = convert_type_of_trade(type_of_trade)["binance"]
-
-    # Преобразование времени начала и конца в миллисекунды
-    start = readable_time_to_ms(start_time)
-    end = readable_time_to_ms(end_time)
-
-    # Получение данных свечей для Bybit в заданном диапазоне
-    if ((list_of_candles_bybit := bybit.get_trading_candles(
-        type_of_trade_bybit, trading_pair_bybit,
-        timeframe_bybit, start=start, end=end
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Получение данных свечей для OKX в заданном диапазоне
-    if ((list_of_candles_okx := okx.get_trading_candles(
-        trading_pair_okx, timeframe_okx,
-        after=str(end+1), before=str(start-1)
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Получение данных свечей для Binance в заданном диапазоне
-    if ((list_of_candles_binance := binance.get_trading_candles(
-        type_of_trade_binance, trading_pair_binance, timeframe_binance,
-        start=start, end=end
-    )) is None):
-        raise ValueError("Ошибка валидации данных от Bybit. Проверьте вводимые данные. Для подробностей обратитесь к админу")
-
-    # Преобразование свечей в DataFrame для каждой биржи
-    df_bybit = candles_to_df(list_of_candles_bybit, 'Bybit')
-    df_okx = candles_to_df(list_of_candles_okx, 'OKX')
-    df_binance = candles_to_df(list_of_candles_binance, 'Binance')
-
-    # Корректировка ошибок в данных OKX
-    df_okx = fix_some_API_error(df_okx, type_of_trade)
-
-    # Расчет индикаторов OBV для всех DataFrame
-    df_bybit = analysis.calculate_obv(df_bybit)
-    df_okx = analysis.calculate_obv(df_okx)
-    df_binance = analysis.calculate_obv(df_binance)
-
-    # Расчет индикаторов VWAP для всех DataFrame
-    df_bybit = analysis.calculate_vwap(df_bybit)
-    df_okx = analysis.calculate_vwap(df_okx)
-    df_binance = analysis.calculate_vwap(df_binance)
-
-    # Расчет объемного профиля для всех DataFrame
-    df_volume_profile_bybit = analysis.calculate_volume_profile(df_bybit)
-    df_volume_profile_okx = analysis.calculate_volume_profile(df_okx)
-    df_volume_profile_binance = analysis.calculate_volume_profile(df_binance)
-
-    # Создание графика объемов
-    path_to_volume_plot = graphs.create_volume_plot(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика OBV
-    path_to_obv_plot = graphs.create_obv_plot(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика VWAP
-    path_to_plot_vwap = graphs.create_plot_vwap(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание круговой диаграммы объемов
-    path_to_volume_pie_chart = graphs.create_volume_pie_chart(
-        df_bybit, df_okx, df_binance
-    )
-    # Создание графика объемного профиля
-    path_to_plot_volume_profilies = graphs.create_plot_volume_profiles(
-        df_volume_profile_bybit, df_volume_profile_okx,
-        df_volume_profile_binance
-    )
-
-    # Возвращение путей к созданным графикам
-    return (
-        path_to_volume_plot, path_to_obv_plot, path_to_plot_vwap,
-        path_to_volume_pie_chart, path_to_plot_volume_profilies
-    )
+    with metrics.span("analysis", mode="range", pair=trading_pair):
+        candles = fetch_candles_start_end(
+            trading_pair, type_of_trade, timeframe, start_time, end_time
+        )
+        return create_analysis_graphs(candles, type_of_trade)
 
 
 if __name__ == "__main__":
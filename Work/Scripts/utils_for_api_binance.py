@@ -1,5 +1,7 @@
+import threading
 import Library.utils as utils
 from Scripts.logger import log_error, log_warning
+import Scripts.metrics as metrics
 
 # Базовый URL для API Binance
 URL = "https://api.binance.com"
@@ -9,12 +11,20 @@ URL_SPOT = "https://api.binance.com"
 URL_FUTURES_USDT = "https://fapi.binance.com"
 # URL для фьючерсов с COIN
 URL_FUTURES_COIN = "https://dapi.binance.com"
+# Публичные WebSocket-потоки Binance по типам торговли
+WS_URL_SPOT = "wss://stream.binance.com:9443/ws"
+WS_URL_FUTURES_USDT = "wss://fstream.binance.com/ws"
+WS_URL_FUTURES_COIN = "wss://dstream.binance.com/ws"
+# Максимум сделок в ответе REST
+TRADES_LIMIT = 1000
 # Доступные интервалы таймфреймов
 AVAILABLE_INTERVALS = ("1s", "1m", "3m", "5m", "15m", "30m",
                       "1h", "2h", "4h", "6h", "8h", "12h",
                       "1d", "3d", "1w", "1M")
 # Список доступных торговых пар (инициализируется позже)
 AVAILABLE_TRADING_PAIRS = None
+# Блокировка, чтобы список торговых пар загружался только один раз
+TRADING_PAIRS_LOCK = threading.Lock()
 
 
 def send_request_processing_params(endpoint, method, params, url_full=None):
@@ -27,6 +37,23 @@ def send_request_processing_params(endpoint, method, params, url_full=None):
     return response
 
 
+def futures_instrument(item: dict):
+    """
+        Инструмент каталога фьючерсов: (база, котировка, тип торговли бота,
+        экспирация ГГММДД, символ, категория) или None для контрактов
+        без типа (в поставке или сняты с торгов)
+    """
+    contract_type = item.get("contractType", "")
+    if "PERPETUAL" in contract_type:
+        return (item["baseAsset"], item["quoteAsset"], "PERPETUAL FUTURES", "",
+                item["symbol"], "FUTURES_PERP")
+    if contract_type:
+        return (item["baseAsset"], item["quoteAsset"], "FUTURES",
+                utils.expiry_from_ms(item["deliveryDate"]), item["symbol"],
+                "FUTURES")
+    return None
+
+
 def get_available_trading_pairs():
     """ Получает список доступных торговых пар для разных типов торговли """
     endpoint = "/api/v3/exchangeInfo"
@@ -35,39 +62,47 @@ def get_available_trading_pairs():
     trading_pairs = dict()
     # Получение данных для спотового рынка
     response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs['SPOT'] = [item["symbol"] for item in response["symbols"]]
-
-    endpoint_for_coin = "/dapi/v1/exchangeInfo"
-    url_full = URL_FUTURES_COIN + endpoint_for_coin
-    # Получение данных для фьючерсов с COIN
-    response = send_request_processing_params(endpoint, "GET",
-                                              params, url_full)
-    trading_pairs['FUTURES'] = [
-        item["symbol"] for item in response["symbols"]
-        if "PERP" not in item["symbol"]
-    ]
-    trading_pairs['FUTURES_PERP'] = [
-        item["symbol"][:-5] for item in response["symbols"]
-        if "PERP" in item["symbol"]
+    instruments = [
+        (item["baseAsset"], item["quoteAsset"], "SPOT", "", item["symbol"], "SPOT")
+        for item in response["symbols"]
     ]
 
-    endpoint_for_usdt = "/fapi/v1/exchangeInfo"
-    url_full = URL_FUTURES_USDT + endpoint_for_usdt
-    # Получение данных для фьючерсов с USDT
-    response = send_request_processing_params(endpoint, "GET",
-                                              params, url_full)
-    trading_pairs['FUTURES'].extend([
-        item["symbol"] for item in response["symbols"]
-        if len(item["symbol"]) > 7 and item["symbol"][-7] == "_"
-    ])
-    trading_pairs['FUTURES_PERP'].extend([
-        item["symbol"] for item in response["symbols"]
-        if len(item["symbol"]) < 8 or item["symbol"][-7] != "_"
-    ])
+    # Получение данных для фьючерсов с COIN и с USDT. Вечные фьючерсы
+    # с расчетами в монете называются BTCUSD_PERP
+    for url_full in (URL_FUTURES_COIN + "/dapi/v1/exchangeInfo",
+                     URL_FUTURES_USDT + "/fapi/v1/exchangeInfo"):
+        response = send_request_processing_params(endpoint, "GET",
+                                                  params, url_full)
+        instruments.extend(filter(None, map(futures_instrument,
+                                            response["symbols"])))
+
+    # Символы по категориям для проверки запросов и инструменты
+    # для таблицы Scripts/instruments.py
+    for category in ("SPOT", "FUTURES", "FUTURES_PERP"):
+        trading_pairs[category] = {row[4] for row in instruments
+                                   if row[5] == category}
+    trading_pairs["INSTRUMENTS"] = instruments
 
     return trading_pairs
 
 
+def load_available_trading_pairs():
+    """ Возвращает список торговых пар, загружая его при первом обращении """
+    global AVAILABLE_TRADING_PAIRS
+    if AVAILABLE_TRADING_PAIRS is not None:
+        metrics.inc_counter("cache_hits_total", cache="instruments",
+                            exchange="binance")
+        return AVAILABLE_TRADING_PAIRS
+
+    with TRADING_PAIRS_LOCK:
+        if AVAILABLE_TRADING_PAIRS is None:
+            metrics.inc_counter("cache_misses_total", cache="instruments",
+                                exchange="binance")
+            with metrics.span("bootstrap", exchange="binance"):
+                AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    return AVAILABLE_TRADING_PAIRS
+
+
 def get_trading_candles(type_of_trading: str, symbol: str, interval: str,
                         start: int = None, end: int = None, limit: int = None):
     """ Получает данные свечей для указанной торговой пары и интервала """
@@ -77,10 +112,8 @@ def get_trading_candles(type_of_trading: str, symbol: str, interval: str,
         "interval": interval
     }
 
-    global AVAILABLE_TRADING_PAIRS
     # Инициализация списка торговых пар, если еще не загружен
-    if AVAILABLE_TRADING_PAIRS is None:
-        AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    load_available_trading_pairs()
 
     # Проверка существования торговой пары
     if symbol not in AVAILABLE_TRADING_PAIRS[type_of_trading]:
@@ -135,8 +168,7 @@ def get_trading_candles(type_of_trading: str, symbol: str, interval: str,
 
     # Определение URL в зависимости от типа торговли
     if type_of_trading == "FUTURES" or type_of_trading == "FUTURES_PERP":
-        if symbol[-4:] == "USDT" or symbol[-4:] == "USDC" or \
-           symbol[-11:-7] == "USDT" or symbol[-11:-87] == "USDC":
+        if is_usdt_margined(symbol):
             url_full = URL_FUTURES_USDT + "/fapi/v1/klines"
         else:
             url_full = URL_FUTURES_COIN + "/dapi/v1/klines"
@@ -158,21 +190,11 @@ def get_trading_candles(type_of_trading: str, symbol: str, interval: str,
             f"{response['message']}"
         )
         log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="binance")
         raise ConnectionError(response["message"])
 
-    list_of_candles = list()
     # Преобразование данных свечей в список кортежей
-    for candle in response:
-        start_time = candle[0]
-        open_price = candle[1]
-        high_price = candle[2]
-        low_price = candle[3]
-        close_price = candle[4]
-        volume = candle[5]
-        list_of_candles.append(
-            (start_time, open_price, high_price,
-             low_price, close_price, volume)
-        )
+    list_of_candles = utils.parse_candles(response)
 
     # Сортировка свечей в порядке убывания времени
     list_of_candles.sort(reverse=True)
@@ -180,6 +202,56 @@ def get_trading_candles(type_of_trading: str, symbol: str, interval: str,
     return list_of_candles
 
 
+def is_usdt_margined(symbol: str):
+    """ Фьючерс с расчетами в USDT/USDC (иначе - в монете) """
+    return symbol[-4:] in ("USDT", "USDC") or symbol[-11:-7] in ("USDT", "USDC")
+
+
+def get_recent_trades(type_of_trading: str, symbol: str, limit: int = None):
+    """
+        Получает последние агрегированные сделки (сделки одного агрессора
+        по одной цене объединены). Возвращает список кортежей
+        (id сделки, время в мс, цена, объем, покупка ли агрессор)
+    """
+    params = {
+        "symbol": symbol,
+        "limit": min(limit or TRADES_LIMIT, TRADES_LIMIT)
+    }
+
+    # Определение URL в зависимости от типа торговли
+    if type_of_trading == "SPOT":
+        url_full = URL_SPOT + "/api/v3/aggTrades"
+    elif type_of_trading in ("FUTURES", "FUTURES_PERP"):
+        url_full = URL_FUTURES_USDT + "/fapi/v1/aggTrades" \
+            if is_usdt_margined(symbol) else URL_FUTURES_COIN + "/dapi/v1/aggTrades"
+    else:
+        error_message = "Такого типа торговли не существует на Binance"
+        log_error(error_message)
+        return None
+
+    # Отправка запроса к API
+    response = send_request_processing_params(None, "GET", params, url_full)
+
+    if "error" in response:
+        # Обработка сетевой ошибки
+        error_message = (
+            f"Network error in get_recent_trades:"
+            f"{response['message']}"
+        )
+        log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="binance")
+        raise ConnectionError(response["message"])
+
+    return parse_trades(response)
+
+
+def parse_trades(rows):
+    """ Сделки REST и WebSocket в кортежи (id, время, цена, объем, покупка) """
+    # m - покупатель был мейкером, то есть агрессор продавал
+    return [(row["a"], int(row["T"]), float(row["p"]), float(row["q"]), not row["m"])
+            for row in rows]
+
+
 if __name__ == "__main__":
     # Тест функции получения свечей для спотового рынка
     print(get_trading_candles("SPOT", "BTCUSDT", "15m", limit=5))
@@ -1,9 +1,21 @@
+import threading
 import Library.utils as utils
 from Scripts.logger import log_error, log_warning
+import Scripts.metrics as metrics
 
 
 # Базовый URL для API Bybit
 URL = "https://api.bybit.com"
+# Публичные WebSocket-потоки Bybit по категориям торговли
+WS_URLS = {
+    "spot": "wss://stream.bybit.com/v5/public/spot",
+    "linear": "wss://stream.bybit.com/v5/public/linear",
+    "inverse": "wss://stream.bybit.com/v5/public/inverse",
+}
+# Максимум сделок в ответе REST по категориям
+TRADES_LIMITS = {"spot": 60, "linear": 1000, "inverse": 1000}
+# Максимум инструментов на странице каталога
+INSTRUMENTS_PAGE_LIMIT = 1000
 # Время ожидания ответа в миллисекундах
 RECV_WINDOW = str(5000)
 # Доступные интервалы таймфреймов
@@ -11,6 +23,8 @@ AVAILABLE_INTERVALS = ("1", "3", "5", "15", "30", "60", "120",
                       "240", "360", "720", "D", "W", "M")
 # Список доступных торговых пар (инициализируется позже)
 AVAILABLE_TRADING_PAIRS = None
+# Блокировка, чтобы список торговых пар загружался только один раз
+TRADING_PAIRS_LOCK = threading.Lock()
 
 
 def send_request_processing_params(endpoint, method, params):
@@ -21,15 +35,30 @@ def send_request_processing_params(endpoint, method, params):
     return response
 
 
+def load_available_trading_pairs():
+    """ Возвращает список торговых пар, загружая его при первом обращении """
+    global AVAILABLE_TRADING_PAIRS
+    if AVAILABLE_TRADING_PAIRS is not None:
+        metrics.inc_counter("cache_hits_total", cache="instruments",
+                            exchange="bybit")
+        return AVAILABLE_TRADING_PAIRS
+
+    with TRADING_PAIRS_LOCK:
+        if AVAILABLE_TRADING_PAIRS is None:
+            metrics.inc_counter("cache_misses_total", cache="instruments",
+                                exchange="bybit")
+            with metrics.span("bootstrap", exchange="bybit"):
+                AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    return AVAILABLE_TRADING_PAIRS
+
+
 def get_trading_candles(category: str, symbol: str,
                        interval: str, start: int = None,
                        end: int = None, limit: int = None):
     """start and end get params in ms"""
     # Получает данные свечей для указанной категории, символа и интервала
-    global AVAILABLE_TRADING_PAIRS
     # Инициализация списка торговых пар, если еще не загружен
-    if AVAILABLE_TRADING_PAIRS is None:
-        AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    load_available_trading_pairs()
 
     # Проверка корректности категории торговли
     if category not in ('spot', 'linear', 'inverse'):
@@ -38,8 +67,7 @@ def get_trading_candles(category: str, symbol: str,
         return None
 
     # Проверка существования торговой пары
-    if symbol not in AVAILABLE_TRADING_PAIRS['SPOT'] and \
-       symbol not in AVAILABLE_TRADING_PAIRS['FUTURES']:
+    if symbol not in AVAILABLE_TRADING_PAIRS[category]:
         error_message = f"Торговой пары {symbol} не существует на Bybit"
         log_error(error_message)
         return None
@@ -100,49 +128,100 @@ def get_trading_candles(category: str, symbol: str,
             f"{response['message']}"
         )
         log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="bybit")
         raise ConnectionError(response["message"])
 
-    list_of_candles = list()
     # Преобразование данных свечей в список кортежей
-    for candle in response['result']['list']:
-        start_time = candle[0]
-        open_price = candle[1]
-        high_price = candle[2]
-        low_price = candle[3]
-        close_price = candle[4]
-        volume = candle[5]
-        list_of_candles.append(
-            (start_time, open_price, high_price,
-             low_price, close_price, volume)
-        )
+    list_of_candles = utils.parse_candles(response['result']['list'])
 
     return list_of_candles
 
 
-def get_available_trading_pairs():
-    """ Получает список доступных торговых пар для разных категорий """
-    endpoint = '/v5/market/instruments-info'
-    trading_pairs = dict()
+def get_recent_trades(category: str, symbol: str, limit: int = None):
+    """
+        Получает последние сделки. Возвращает список кортежей
+        (id сделки, время в мс, цена, объем, покупка ли агрессор)
+    """
+    # Проверка корректности категории торговли
+    if category not in TRADES_LIMITS:
+        error_message = f"Типа торгов {category} не существует на Bybit"
+        log_error(error_message)
+        return None
 
-    params = {'category': 'spot'}  # Параметры для спотового рынка
-    response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs['SPOT'] = [
-        pair['symbol'] for pair in response['result']['list']
-    ]
+    endpoint = "/v5/market/recent-trade"  # Эндпоинт последних сделок
+    params = {
+        "category": category,
+        "symbol": symbol,
+        "limit": min(limit or TRADES_LIMITS[category], TRADES_LIMITS[category])
+    }
 
-    params = {'category': 'linear'}  # Параметры для линейных фьючерсов
+    # Отправка запроса к API
     response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs['FUTURES'] = [
-        pair['symbol'] for pair in response['result']['list']
-    ]
 
-    return trading_pairs
+    if "error" in response:
+        # Обработка сетевой ошибки
+        error_message = (
+            f"Network error in get_recent_trades:"
+            f"{response['message']}"
+        )
+        log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="bybit")
+        raise ConnectionError(response["message"])
+
+    return parse_trades(response["result"]["list"])
+
 
+def parse_trades(rows):
+    """ Сделки REST и WebSocket в кортежи (id, время, цена, объем, покупка) """
+    # В REST время и сторона называются time/side, в WebSocket - T/S
+    return [(row.get("execId") or row.get("i"), int(row.get("time") or row["T"]),
+             float(row.get("price") or row["p"]), float(row.get("size") or row["v"]),
+             (row.get("side") or row["S"]) == "Buy")
+            for row in rows]
 
-if __name__ == "__main__":
-    # Тест функции получения свечей для спотового рынка
-    endpoint = '/v5/account/wallet-balance'
-    params = {"accountType": "UNIFIED"}
 
-    print(get_trading_candles("spot", "BTCUSDT", "15", limit=2))
-    
\ No newline at end of file
+def get_category_instruments(category: str):
+    """ Инструменты категории из каталога Bybit (постранично) """
+    endpoint = '/v5/market/instruments-info'
+    params = {'category': category, 'limit': INSTRUMENTS_PAGE_LIMIT}
+    items = []
+    while True:
+        response = send_request_processing_params(endpoint, "GET", params)
+        items.extend(response['result']['list'])
+        # Курсор следующей страницы; пустой на последней странице
+        cursor = response['result'].get('nextPageCursor')
+        if not cursor:
+            return items
+        params['cursor'] = cursor
+
+
+def instrument(item: dict, category: str):
+    """
+        Инструмент каталога: (база, котировка, тип торговли бота,
+        экспирация ГГММДД, символ, категория)
+    """
+    if category == 'spot':
+        trade_type, expiry = 'SPOT', ''
+    elif item.get('contractType', '').endswith('Perpetual'):
+        trade_type, expiry = 'PERPETUAL FUTURES', ''
+    else:
+        trade_type = 'FUTURES'
+        expiry = utils.expiry_from_ms(item['deliveryTime'])
+    return (item['baseCoin'], item['quoteCoin'], trade_type, expiry,
+            item['symbol'], category)
+
+
+def get_available_trading_pairs():
+    """ Получает список доступных торговых пар для разных категорий """
+    trading_pairs = dict()
+    instruments = []
+
+    # Спот, линейные (USDT/USDC) и инверсные (в монете) контракты
+    for category in ('spot', 'linear', 'inverse'):
+        rows = [instrument(item, category)
+                for item in get_category_instruments(category)]
+        trading_pairs[category] = {row[4] for row in rows}
+        instruments.extend(rows)
+    trading_pairs['INSTRUMENTS'] = instruments
+
+    return trading_pairs
@@ -1,14 +1,22 @@
+import threading
 from datetime import datetime
 import Library.utils as utils
 from Scripts.logger import log_error, log_warning
+import Scripts.metrics as metrics
 
 # Базовый URL для API OKX
 URL = "https://www.okx.com"
+# Публичный WebSocket-поток OKX
+WS_URL = "wss://ws.okx.com:8443/ws/v5/public"
+# Максимум сделок в ответе REST
+TRADES_LIMIT = 500
 # Доступные интервалы таймфреймов (внимание: возможно UTC +8)
 AVAILABLE_INTERVALS = ("1m", "3m", "5m", "15m", "30m", "1H", "2H", "4H",
                       "6H", "12H", "1D", "2D", "3D", "1W", "1M", "3M")
 # Список доступных торговых пар (инициализируется позже)
 AVAILABLE_TRADING_PAIRS = None
+# Блокировка, чтобы список торговых пар загружался только один раз
+TRADING_PAIRS_LOCK = threading.Lock()
 
 
 def get_okx_timestamp() -> str:
@@ -25,14 +33,33 @@ def send_request_processing_params(endpoint, method, params):
     return response
 
 
+def load_available_trading_pairs():
+    """ Возвращает список торговых пар, загружая его при первом обращении """
+    global AVAILABLE_TRADING_PAIRS
+    if AVAILABLE_TRADING_PAIRS is not None:
+        metrics.inc_counter("cache_hits_total", cache="instruments",
+                            exchange="okx")
+        return AVAILABLE_TRADING_PAIRS
+
+    with TRADING_PAIRS_LOCK:
+        if AVAILABLE_TRADING_PAIRS is None:
+            metrics.inc_counter("cache_misses_total", cache="instruments",
+                                exchange="okx")
+            with metrics.span("bootstrap", exchange="okx"):
+                AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    return AVAILABLE_TRADING_PAIRS
+
+
 def get_trading_candles(instId: str, bar: str,
                        after: str = None,
-                       before: str = None, limit: str = None):
-    """ Получает данные свечей для указанного инструмента и интервала """
-    global AVAILABLE_TRADING_PAIRS
+                       before: str = None, limit: str = None,
+                       history: bool = False):
+    """
+        Получает данные свечей для указанного инструмента и интервала.
+        history - запрос к эндпоинту исторических свечей (до 100 в ответе)
+    """
     # Инициализация списка торговых пар, если еще не загружен
-    if AVAILABLE_TRADING_PAIRS is None:
-        AVAILABLE_TRADING_PAIRS = get_available_trading_pairs()
+    load_available_trading_pairs()
 
     # Проверка существования торговой пары в зависимости от типа
     if "SWAP" in instId:
@@ -57,7 +84,9 @@ def get_trading_candles(instId: str, bar: str,
         log_error(error_message)
         return None
 
-    endpoint = "/api/v5/market/candles"  # Эндпоинт для получения свечей
+    # Эндпоинт для получения свечей
+    endpoint = "/api/v5/market/history-candles" if history \
+        else "/api/v5/market/candles"
     params = {
         "instId": instId,
         "bar": bar
@@ -106,46 +135,79 @@ def get_trading_candles(instId: str, bar: str,
             f"{response['message']}"
         )
         log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="okx")
         raise ConnectionError(response["message"])
 
-    list_of_candles = list()
     # Преобразование данных свечей в список кортежей
-    for candle in response["data"]:
-        start_time = candle[0]
-        open_price = candle[1]
-        high_price = candle[2]
-        low_price = candle[3]
-        close_price = candle[4]
-        volume = candle[5]
-        list_of_candles.append(
-            (start_time, open_price, high_price,
-             low_price, close_price, volume)
-        )
+    list_of_candles = utils.parse_candles(response["data"])
 
     return list_of_candles
 
 
-def get_available_trading_pairs():
-    """ Получает список доступных торговых пар для разных типов инструментов """
-    endpoint = "/api/v5/public/instruments"
-    trading_pairs = dict()
+def get_recent_trades(instId: str, limit: int = None):
+    """
+        Получает последние сделки инструмента. Возвращает список кортежей
+        (id сделки, время в мс, цена, объем, покупка ли агрессор)
+    """
+    endpoint = "/api/v5/market/trades"  # Эндпоинт последних сделок
+    params = {
+        "instId": instId,
+        "limit": str(min(limit or TRADES_LIMIT, TRADES_LIMIT))
+    }
 
-    params = {"instType": "SPOT"}  # Параметры для спотового рынка
+    # Отправка запроса к API
     response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs["SPOT"] = [
-        trading_pair["instId"] for trading_pair in response["data"]
-    ]
 
-    params = {"instType": "SWAP"}  # Параметры для свопов
-    response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs["SWAP"] = [
-        trading_pair["instId"] for trading_pair in response["data"]
-    ]
+    if "error" in response:
+        # Обработка сетевой ошибки
+        error_message = (
+            f"Network error in get_recent_trades:"
+            f"{response['message']}"
+        )
+        log_error(error_message)
+        metrics.inc_counter("upstream_errors_total", exchange="okx")
+        raise ConnectionError(response["message"])
 
-    params = {"instType": "FUTURES"}  # Параметры для фьючерсов
-    response = send_request_processing_params(endpoint, "GET", params)
-    trading_pairs["FUTURES"] = [
-        trading_pair["instId"] for trading_pair in response["data"]
-    ]
+    return parse_trades(response["data"])
+
+
+def parse_trades(rows):
+    """ Сделки REST и WebSocket в кортежи (id, время, цена, объем, покупка) """
+    return [(row["tradeId"], int(row["ts"]), float(row["px"]), float(row["sz"]),
+             row["side"] == "buy")
+            for row in rows]
+
+
+def instrument(item: dict):
+    """
+        Инструмент каталога: (база, котировка, тип торговли бота,
+        экспирация ГГММДД, instId, тип инструмента OKX)
+    """
+    inst_type = item["instType"]
+    if inst_type == "SPOT":
+        return (item["baseCcy"], item["quoteCcy"], "SPOT", "",
+                item["instId"], inst_type)
+    # У контрактов база и котировка - в базовом индексе (uly) вида BTC-USDT
+    base, quote = item["uly"].split("-", 1)
+    if inst_type == "SWAP":
+        return base, quote, "PERPETUAL FUTURES", "", item["instId"], inst_type
+    return (base, quote, "FUTURES", utils.expiry_from_ms(item["expTime"]),
+            item["instId"], inst_type)
+
+
+def get_available_trading_pairs():
+    """ Получает список доступных торговых пар для разных типов инструментов """
+    endpoint = "/api/v5/public/instruments"
+    trading_pairs = dict()
+    instruments = []
+
+    # Спот, свопы (вечные фьючерсы) и срочные фьючерсы
+    for inst_type in ("SPOT", "SWAP", "FUTURES"):
+        params = {"instType": inst_type}
+        response = send_request_processing_params(endpoint, "GET", params)
+        rows = [instrument(item) for item in response["data"]]
+        trading_pairs[inst_type] = {row[4] for row in rows}
+        instruments.extend(rows)
+    trading_pairs["INSTRUMENTS"] = instruments
 
     return trading_pairs
@@ -0,0 +1,105 @@
+"""
+Прогрев процесса бота.
+
+Тяжелые модули (pandas, numpy, matplotlib) не импортируются при старте
+main.py. warm_up() импортирует их в фоне, инициализирует бэкенд Agg и кеш
+шрифтов пробным рендером и параллельно загружает каталоги инструментов
+всех бирж, чтобы первый пользователь не платил за холодный старт.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Scripts.logger import log_warning
+import Scripts.metrics as metrics
+
+
+# Время начала работы процесса (задается в main.py до импортов)
+PROCESS_STARTED = time.perf_counter()
+# Отмечен ли уже первый ответ пользователю
+_first_response_recorded = False
+
+
+def import_heavy_modules():
+    """ Импортирует модули анализа и построения графиков """
+    import Scripts.user_func  # noqa: F401 - pandas, numpy, matplotlib
+
+
+def warm_up_matplotlib():
+    """ Инициализирует бэкенд Agg и кеш шрифтов, строя шаблоны графиков """
+    from Scripts.chart_templates import TEMPLATE_CLASSES, get_template, render_lane
+    from Scripts.exchanges import chart_series
+    from Scripts.image_encoding import encode_figure
+
+    # Шаблон строится в потоке очереди рендера своего вида, пробная
+    # отрисовка прогревает шрифты, Agg и кодировщик Pillow
+    series = chart_series()
+    futures = [render_lane(kind).submit(
+                   lambda kind=kind: encode_figure(get_template(kind, series).fig))
+               for kind in TEMPLATE_CLASSES]
+    for future in futures:
+        future.result()
+
+
+def prefetch_instrument_catalogs():
+    """ Параллельно загружает каталоги инструментов всех бирж """
+    from Scripts.exchanges import get_adapters
+
+    adapters = {adapter.name: adapter for adapter in get_adapters()}
+
+    def load(name):
+        started = time.perf_counter()
+        try:
+            adapters[name].load_catalog()
+        except Exception as e:
+            # Каталог будет загружен лениво при первом запросе
+            log_warning(f"Не удалось заранее загрузить каталог {name}: {e}")
+        return name, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=len(adapters),
+                            thread_name_prefix="prefetch") as executor:
+        return dict(executor.map(load, adapters))
+
+
+def warm_up(prefetch: bool = True):
+    """ Выполняет все этапы прогрева и возвращает их длительности """
+    timings = {}
+    stages = [("import", import_heavy_modules),
+              ("matplotlib", warm_up_matplotlib)]
+    if prefetch:
+        stages.append(("catalogs", prefetch_instrument_catalogs))
+
+    for name, stage in stages:
+        started = time.perf_counter()
+        try:
+            result = stage()
+        except Exception as e:
+            log_warning(f"Ошибка прогрева на этапе {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - started
+        metrics.set_gauge("warmup_seconds", timings[name], stage=name)
+        if name == "catalogs":
+            for exchange, seconds in result.items():
+                metrics.set_gauge("warmup_seconds", seconds,
+                                  stage="catalog", exchange=exchange)
+
+    metrics.set_gauge("warmup_completed_seconds",
+                      time.perf_counter() - PROCESS_STARTED)
+    return timings
+
+
+def record_first_response():
+    """ Отмечает время от старта процесса до первого ответа с анализом """
+    global _first_response_recorded
+    if _first_response_recorded:
+        return
+    _first_response_recorded = True
+    metrics.set_gauge("time_to_first_response_seconds",
+                      time.perf_counter() - PROCESS_STARTED)
+
+
+metrics.describe("startup_import_seconds", "Время импорта модулей main.py")
+metrics.describe("warmup_seconds", "Длительность этапов прогрева")
+metrics.describe("warmup_completed_seconds",
+                 "Время от старта процесса до окончания прогрева")
+metrics.describe("time_to_first_response_seconds",
+                 "Время от старта процесса до первого ответа с анализом")
@@ -1,32 +1,49 @@
+import time
+
+# Время старта процесса для отчета о холодном старте
+PROCESS_STARTED = time.perf_counter()
+
+import asyncio
 import logging
 from datetime import datetime
 from pathlib import Path
 import json
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import uuid
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup,
+                      InlineQueryResultArticle, InputFile, InputMediaPhoto,
+                      InputTextMessageContent)
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
     CallbackQueryHandler,
 )
 
+# Тяжелые модули анализа (pandas, matplotlib) импортируются лениво,
+# см. Scripts/warmup.py
+from Library import rate_limit
+import Scripts.candle_cache as candle_cache
+import Scripts.file_id_cache as file_id_cache
+import Scripts.image_encoding as image_encoding
+import Scripts.instruments as instruments
+import Scripts.downsample as downsample
+import Scripts.lead_lag as lead_lag
+import Scripts.memory as memory
+import Scripts.metrics as metrics
+import Scripts.quick_commands as quick_commands
+import Scripts.warmup as warmup
+from Scripts.logger import log_context, setup_logging
 
-from Scripts.user_func import (
-    analys_based_on_trading_pair_timeframe_numbers_candles,
-    analys_based_on_trading_pair_timeframe_start_end,
-)
-
-# Настройка логирования ошибок бота
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    filename='bot_errors.log'
-)
 logger = logging.getLogger(__name__)
 
+warmup.PROCESS_STARTED = PROCESS_STARTED
+metrics.set_gauge("startup_import_seconds", time.perf_counter() - PROCESS_STARTED)
+
 # Состояния диалога
 (
     SELECT_ANALYSIS_TYPE,  # Выбор типа анализа
@@ -39,7 +56,22 @@ logger = logging.getLogger(__name__)
 ) = range(7)
 
 # Доступные таймфреймы (в минутах)
-TIMEFRAMES = ["1", "3", "5", "15", "30", "60"]
+TIMEFRAMES = list(quick_commands.TIMEFRAMES)
+
+# Подписи к графикам (по началу имени файла)
+CHART_CAPTIONS = {
+    "volume_plot": "📊 Сравнение объемов",
+    "obv_plot": "📈 Индикатор OBV",
+    "cvd_plot": "🧮 Дельта объема (CVD)",
+    "vwap_comparison": "📉 Сравнение VWAP",
+    "volume_pie": "🔢 Распределение объемов",
+    "volume_profile_comparison": "📌 Объемный профиль",
+    "lead_lag": "🔀 Lead-lag: какая биржа опережает",
+    "seasonality": "🗓 Сезонность объема",
+}
+
+# Максимальное количество элементов в альбоме Telegram
+MEDIA_GROUP_LIMIT = 10
 
 # Клавиатура выбора типа анализа
 analysis_keyboard = [
@@ -64,7 +96,9 @@ timeframe_keyboard = [
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик команды /start, инициализирует диалог анализа."""
     await update.message.reply_text(
-        "Выберите тип анализа:",
+        "Выберите тип анализа:\n"
+        "(быстрый запуск одной командой: /vol BTC/USDT spot 15 200, "
+        "недавние запуски: /recent, сезонность объема: /season BTC/USDT spot)",
         reply_markup=InlineKeyboardMarkup(analysis_keyboard))
     return SELECT_ANALYSIS_TYPE
 
@@ -109,21 +143,11 @@ async def input_trade_pair(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     trade_pair = update.message.text.strip().upper()
     trade_type = context.user_data["trade_type"]
     
-    # Проверка формата пары
-    if "/" not in trade_pair:
-        await update.message.reply_text(
-            "❌ Неверный формат. Используйте / для разделения пар. Попробуйте еще раз:")
-        return INPUT_TRADE_PAIR
-    
-    # Проверка специфики формата для разных типов контрактов
-    base, quote = trade_pair.split("/", 1)
-    if trade_type == "FUTURES" and "-" not in quote:
-        await update.message.reply_text(
-            "❌ Для FUTURES укажите дату экспирации (например BTC/USDT-25DEC25):")
-        return INPUT_TRADE_PAIR
-    elif trade_type != "FUTURES" and "-" in quote:
-        await update.message.reply_text(
-            "❌ Для SPOT/PERPETUAL не указывайте дату. Попробуйте еще раз:")
+    # Проверка формата пары для выбранного типа контракта
+    error = quick_commands.validate_pair(trade_pair, trade_type) \
+        or await unknown_pair(trade_pair, trade_type)
+    if error:
+        await update.message.reply_text(f"{error} Попробуйте еще раз:")
         return INPUT_TRADE_PAIR
     
     context.user_data["trade_pair"] = trade_pair
@@ -135,6 +159,18 @@ async def input_trade_pair(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return INPUT_TIMEFRAME
 
 
+async def unknown_pair(trade_pair: str, trade_type: str):
+    """Проверяет пару по таблице инструментов бирж до запросов свечей."""
+    # Таблица строится из каталогов бирж (после прогрева - из памяти)
+    try:
+        return await asyncio.to_thread(instruments.unknown_pair_message,
+                                       trade_pair, trade_type)
+    except Exception as e:
+        # Без каталогов пара проверяется уже при запросе свечей
+        logger.warning(f"Не удалось проверить пару {trade_pair}: {e}")
+        return None
+
+
 async def input_timeframe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обрабатывает выбор таймфрейма и запрашивает следующие данные."""
     query = update.callback_query
@@ -196,71 +232,401 @@ async def input_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return ConversationHandler.END
 
 
-async def run_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Запускает анализ и отправляет результаты пользователю."""
-    user_data = context.user_data
+async def vol_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Анализ последних свечей одной командой: /vol BTC/USDT spot 15 200."""
+    return await run_command(update, context, quick_commands.parse_vol)
+
+
+async def range_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Анализ диапазона времени одной командой /range."""
+    return await run_command(update, context, quick_commands.parse_range)
+
+
+async def run_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                      parse) -> int:
+    """Разбирает аргументы однострочной команды и сразу запускает анализ."""
+    try:
+        params = parse(context.args)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return ConversationHandler.END
+    error = await unknown_pair(params["trade_pair"], params["trade_type"])
+    if error:
+        await update.message.reply_text(error)
+        return ConversationHandler.END
+    await run_analysis(update, context, params)
+    # Команда прерывает незавершенный диалог /start
+    return ConversationHandler.END
+
+
+async def season_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Сезонность объема по истории хранилища: /season BTC/USDT spot 90."""
+    import Scripts.seasonality as seasonality
+    import Scripts.user_func as user_func
+    from Scripts.candle_codec import UnsupportedVersion
+
+    try:
+        params = quick_commands.parse_season(context.args)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return ConversationHandler.END
+    end = int(time.time() * 1000)
+    start = end - (params["days"] or seasonality.DAYS) * seasonality.DAY_MS
+    try:
+        result = await asyncio.to_thread(
+            seasonality.analyse, params["trade_type"], params["trade_pair"],
+            start, end)
+    except UnsupportedVersion as e:
+        # Архив записан до приведения объема к монетам
+        await update.message.reply_text(f"❌ {e}")
+        return ConversationHandler.END
+    if result is None:
+        await update.message.reply_text(
+            f"❌ В хранилище нет истории {params['trade_pair']} "
+            f"({params['trade_type']}). Загрузите ее командой:\n"
+            f"python -m Scripts.backfill --pair {params['trade_pair']} "
+            f"--type \"{params['trade_type']}\" --timeframe 60")
+        return ConversationHandler.END
+
     chat_id = update.effective_chat.id
-    
+    path, data = await asyncio.wrap_future(
+        user_func.submit_chart("seasonality", result))
+    await send_chart(context.bot, chat_id, path, data)
+    await context.bot.send_message(chat_id, seasonality.format_summary(result))
+    # Команда прерывает незавершенный диалог /start
+    return ConversationHandler.END
+
+
+async def recent_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает недавние запуски кнопками повторного анализа."""
+    recent = quick_commands.recent(context.user_data)
+    if not recent:
+        await update.message.reply_text(
+            "Недавних запусков нет. Начните анализ: /start или\n"
+            + quick_commands.VOL_USAGE)
+        return
+    keyboard = [[InlineKeyboardButton(
+        f"🔁 {quick_commands.describe(params)}",
+        callback_data=quick_commands.encode_callback(params))]
+        for params in recent]
+    await update.message.reply_text(
+        "Недавние запуски:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def rerun(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повторяет анализ по кнопке с сохраненными параметрами."""
+    query = update.callback_query
+    params = quick_commands.decode_callback(query.data)
+    await query.answer(f"Запускаю: {quick_commands.describe(params)}")
+    await run_analysis(update, context, params)
+
+
+def rerun_markup(params):
+    """Кнопка повторного запуска анализа с теми же параметрами."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(
+        "🔁 Повторить", callback_data=quick_commands.encode_callback(params))]])
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-режим: @бот BTC/USDT spot 15 200 или выбор из недавних."""
+    query = update.inline_query
+    try:
+        found = [quick_commands.parse_query(query.query)]
+    except ValueError:
+        # Неполный запрос: недавние запуски с подходящей парой
+        found = quick_commands.recent(context.user_data, query.query)
+    results = [
+        InlineQueryResultArticle(
+            id=str(i),
+            title=quick_commands.describe(params),
+            description=quick_commands.to_command(params),
+            input_message_content=InputTextMessageContent(
+                f"📊 Анализ объемов: {quick_commands.describe(params)}"),
+            reply_markup=rerun_markup(params))
+        for i, params in enumerate(found)]
+    # Результаты зависят от недавних запусков пользователя
+    await query.answer(results, cache_time=0, is_personal=True)
+
+
+async def run_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                       params: dict = None):
+    """Запускает анализ и отправляет результаты пользователю."""
+    user_data = params or quick_commands.analysis_params(context.user_data)
+    quick_commands.remember(context.user_data, user_data)
+    # Кнопка в сообщении inline-режима не привязана к чату:
+    # результаты уходят в личный чат с пользователем
+    chat = update.effective_chat
+    chat_id = chat.id if chat else update.effective_user.id
+
+    # Предел памяти процесса и бюджет памяти анализа
+    try:
+        memory.admit()
+        # Биржи пары берутся из таблицы инструментов, которая может
+        # обновляться запросом к биржам
+        user_data, note = await asyncio.to_thread(memory.fit_budget, user_data)
+    except memory.MemoryBudgetExceeded as e:
+        await context.bot.send_message(chat_id, str(e))
+        return
+    if note:
+        await context.bot.send_message(chat_id, note)
+
+    candles = await asyncio.to_thread(memory.estimate_candles, user_data)
+    metrics.add_gauge("analysis_queue_depth", 1)
+    try:
+        with log_context(job_id=uuid.uuid4().hex[:12],
+                         user_id=update.effective_user.id), \
+                memory.job(candles):
+            await run_analysis_job(update, context, chat_id, user_data)
+    finally:
+        metrics.add_gauge("analysis_queue_depth", -1)
+
+
+async def run_analysis_job(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                           chat_id, user_data):
+    """Выполняет анализ в контексте журнала задачи и сообщает об ошибках."""
+    try:
+        with metrics.span("run_analysis", mode=user_data["analysis_type"],
+                          pair=user_data["trade_pair"]):
+            await send_analysis(context, chat_id, user_data)
+        metrics.inc_counter("analysis_requests_total", result="ok")
+    except Exception as e:
+        metrics.inc_counter("analysis_requests_total", result="error")
+        # Обработка различных ошибок
+        error_msg = "❌ Ошибка анализа: "
+        if "не существует" in str(e):
+            error_msg += "неверная торговая пара"
+        elif "Cannot cut empty array" in str(e):
+            error_msg += "нет данных для указанного периода"
+        else:
+            error_msg += str(e)
+
+        await context.bot.send_message(chat_id, error_msg)
+        logger.error(f"Analysis error: {str(e)}", exc_info=True)
+
+
+def chart_caption(path):
+    """Подпись графика по имени файла без расширения и торговой пары."""
+    name = Path(path).stem
+    return next((text for prefix, text in CHART_CAPTIONS.items()
+                 if name.startswith(prefix)), "Результат анализа")
+
+
+def chart_photo(path, data, use_file_ids: bool = True):
+    """Возвращает file_id или файл для отправки и хеш содержимого графика."""
+    digest = file_id_cache.content_hash(data)
+    file_id = file_id_cache.get_file_id(digest) if use_file_ids else None
+    if file_id:
+        # Такой же график уже загружался: отправка по file_id без байтов
+        return file_id, digest
+    return InputFile(data, filename=Path(path).name), digest
+
+
+def remember_file_ids(messages, digests):
+    """Запоминает file_id загруженных фото."""
+    for message, digest in zip(messages, digests):
+        if message.photo:
+            # Самый крупный размер фото соответствует исходному файлу
+            file_id_cache.remember(digest, message.photo[-1].file_id)
+
+
+def build_chart_media(charts, use_file_ids: bool = True):
+    """Собирает альбом из графиков [(путь, содержимое)] с подписями."""
+    media, digests = [], []
+    # В альбоме Telegram не более 10 элементов
+    for path, data in charts[:MEDIA_GROUP_LIMIT]:
+        photo, digest = chart_photo(path, data, use_file_ids)
+        media.append(InputMediaPhoto(photo, caption=chart_caption(path)))
+        digests.append(digest)
+    return media, digests
+
+
+async def send_chart_media(bot, chat_id, charts):
+    """Отправляет графики одним альбомом и запоминает их file_id."""
+    media, digests = build_chart_media(charts)
+    if not media:
+        return
+    uploads = sum(1 for item in media if not isinstance(item.media, str))
+    try:
+        with metrics.span("telegram_upload", chart="media_group",
+                          count=len(media), uploads=uploads):
+            messages = await bot.send_media_group(chat_id, media)
+    except BadRequest:
+        if uploads == len(media):
+            raise
+        # Telegram отклонил сохраненный file_id: загружаем все файлы заново
+        for digest in digests:
+            file_id_cache.forget(digest)
+        media, digests = build_chart_media(charts, use_file_ids=False)
+        with metrics.span("telegram_upload", chart="media_group",
+                          count=len(media), uploads=len(media)):
+            messages = await bot.send_media_group(chat_id, media)
+    remember_file_ids(messages, digests)
+
+
+async def send_chart(bot, chat_id, path, data):
+    """Отправляет один график и запоминает его file_id."""
+    photo, digest = chart_photo(path, data)
+    caption = chart_caption(path)
     try:
-        # Уведомление о начале обработки
-        await context.bot.send_message(chat_id, "⏳ Запрашиваю данные с бирж...")
-        
-        # Выбор функции анализа по типу
+        with metrics.span("telegram_upload", chart=Path(path).stem,
+                          uploaded=not isinstance(photo, str)):
+            message = await bot.send_photo(chat_id, photo, caption=caption)
+    except BadRequest:
+        if not isinstance(photo, str):
+            raise
+        # Telegram отклонил сохраненный file_id: загружаем файл заново
+        file_id_cache.forget(digest)
+        photo, digest = chart_photo(path, data, use_file_ids=False)
+        with metrics.span("telegram_upload", chart=Path(path).stem,
+                          uploaded=True):
+            message = await bot.send_photo(chat_id, photo, caption=caption)
+    remember_file_ids([message], [digest])
+
+
+async def edit_status(status, text):
+    """Обновляет сообщение о ходе анализа, не прерывая отправку графиков."""
+    try:
+        await status.edit_text(text)
+    except TelegramError as e:
+        logger.warning(f"Не удалось обновить статус: {e}")
+
+
+async def stream_charts(bot, chat_id, status, futures, started):
+    """Отправляет каждый график сразу после рендера, обновляя статус."""
+    total = len(futures)
+    sent = 0
+
+    async def deliver(future):
+        nonlocal sent
+        path, data = await asyncio.wrap_future(future)
+        await send_chart(bot, chat_id, path, data)
+        sent += 1
+        if sent == 1:
+            metrics.observe("time_to_first_chart_seconds",
+                            time.perf_counter() - started)
+        await edit_status(status, f"📤 Отправлено графиков: {sent}/{total}")
+
+    # Графики рендерятся и загружаются параллельно; ошибка одного графика
+    # не отменяет отправку остальных
+    results = await asyncio.gather(*(deliver(future) for future in futures),
+                                   return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+
+
+async def send_analysis(context: ContextTypes.DEFAULT_TYPE, chat_id, user_data):
+    """Выполняет анализ и отправляет графики в чат по мере готовности."""
+    started = time.perf_counter()
+    # Уведомление о начале обработки
+    status = await context.bot.send_message(
+        chat_id, "⏳ Запрашиваю данные с бирж...")
+
+    # После прогрева модуль уже загружен, иначе импорт произойдет здесь
+    import Scripts.user_func as user_func
+
+    # Запросы к биржам и расчеты выполняются вне цикла событий
+    with metrics.span("analysis", mode=user_data["analysis_type"],
+                      pair=user_data["trade_pair"]):
         if user_data["analysis_type"] == "last_candles":
-            result = analys_based_on_trading_pair_timeframe_numbers_candles(
+            candles = await asyncio.to_thread(
+                user_func.fetch_candles_numbers_candles,
                 user_data["trade_pair"],
                 user_data["trade_type"],
                 user_data["timeframe"],
                 str(user_data["candles_count"]))
         else:
-            result = analys_based_on_trading_pair_timeframe_start_end(
+            candles = await asyncio.to_thread(
+                user_func.fetch_candles_start_end,
                 user_data["trade_pair"],
                 user_data["trade_type"],
                 user_data["timeframe"],
                 user_data["start_time"],
                 user_data["end_time"])
-        
-        # Проверка наличия результатов
-        if not result:
-            raise ValueError("Нет данных для отображения")
-        
-        # Подписи к графикам
-        captions = {
-            "volume_plot.png": "📊 Сравнение объемов",
-            "obv_plot.png": "📈 Индикатор OBV", 
-            "vwap_comparison.png": "📉 Сравнение VWAP",
-            "volume_pie_BTC-USDT.png": "🔢 Распределение объемов",
-            "volume_profile_comparison.png": "📌 Объемный профиль"
-        }
-        
-        # Отправка графиков
-        for img in result:
-            if img and Path(img).exists():
-                with open(img, 'rb') as photo:
-                    caption = captions.get(Path(img).name, "Результат анализа")
-                    await context.bot.send_photo(chat_id, photo, caption=caption)
-        
-        # Финальное сообщение с параметрами анализа
-        await context.bot.send_message(
-            chat_id,
-            f"✅ Анализ завершен!\n"
-            f"Пара: {user_data['trade_pair']}\n" 
-            f"Тип: {user_data['trade_type']}\n"
-            f"Таймфрейм: {user_data['timeframe']}m"
-        )
-    
-    except Exception as e:
-        # Обработка различных ошибок
-        error_msg = "❌ Ошибка анализа: "
-        if "не существует" in str(e):
-            error_msg += "неверная торговая пара"
-        elif "Cannot cut empty array" in str(e):
-            error_msg += "нет данных для указанного периода"
+
+        await edit_status(status, "⏳ Строю графики...")
+        report = {}
+        futures = await asyncio.to_thread(
+            user_func.render_analysis_charts, candles, user_data["trade_type"],
+            user_data["trade_pair"], user_data["timeframe"], report)
+
+        delivery = context.bot_data.get("config", {}).get("DELIVERY_MODE",
+                                                           "stream")
+        if delivery == "album":
+            # Все графики одним альбомом после окончания рендера
+            charts = [await asyncio.wrap_future(future)
+                      for future in futures.values()]
+            await send_chart_media(context.bot, chat_id, charts)
+            metrics.observe("time_to_first_chart_seconds",
+                            time.perf_counter() - started)
         else:
-            error_msg += str(e)
-        
-        await context.bot.send_message(chat_id, error_msg)
-        logger.error(f"Analysis error: {str(e)}")
+            # Сначала ставится в очередь круговая диаграмма: ей нужны
+            # только суммы объемов, поэтому она приходит первой
+            await stream_charts(context.bot, chat_id, status,
+                                list(futures.values()), started)
+
+    # Финальное сообщение с параметрами анализа
+    await context.bot.send_message(
+        chat_id,
+        f"✅ Анализ завершен!\n"
+        f"Пара: {user_data['trade_pair']}\n"
+        f"Тип: {user_data['trade_type']}\n"
+        f"Таймфрейм: {user_data['timeframe']}m"
+        + (f"\n\n{report['lead_lag']}" if report.get("lead_lag") else ""),
+        reply_markup=rerun_markup(user_data)
+    )
+    warmup.record_first_response()
+
+
+async def post_init(application) -> None:
+    """Запускает прогрев в фоне, не задерживая начало опроса Telegram."""
+    logger.info(
+        f"Импорт main.py: {time.perf_counter() - PROCESS_STARTED:.2f} с")
+    config = application.bot_data.get("config", {})
+    if config.get("WARMUP", True):
+        application.create_task(background_warm_up())
+    if config.get("API_PORT"):
+        # HTTP API работает в цикле событий бота и использует общие с ним
+        # кеш свечей и лимиты запросов к биржам
+        import Scripts.api as api
+        api.configure(config)
+        host = config.get("API_HOST", "127.0.0.1")
+        application.bot_data["api_runner"] = await api.start_server(
+            int(config["API_PORT"]), host)
+        logger.info(f"HTTP API запущен на {host}:{config['API_PORT']}")
+    if memory.LEAK_CHECK_SECONDS > 0:
+        # Периодическая проверка утечек памяти и датчики кешей
+        application.bot_data["memory_watch"] = application.create_task(
+            memory.watch(application.user_data))
+    if config.get("TRADE_STREAMS"):
+        # Потоки сделок для графиков CVD работают в цикле событий бота
+        from Scripts import trade_flow
+        trade_flow.configure(config)
+        application.bot_data["trade_streams"] = trade_flow.start_streams()
+        logger.info(f"Потоки сделок: {len(trade_flow.TRADE_STREAMS)} пар")
+
+
+async def post_shutdown(application) -> None:
+    """Останавливает HTTP API, потоки сделок и проверку памяти вместе с ботом."""
+    watch = application.bot_data.get("memory_watch")
+    if watch is not None:
+        watch.cancel()
+    runner = application.bot_data.get("api_runner")
+    if runner is not None:
+        await runner.cleanup()
+    streams = application.bot_data.get("trade_streams")
+    if streams:
+        from Scripts import trade_flow
+        await trade_flow.stop_streams(streams)
+
+
+async def background_warm_up() -> None:
+    """Выполняет прогрев в отдельном потоке и пишет длительности в журнал."""
+    timings = await asyncio.to_thread(warmup.warm_up)
+    details = ", ".join(f"{name}: {seconds:.2f} с"
+                        for name, seconds in timings.items())
+    logger.info(f"Прогрев завершен ({details}), "
+                f"с момента старта {time.perf_counter() - PROCESS_STARTED:.2f} с")
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -269,6 +635,52 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+def build_application(config: dict, base_url: str = None):
+    """Создает приложение бота с обработчиками (base_url - другой адрес Bot API)."""
+    builder = (ApplicationBuilder().token(config["BOT_TOKEN"])
+               .post_init(post_init).post_shutdown(post_shutdown)
+               # Число одновременно обрабатываемых обновлений (false -
+               # по одному, как раньше; true - до 256)
+               .concurrent_updates(config.get("CONCURRENT_UPDATES", False)))
+    if base_url:
+        # Локальный сервер Bot API (Benchmarks/bench_load.py)
+        builder = (builder.base_url(f"{base_url}/bot")
+                   .base_file_url(f"{base_url}/file/bot"))
+    app = builder.build()
+    app.bot_data["config"] = config
+    
+    # Настройка обработчика диалога
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            SELECT_ANALYSIS_TYPE: [CallbackQueryHandler(select_analysis_type)],
+            SELECT_TRADE_TYPE: [CallbackQueryHandler(select_trade_type)],
+            INPUT_TRADE_PAIR: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_trade_pair)],
+            INPUT_TIMEFRAME: [CallbackQueryHandler(input_timeframe)],
+            INPUT_CANDLES_COUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_candles_count)],
+            INPUT_START_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_start_time)],
+            INPUT_END_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_end_time)],
+        },
+        fallbacks=[CommandHandler("cancel", cancel),
+                   CommandHandler("vol", vol_command),
+                   CommandHandler("range", range_command),
+                   CommandHandler("season", season_command)],
+    )
+    
+    # Регистрация обработчиков. Кнопки повтора проверяются
+    # раньше диалога, иначе их перехватил бы выбор в текущем шаге диалога
+    app.add_handler(CallbackQueryHandler(
+        rerun, pattern=f"^{quick_commands.RERUN_PREFIX}"))
+    app.add_handler(conv_handler)
+    # Однострочные команды вне диалога
+    app.add_handler(CommandHandler("vol", vol_command))
+    app.add_handler(CommandHandler("range", range_command))
+    app.add_handler(CommandHandler("season", season_command))
+    app.add_handler(CommandHandler("recent", recent_command))
+    app.add_handler(InlineQueryHandler(inline_query))
+    return app
+
+
 def main():
     """Основная функция инициализации и запуска бота."""
     # Инициализация приложения бота
@@ -283,30 +695,36 @@ def main():
     with open(config_path, "r", encoding="utf-8") as f:
         config = json.load(f)
 
+    # Журналирование через очередь и фоновый поток записи
+    setup_logging(level=config.get("LOG_LEVEL", "INFO"))
+
     bot_token = config.get("BOT_TOKEN")
     if not bot_token:
         raise ValueError("Токен бота BOT_TOKEN не найден в config.json")
 
+    # Необязательные настройки метрик и журнала медленных запросов
+    if config.get("SLOW_REQUEST_SECONDS") is not None:
+        metrics.SLOW_REQUEST_SECONDS = float(config["SLOW_REQUEST_SECONDS"])
+    if config.get("METRICS_PORT"):
+        metrics.start_metrics_server(int(config["METRICS_PORT"]))
+
+    # Формат и качество изображений графиков
+    image_encoding.configure(config)
+    # Прореживание длинных рядов перед рендером графиков
+    downsample.configure(config)
+    # Окно сдвигов lead-lag анализа бирж
+    lead_lag.configure(config)
+    # Окно сезонности объема по умолчанию (модуль не загружает numpy)
+    from Scripts import seasonality
+    seasonality.configure(config)
+    # Кеш свечей и лимиты запросов к биржам (общие для бота и HTTP API)
+    candle_cache.configure(config)
+    rate_limit.configure(config)
+    # Бюджеты памяти и проверка утечек
+    memory.configure(config)
+
     # Инициализация приложения бота
-    app = ApplicationBuilder().token(bot_token).build()
-    
-    # Настройка обработчика диалога
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
-        states={
-            SELECT_ANALYSIS_TYPE: [CallbackQueryHandler(select_analysis_type)],
-            SELECT_TRADE_TYPE: [CallbackQueryHandler(select_trade_type)],
-            INPUT_TRADE_PAIR: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_trade_pair)],
-            INPUT_TIMEFRAME: [CallbackQueryHandler(input_timeframe)],
-            INPUT_CANDLES_COUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_candles_count)],
-            INPUT_START_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_start_time)],
-            INPUT_END_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_end_time)],
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
-    )
-    
-    # Регистрация обработчика и запуск бота
-    app.add_handler(conv_handler)
+    app = build_application(config)
     app.run_polling()
 
 